@@ -0,0 +1,192 @@
+# Vectorized tick -> Rich Candle engine (NumPy).
+# Replaces the per-candle / per-price pandas loops with a handful of array passes:
+#   sort -> bucket index -> reduceat (OHLCV, delta) -> unique + bincount (footprint)
+# Output shape is identical to the old pandas path (see benchmarks/bench_footprint_aggregation.py).
+import numpy as np
+from binning import price_bins, bin_label
+
+TIMEFRAME_SECONDS = {
+    "1m": 60, "3m": 180, "5m": 300, "15m": 900, "30m": 1800,
+    "1h": 3600, "4h": 14400, "1d": 86400
+}
+
+# Converts DB rows (epoch_seconds, price, quantity, is_sell) into column arrays.
+def rows_to_arrays(rows):
+    if not rows:
+        empty = np.empty(0, dtype=np.float64)
+        return empty, empty, empty, np.empty(0, dtype=bool)
+
+    times, prices, qtys, sides = zip(*rows)
+    return (
+        np.asarray(times, dtype=np.float64),
+        np.asarray(prices, dtype=np.float64),
+        np.asarray(qtys, dtype=np.float64),
+        np.asarray(sides, dtype=bool),
+    )
+
+# Aggregates tick arrays into Rich Candles (OHLCV + Delta + Footprint).
+# times: Unix seconds (float), is_sell: True = taker sold (buyer was maker).
+# bucket_seconds: candle width (60 = 1m, 86400 = 1d). Buckets are aligned to the epoch.
+# row_units: footprint row size in price units (binning.get_row_units), 1 = exact prices.
+def aggregate_ticks(times, prices, qtys, is_sell, bucket_seconds=60, row_units=1):
+    parts = _bucket_arrays(times, prices, qtys, is_sell, bucket_seconds, row_units)
+    if parts is None:
+        return []
+    bucket_ts, ohlcvd, uniq_bins, level_price, level_buy, level_sell, level_splits = parts
+
+    # 5. BUILD CANDLES (Python objects only for the final JSON shape)
+    # Every distinct row is formatted once, not once per candle/level.
+    price_labels = [bin_label(b, row_units) for b in uniq_bins.tolist()]
+
+    candles = []
+    for i, (ts, o, h, l, c, v, d, mx, mn) in enumerate(zip(bucket_ts, *ohlcvd)):
+        footprint_map = {}
+        for j in range(level_splits[i], level_splits[i + 1]):
+            footprint_map[price_labels[level_price[j]]] = {"buy": level_buy[j], "sell": level_sell[j]}
+
+        candles.append({
+            "time": ts, # Unix Seconds for Lightweight Charts
+            "open": o,
+            "high": h,
+            "low": l,
+            "close": c,
+            "volume": v,
+            "delta": d,
+            "max_delta": mx, # running delta extremes (orderflow.py)
+            "min_delta": mn,
+            "footprint": footprint_map
+        })
+
+    return candles
+
+# Array passes shared by aggregate_ticks and StreamingAggregator. Returns None for no ticks, else
+# (bucket times, (opens, highs, lows, closes, volumes, deltas, max deltas, min deltas), distinct price bins,
+#  per level: price bin index, buy, sell, and per bucket the level offsets), all as lists except the bins.
+def _bucket_arrays(times, prices, qtys, is_sell, bucket_seconds, row_units):
+    n = len(times)
+    if n == 0:
+        return None
+
+    times = np.asarray(times, dtype=np.float64)
+    prices = np.asarray(prices, dtype=np.float64)
+    qtys = np.asarray(qtys, dtype=np.float64)
+    is_sell = np.asarray(is_sell, dtype=bool)
+
+    # 1. SORT (DB rows are usually ordered already, so this is just a check)
+    if n > 1 and np.any(times[1:] < times[:-1]):
+        order = np.argsort(times, kind="stable")
+        times, prices, qtys, is_sell = times[order], prices[order], qtys[order], is_sell[order]
+
+    # 2. BUCKET INDEX
+    bucket_ts = (np.floor(times / bucket_seconds) * bucket_seconds).astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, bucket_ts[1:] != bucket_ts[:-1]])
+    ends = np.r_[starts[1:], n]
+    n_buckets = len(starts)
+    bucket_idx = np.repeat(np.arange(n_buckets), ends - starts)
+
+    # 3. OHLCV + DELTA (one reduceat per column)
+    buy_qty = np.where(is_sell, 0.0, qtys)
+    sell_qty = qtys - buy_qty
+
+    opens = prices[starts]
+    closes = prices[ends - 1]
+    highs = np.maximum.reduceat(prices, starts)
+    lows = np.minimum.reduceat(prices, starts)
+    volumes = np.add.reduceat(qtys, starts)
+    deltas = np.add.reduceat(buy_qty, starts) - np.add.reduceat(sell_qty, starts)
+
+    # Running delta inside each bucket (tick order): global cumsum minus the sum before the bucket
+    running = np.cumsum(buy_qty - sell_qty)
+    running -= np.repeat(running[starts] - (buy_qty - sell_qty)[starts], ends - starts)
+    max_deltas = np.maximum.reduceat(running, starts)
+    min_deltas = np.minimum.reduceat(running, starts)
+
+    # 4. FOOTPRINT (Price row x Side per bucket)
+    uniq_bins, price_idx = np.unique(price_bins(prices, row_units), return_inverse=True)
+    n_prices = len(uniq_bins)
+    level_keys = bucket_idx.astype(np.int64) * n_prices + price_idx
+    uniq_levels, level_idx = np.unique(level_keys, return_inverse=True)
+
+    level_buy = np.bincount(level_idx, weights=buy_qty, minlength=len(uniq_levels))
+    level_sell = np.bincount(level_idx, weights=sell_qty, minlength=len(uniq_levels))
+    level_bucket = uniq_levels // n_prices
+    level_price = uniq_levels % n_prices
+    level_splits = np.r_[0, np.searchsorted(level_bucket, np.arange(1, n_buckets)), len(uniq_levels)]
+
+    ohlcvd = (opens.tolist(), highs.tolist(), lows.tolist(), closes.tolist(), volumes.tolist(), deltas.tolist(),
+              max_deltas.tolist(), min_deltas.tolist())
+    return (bucket_ts[starts].tolist(), ohlcvd, uniq_bins, level_price.tolist(),
+            level_buy.tolist(), level_sell.tolist(), level_splits.tolist())
+
+# Incremental version of aggregate_ticks for ranges too large to hold as arrays:
+# feed time-ordered chunks with add(), then finish() returns the same candles aggregate_ticks would.
+# State is one entry per output candle (OHLCV + price bin -> [buy, sell]), independent of tick count.
+class StreamingAggregator:
+    def __init__(self, bucket_seconds=60, row_units=1):
+        self.bucket_seconds = bucket_seconds
+        self.row_units = row_units
+        self.buckets = {} # bucket time -> [open, high, low, close, volume, delta, max delta, min delta, {bin: [buy, sell]}]
+        self.ticks = 0
+
+    def add(self, times, prices, qtys, is_sell):
+        parts = _bucket_arrays(times, prices, qtys, is_sell, self.bucket_seconds, self.row_units)
+        if parts is None:
+            return
+        self.ticks += len(times)
+        bucket_ts, ohlcvd, uniq_bins, level_price, level_buy, level_sell, level_splits = parts
+        bins = uniq_bins.tolist()
+
+        for i, row in enumerate(zip(bucket_ts, *ohlcvd)):
+            fp = self._merge_bucket(*row)
+            for j in range(level_splits[i], level_splits[i + 1]):
+                self._merge_level(fp, bins[level_price[j]], level_buy[j], level_sell[j])
+
+    # Pre-grouped input (SQL aggregation in rollups.py), time-ordered like add():
+    # buckets: (time, open, high, low, close, volume, delta, max delta, min delta), levels: (time, price bin, buy, sell)
+    def add_grouped(self, buckets, levels):
+        fps = {}
+        for row in buckets:
+            fps[row[0]] = self._merge_bucket(*row)
+        for ts, b, buy, sell in levels:
+            self._merge_level(fps[ts], b, buy, sell)
+
+    def _merge_bucket(self, ts, o, h, l, c, v, d, mx, mn):
+        state = self.buckets.get(ts)
+        if state is None:
+            fp = {}
+            self.buckets[ts] = [o, h, l, c, v, d, mx, mn, fp]
+            return fp
+        # Bucket continues across the chunk boundary, the chunk's running delta starts at the bucket's
+        state[1] = max(state[1], h)
+        state[2] = min(state[2], l)
+        state[3] = c
+        state[4] += v
+        state[6] = max(state[6], state[5] + mx)
+        state[7] = min(state[7], state[5] + mn)
+        state[5] += d
+        return state[8]
+
+    def _merge_level(self, fp, b, buy, sell):
+        level = fp.get(b)
+        if level is None:
+            fp[b] = [buy, sell]
+        else:
+            level[0] += buy
+            level[1] += sell
+
+    def finish(self):
+        labels = {}
+        candles = []
+        for ts in sorted(self.buckets):
+            o, h, l, c, v, d, mx, mn, fp = self.buckets[ts]
+            footprint_map = {}
+            for b in sorted(fp):
+                label = labels.get(b)
+                if label is None:
+                    label = labels[b] = bin_label(b, self.row_units)
+                footprint_map[label] = {"buy": fp[b][0], "sell": fp[b][1]}
+            candles.append({
+                "time": ts, "open": o, "high": h, "low": l, "close": c,
+                "volume": v, "delta": d, "max_delta": mx, "min_delta": mn, "footprint": footprint_map
+            })
+        return candles
@@ -0,0 +1,296 @@
+# Cold tier for raw ticks past the DB retention horizon.
+# Before prune, every whole UTC day older than the horizon is exported to fixed-width column files:
+#   ARCHIVE_DIR/<SYMBOL>/<YYYY-MM-DD>/time.npy    float64 epoch seconds (sorted)
+#                                    price.npy   float64
+#                                    qty.npy     float64
+#                                    is_sell.npy bool
+#                                    trade_id.npy int64 aggTrade id, -1 = none (used when merging only)
+# Only days with ticks are written. ARCHIVE_DIR/state.json keeps the retention cutoff every day before which is
+# archived: a retention run only scans the DB from there, so the days drop_chunks leaves behind (chunks partly
+# past the horizon) are not read and rewritten again on every run. Ticks stored later for a day before that
+# cutoff (a backfill of old history) are merged into its files right after the backfill (merge_archived_days).
+# Days are read back with np.load(mmap_mode="r") and sliced with searchsorted, so a range read is a
+# view on the page cache, not a copy. rollups.iter_tick_chunks stitches archive days and DB ranges.
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+import numpy as np
+from database import get_db_connection, release_db_connection, prune_database
+from aggregation import rows_to_arrays
+from coverage_index import coverage
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "tick_archive")
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "1") == "1"
+ARCHIVE_OPEN_DAYS = int(os.getenv("ARCHIVE_OPEN_DAYS", "64"))   # memory-mapped days kept open
+ARCHIVE_FETCH_ROWS = 200_000
+
+DAY_S = 86400
+STATE_FILE = "state.json"
+COLUMNS = ("time", "price", "qty", "is_sell")
+NO_TRADE_ID = -1
+
+_open_days = OrderedDict() # (symbol, day_s) -> column arrays (LRU)
+_open_lock = threading.Lock()
+
+def day_floor(ts):
+    return int(ts // DAY_S) * DAY_S
+
+def day_name(day_s):
+    return datetime.fromtimestamp(day_s, tz=timezone.utc).strftime("%Y-%m-%d")
+
+def day_dir(symbol, day_s):
+    return os.path.join(ARCHIVE_DIR, symbol.upper(), day_name(day_s))
+
+def is_archived(symbol, day_s):
+    path = day_dir(symbol, day_s)
+    if os.path.isdir(path):
+        return True
+    # A rewrite (_write_day) interrupted between its two renames: the previous version is still complete
+    if os.path.isdir(path + ".old"):
+        os.replace(path + ".old", path)
+        return True
+    return False
+
+# Memory-mapped columns of one archived day (time, price, qty, is_sell)
+def open_day(symbol, day_s):
+    key = (symbol.upper(), day_s)
+    with _open_lock:
+        cols = _open_days.get(key)
+        if cols is not None:
+            _open_days.move_to_end(key)
+            return cols
+
+    path = day_dir(symbol, day_s)
+    cols = tuple(np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in COLUMNS)
+
+    with _open_lock:
+        _open_days[key] = cols
+        while len(_open_days) > ARCHIVE_OPEN_DAYS:
+            _open_days.popitem(last=False)
+    return cols
+
+# Ticks with start_s <= time < end_s from one archived day, as views on the mapped files
+def read_day_range(symbol, day_s, start_s, end_s):
+    times, prices, qtys, is_sell = open_day(symbol, day_s)
+    lo = int(np.searchsorted(times, start_s, side="left"))
+    hi = int(np.searchsorted(times, end_s, side="left"))
+    return times[lo:hi], prices[lo:hi], qtys[lo:hi], is_sell[lo:hi]
+
+# Splits [start_s, end_s) into ("archive", day_s, s, e) and ("db", None, s, e) parts, oldest first.
+# Consecutive non-archived days are merged into one DB range.
+def split_range(symbol, start_s, end_s):
+    parts = []
+    symbol_dir = os.path.join(ARCHIVE_DIR, symbol.upper())
+    if not os.path.isdir(symbol_dir):
+        return [("db", None, start_s, end_s)]
+
+    day = day_floor(start_s)
+    while day < end_s:
+        s, e = max(start_s, day), min(end_s, day + DAY_S)
+        if is_archived(symbol, day):
+            parts.append(("archive", day, s, e))
+        elif parts and parts[-1][0] == "db":
+            parts[-1] = ("db", None, parts[-1][2], e)
+        else:
+            parts.append(("db", None, s, e))
+        day += DAY_S
+    return parts
+
+# (time, price, qty, is_sell, trade_id) of one day in market_ticks
+def _query_day(cur, symbol, day_s):
+    cur.execute("""
+        SELECT EXTRACT(EPOCH FROM time)::double precision, price, quantity, is_buyer_maker, trade_id
+        FROM market_ticks
+        WHERE symbol = %s
+        AND time >= to_timestamp(%s) AND time < to_timestamp(%s)
+        ORDER BY time ASC
+    """, (symbol, day_s, day_s + DAY_S))
+    chunks = []
+    while True:
+        rows = cur.fetchmany(ARCHIVE_FETCH_ROWS)
+        if not rows:
+            break
+        ids = np.fromiter((NO_TRADE_ID if r[4] is None else r[4] for r in rows), dtype=np.int64, count=len(rows))
+        chunks.append(rows_to_arrays([r[:4] for r in rows]) + (ids,))
+    if not chunks:
+        return rows_to_arrays([]) + (np.empty(0, dtype=np.int64),)
+    return tuple(np.concatenate(cols) for cols in zip(*chunks))
+
+# Archived day as in-memory columns (time, price, qty, is_sell, trade_id), for a merge
+def _load_day(symbol, day_s):
+    path = day_dir(symbol, day_s)
+    cols = tuple(np.load(os.path.join(path, f"{name}.npy")) for name in COLUMNS)
+    ids_path = os.path.join(path, "trade_id.npy")
+    ids = np.load(ids_path) if os.path.exists(ids_path) else np.full(len(cols[0]), NO_TRADE_ID, dtype=np.int64)
+    return cols + (ids,)
+
+# DB rows of an archived day that the archive does not have yet: by trade id, or by identical values for
+# rows without one
+def _new_rows(archived, db):
+    known_ids = set(archived[4][archived[4] != NO_TRADE_ID].tolist())
+    known_values = None
+    keep = np.ones(len(db[0]), dtype=bool)
+    for i, tid in enumerate(db[4].tolist()):
+        if tid != NO_TRADE_ID:
+            keep[i] = tid not in known_ids
+            continue
+        if known_values is None:
+            known_values = set(zip(*(col.tolist() for col in archived[:4])))
+        keep[i] = (db[0][i], db[1][i], db[2][i], bool(db[3][i])) not in known_values
+    return tuple(col[keep] for col in db)
+
+# Exports one UTC day of ticks. Written to a temp directory and renamed, so a day is either complete or absent.
+# An archived day gets the DB rows it is missing merged in (rewritten the same way); days without ticks
+# are skipped.
+def archive_day(symbol, day_s, merge=False):
+    symbol = symbol.upper()
+    archived = is_archived(symbol, day_s)
+    if archived and not merge:
+        return True
+
+    conn = get_db_connection()
+    # Server-side cursor: the day arrives ARCHIVE_FETCH_ROWS rows at a time
+    cur = conn.cursor(name=f"archive_{symbol.lower()}_{day_s}")
+    try:
+        columns = _query_day(cur, symbol, day_s)
+        conn.commit()
+    except Exception as e:
+        print(f"Archive Read Error ({symbol} {day_name(day_s)}): {e}")
+        conn.rollback()
+        return False
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+    if archived:
+        try:
+            current = _load_day(symbol, day_s)
+        except (OSError, ValueError) as e:
+            print(f"Archive Read Error ({symbol} {day_name(day_s)}): {e}")
+            return False
+        added = _new_rows(current, columns)
+        if len(added[0]) == 0:
+            return True
+        merged = tuple(np.concatenate(pair) for pair in zip(current, added))
+        order = np.argsort(merged[0], kind="stable")
+        columns = tuple(col[order] for col in merged)
+        label = f"merged {len(added[0])} ticks into"
+    elif len(columns[0]) == 0:
+        return True
+    else:
+        label = "archived"
+
+    if not _write_day(symbol, day_s, columns):
+        return False
+    print(f"🗄️ {label.capitalize()} {symbol} {day_name(day_s)} ({len(columns[0])} ticks)")
+    return True
+
+def _write_day(symbol, day_s, columns):
+    final = day_dir(symbol, day_s)
+    tmp = final + ".tmp"
+    old = final + ".old"
+    try:
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name, arr in zip(COLUMNS + ("trade_id",), columns):
+            np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(arr))
+        # A directory cannot be replaced in one rename: the previous version steps aside first
+        if os.path.isdir(final):
+            shutil.rmtree(old, ignore_errors=True)
+            os.replace(final, old)
+        os.replace(tmp, final)
+        shutil.rmtree(old, ignore_errors=True)
+    except OSError as e:
+        print(f"Archive Write Error ({symbol} {day_name(day_s)}): {e}")
+        shutil.rmtree(tmp, ignore_errors=True)
+        if os.path.isdir(old) and not os.path.isdir(final):
+            os.replace(old, final)
+        return False
+
+    with _open_lock:
+        _open_days.pop((symbol, day_s), None)
+    return True
+
+# Retention cutoff (Unix s) every day before which is archived, None before the first complete run
+def archived_before():
+    try:
+        with open(os.path.join(ARCHIVE_DIR, STATE_FILE)) as f:
+            return int(json.load(f)["archived_before"])
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"⚠️ Ignoring unreadable archive state: {e}")
+        return None
+
+# Written to a temp file and renamed, a crash never leaves a half-written state
+def _save_archived_before(cutoff_s):
+    path = os.path.join(ARCHIVE_DIR, STATE_FILE)
+    try:
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"archived_before": int(cutoff_s)}, f)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        print(f"Archive State Error: {e}")
+
+# A backfill stored ticks in [start_s, end_s): archived days of that range take them in, and so do days before
+# the retention cutoff that had no ticks when it passed (no later retention run scans them)
+def merge_archived_days(symbol, start_s, end_s):
+    cutoff_s = archived_before()
+    ok = True
+    for day in range(day_floor(start_s), int(end_s), DAY_S):
+        if is_archived(symbol, day) or (cutoff_s is not None and day < cutoff_s):
+            ok = archive_day(symbol, day, merge=True) and ok
+    return ok
+
+# Archives every whole day before cutoff_s (a day boundary) that has ticks in the DB, from the previous run's
+# cutoff on (the whole table on the first run), merging into days archived before. Returns False if any day
+# failed (the caller must not prune then); the next run scans the same range again.
+def archive_ticks_before(cutoff_s):
+    since_s = archived_before()
+    if since_s is not None and since_s >= cutoff_s:
+        return True
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT DISTINCT symbol, EXTRACT(EPOCH FROM date_trunc('day', time AT TIME ZONE 'UTC'))::bigint
+            FROM market_ticks
+            WHERE time >= to_timestamp(%s) AND time < to_timestamp(%s)
+            ORDER BY 1, 2
+        """, (since_s or 0, cutoff_s))
+        days = cur.fetchall()
+    except Exception as e:
+        print(f"Archive Scan Error: {e}")
+        conn.rollback()
+        return False
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+    ok = True
+    for symbol, day in days:
+        ok = archive_day(symbol, int(day), merge=True) and ok
+    if ok:
+        _save_archived_before(cutoff_s)
+    return ok
+
+# Retention job: archive, then drop from the DB everything before the first kept day.
+# The horizon is aligned to a UTC day so archive days and DB ranges never overlap partially.
+def archive_and_prune(days_to_keep=7):
+    if not ARCHIVE_ENABLED:
+        prune_database(days_to_keep=days_to_keep)
+        # Those ticks are gone for good
+        coverage.trim_before(int((datetime.now(timezone.utc).timestamp() - days_to_keep * DAY_S) * 1000))
+        return
+
+    now_s = datetime.now(timezone.utc).timestamp()
+    cutoff_s = day_floor(now_s - days_to_keep * DAY_S)
+    if archive_ticks_before(cutoff_s):
+        prune_database(before_s=cutoff_s)
+    else:
+        print("⚠️ Archive incomplete, skipping prune (ticks stay in the DB)")
@@ -0,0 +1,193 @@
+# asyncio-native access to TimescaleDB for the API handlers (asyncpg).
+# The ingestor, the background writers and the backfill keep the blocking psycopg2 pool in database.py,
+# they run in their own threads. Handlers never borrow a psycopg2 connection or a threadpool slot.
+# asyncpg prepares each statement once per connection and keeps it in its statement cache,
+# so the handlers' fixed queries run as prepared statements.
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+import asyncpg
+import metrics
+from database import DB_HOST, DB_PORT, DB_USER, DB_PASS, DB_NAME
+
+ASYNC_DB_POOL_MIN = int(os.getenv("ASYNC_DB_POOL_MIN", "2"))
+ASYNC_DB_POOL_MAX = int(os.getenv("ASYNC_DB_POOL_MAX", "10"))
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "5"))      # seconds to wait for a free connection
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "30"))     # seconds per statement
+DB_HEALTH_INTERVAL = float(os.getenv("DB_HEALTH_INTERVAL", "15"))     # seconds between pool health checks
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "256"))      # prepared statements per connection
+
+# Raised when no connection can be had (pool down, or none free within DB_ACQUIRE_TIMEOUT).
+# Handlers turn it into a 503.
+class DatabaseUnavailable(Exception):
+    pass
+
+# JSONB in and out as Python objects
+async def _init_connection(conn):
+    await conn.set_type_codec("jsonb", encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+
+class AsyncDatabase:
+    def __init__(self):
+        self.pool = None
+        self._connect_lock = None
+        self._health_task = None
+        self.healthy = False
+        self.last_health_ms = None
+        self.last_error = None
+
+        # Stats
+        self.acquisitions = 0
+        self.acquire_timeouts = 0
+        self.total_acquire_ms = 0.0
+        self.max_acquire_ms = 0.0
+        self.queries = 0
+        self.errors = 0
+
+    async def connect(self):
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self.pool is not None:
+                return True
+            try:
+                self.pool = await asyncpg.create_pool(
+                    host=DB_HOST, port=int(DB_PORT), user=DB_USER, password=DB_PASS, database=DB_NAME,
+                    min_size=ASYNC_DB_POOL_MIN, max_size=ASYNC_DB_POOL_MAX,
+                    command_timeout=DB_COMMAND_TIMEOUT, statement_cache_size=DB_STATEMENT_CACHE,
+                    init=_init_connection
+                )
+                self.healthy = True
+                print("Async DB Pool Created")
+                return True
+            except Exception as e:
+                print(f"Async DB Connection Error: {e}")
+                self.pool = None
+                self.healthy = False
+                self.last_error = str(e)
+                return False
+
+    async def close(self):
+        if self._health_task:
+            self._health_task.cancel()
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    def start_health_checks(self):
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _health_loop(self):
+        while True:
+            await self.check_health()
+            await asyncio.sleep(DB_HEALTH_INTERVAL)
+
+    # Round trip on a pooled connection. A pool that never came up is created again here.
+    async def check_health(self):
+        t0 = time.perf_counter()
+        try:
+            async with self.acquire() as conn:
+                await conn.fetchval("SELECT 1")
+            self.healthy = True
+            self.last_error = None
+        except Exception as e:
+            self.healthy = False
+            self.last_error = str(e)
+        self.last_health_ms = (time.perf_counter() - t0) * 1000
+        return self.healthy
+
+    @asynccontextmanager
+    async def acquire(self):
+        if self.pool is None and not await self.connect():
+            metrics.db_acquire_errors.inc("asyncpg")
+            raise DatabaseUnavailable("Async DB pool is not initialized (Database might be down)")
+
+        t0 = time.perf_counter()
+        try:
+            conn = await self.pool.acquire(timeout=DB_ACQUIRE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.acquire_timeouts += 1
+            metrics.db_acquire_errors.inc("asyncpg")
+            raise DatabaseUnavailable(f"No DB connection free within {DB_ACQUIRE_TIMEOUT}s")
+        except (OSError, asyncpg.PostgresError) as e:
+            self.errors += 1
+            metrics.db_acquire_errors.inc("asyncpg")
+            raise DatabaseUnavailable(str(e))
+
+        wait_ms = (time.perf_counter() - t0) * 1000
+        metrics.db_acquire_seconds.observe(wait_ms / 1000, "asyncpg")
+        self.acquisitions += 1
+        self.total_acquire_ms += wait_ms
+        self.max_acquire_ms = max(self.max_acquire_ms, wait_ms)
+        try:
+            yield conn
+        finally:
+            await self.pool.release(conn)
+
+    async def fetch(self, query, *args):
+        async with self.acquire() as conn:
+            self.queries += 1
+            try:
+                return await conn.fetch(query, *args)
+            except Exception:
+                self.errors += 1
+                raise
+
+    async def executemany(self, query, args):
+        async with self.acquire() as conn:
+            self.queries += 1
+            try:
+                await conn.executemany(query, args)
+            except Exception:
+                self.errors += 1
+                raise
+
+    # Server-side cursor: rows arrive chunk_rows at a time, the connection is held until the loop ends
+    async def iter_chunks(self, query, *args, chunk_rows=50000):
+        async with self.acquire() as conn:
+            self.queries += 1
+            try:
+                async with conn.transaction():
+                    cur = await conn.cursor(query, *args)
+                    while True:
+                        rows = await cur.fetch(chunk_rows)
+                        if not rows:
+                            break
+                        yield rows
+            except Exception:
+                self.errors += 1
+                raise
+
+    def stats(self):
+        pool = self.pool
+        return {
+            "healthy": self.healthy,
+            "pool_size": pool.get_size() if pool else 0,
+            "pool_idle": pool.get_idle_size() if pool else 0,
+            "pool_min": ASYNC_DB_POOL_MIN,
+            "pool_max": ASYNC_DB_POOL_MAX,
+            "acquisitions": self.acquisitions,
+            "acquire_timeouts": self.acquire_timeouts,
+            "avg_acquire_ms": round(self.total_acquire_ms / self.acquisitions, 3) if self.acquisitions else 0.0,
+            "max_acquire_ms": round(self.max_acquire_ms, 3),
+            "queries": self.queries,
+            "errors": self.errors,
+            "last_health_ms": round(self.last_health_ms, 3) if self.last_health_ms is not None else None,
+            "last_error": self.last_error,
+        }
+
+db = AsyncDatabase()
+
+def _collect_metrics():
+    stats = db.stats()
+    yield ("orderflow_db_pool_connections", "gauge", "Pooled DB connections by state", [
+        ({"pool": "asyncpg", "state": "in_use"}, stats["pool_size"] - stats["pool_idle"]),
+        ({"pool": "asyncpg", "state": "idle"}, stats["pool_idle"]),
+    ])
+    yield ("orderflow_db_pool_max", "gauge", "DB pool capacity", [({"pool": "asyncpg"}, stats["pool_max"])])
+    yield ("orderflow_db_healthy", "gauge", "Last asyncpg health check passed (1) or failed (0)",
+           [({"pool": "asyncpg"}, int(stats["healthy"]))])
+
+metrics.register_collector(_collect_metrics)
@@ -0,0 +1,312 @@
+# Parallel aggTrade backfill.
+# The time range is cut into segments (at most 1h, the widest startTime/endTime window aggTrades accepts).
+# BACKFILL_WORKERS threads fetch segments concurrently and page inside a segment with fromId.
+# Every request first takes its weight from a shared TokenBucket sized below the exchange's per-minute
+# weight limit; a 429/418 or a high X-MBX-USED-WEIGHT-1M pauses every worker.
+# Pages go through a bounded queue to one writer thread, so fetching overlaps the DB writes.
+# After each write the segment's last aggTrade id is checkpointed (BACKFILL_CHECKPOINT_DIR/<SYMBOL>.json),
+# an interrupted backfill picks its unfinished segments up on the next run.
+# Runs of the same symbol (history sync, restart recovery, /load-ticks) take turns: the checkpoint file
+# belongs to one run at a time.
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import requests
+
+BINANCE_REST_URL = os.getenv("BINANCE_REST_URL", "https://api.binance.com").rstrip("/")
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", "4"))
+BACKFILL_SEGMENT_MINUTES = min(int(os.getenv("BACKFILL_SEGMENT_MINUTES", "10")), 60)
+BACKFILL_PIPELINE_DEPTH = int(os.getenv("BACKFILL_PIPELINE_DEPTH", "16"))   # pages waiting for the writer
+BACKFILL_CHECKPOINT_DIR = os.getenv("BACKFILL_CHECKPOINT_DIR", "checkpoints")
+BACKFILL_MAX_RETRIES = int(os.getenv("BACKFILL_MAX_RETRIES", "5"))
+BACKFILL_TIMEOUT = float(os.getenv("BACKFILL_TIMEOUT", "10"))               # seconds per HTTP request
+
+# Exchange request weight limit per minute and the share of it the backfill may use
+WEIGHT_LIMIT_PER_MINUTE = int(os.getenv("BINANCE_WEIGHT_LIMIT", "6000"))
+BACKFILL_WEIGHT_SHARE = float(os.getenv("BACKFILL_WEIGHT_SHARE", "0.8"))
+AGG_TRADES_WEIGHT = int(os.getenv("AGG_TRADES_WEIGHT", "2"))
+PAGE_LIMIT = 1000
+
+# Thread-safe token bucket: `refill_per_sec` tokens per second, bursts up to `capacity`
+class TokenBucket:
+    def __init__(self, capacity, refill_per_sec):
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+        self.waited_s = 0.0
+
+    # Blocks until `weight` tokens are available and takes them
+    def acquire(self, weight=1):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_sec)
+                    self.updated = now
+                    if self.tokens >= weight:
+                        self.tokens -= weight
+                        return
+                    wait = (weight - self.tokens) / self.refill_per_sec
+                self.waited_s += wait
+            time.sleep(wait)
+
+    # Server told us to back off: nobody gets tokens for `seconds`
+    def pause(self, seconds):
+        with self.lock:
+            until = time.monotonic() + seconds
+            if until > self.paused_until:
+                self.paused_until = until
+                self.updated = until
+                self.tokens = 0
+
+# Shared by every backfill so concurrent symbols stay inside one weight budget.
+# Capacity = 10s worth of weight: any 60s window stays below the exchange limit.
+_budget = WEIGHT_LIMIT_PER_MINUTE * BACKFILL_WEIGHT_SHARE
+limiter = TokenBucket(capacity=_budget / 6, refill_per_sec=_budget / 60)
+
+class BackfillError(Exception):
+    pass
+
+# symbol -> lock held while a backfill of that symbol runs
+_symbol_locks = {}
+_symbol_locks_lock = threading.Lock()
+
+def symbol_lock(symbol):
+    with _symbol_locks_lock:
+        lock = _symbol_locks.get(symbol)
+        if lock is None:
+            lock = _symbol_locks[symbol] = threading.Lock()
+        return lock
+
+def checkpoint_path(symbol, checkpoint_dir=BACKFILL_CHECKPOINT_DIR):
+    return os.path.join(checkpoint_dir, f"{symbol.upper()}.json")
+
+# Segment: {"start": ms, "end": ms (exclusive), "last_id": last written aggTrade id or None, "done": bool}
+def split_segments(start_ms, end_ms, segment_minutes=BACKFILL_SEGMENT_MINUTES):
+    step = segment_minutes * 60_000
+    return [
+        {"start": s, "end": min(s + step, end_ms), "last_id": None, "done": False}
+        for s in range(int(start_ms), int(end_ms), step)
+    ]
+
+class BackfillEngine:
+    def __init__(self, symbol, save_fn, base_url=BINANCE_REST_URL, workers=BACKFILL_WORKERS,
+                 segment_minutes=BACKFILL_SEGMENT_MINUTES, rate_limiter=None,
+                 checkpoint_dir=BACKFILL_CHECKPOINT_DIR, pipeline_depth=BACKFILL_PIPELINE_DEPTH,
+                 on_segment_done=None):
+        self.symbol = symbol.upper()
+        self.save_fn = save_fn # Called with a list of tick tuples. Falsy return / exception = failed
+        self.on_segment_done = on_segment_done # Called with (symbol, start_ms, end_ms) once a segment is stored
+        self.base_url = base_url.rstrip("/")
+        self.workers = max(1, workers)
+        self.segment_minutes = segment_minutes
+        self.limiter = rate_limiter or limiter
+        self.checkpoint_dir = checkpoint_dir
+        self.pages = queue.Queue(maxsize=pipeline_depth)
+        self.segments = []
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._local = threading.local()
+
+        # Stats
+        self.requests = 0
+        self.throttled = 0
+        self.downloaded = 0
+        self.written = 0
+        self.errors = []
+
+    # Fetches [start_ms, end_ms) plus the unfinished segments of an interrupted run. Returns stats.
+    # Waits for a backfill of the same symbol that is still running.
+    def run(self, start_ms, end_ms):
+        with symbol_lock(self.symbol):
+            return self._run(start_ms, end_ms)
+
+    def _run(self, start_ms, end_ms):
+        t0 = time.perf_counter()
+        self.segments = self._load_checkpoint() + split_segments(start_ms, end_ms, self.segment_minutes)
+        pending = [i for i, seg in enumerate(self.segments) if not seg["done"]]
+        self._save_checkpoint()
+
+        writer = threading.Thread(target=self._write_loop, name=f"backfill-{self.symbol}-writer")
+        writer.daemon = True
+        writer.start()
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"backfill-{self.symbol}") as pool:
+            list(pool.map(self._fetch_segment_safe, pending))
+        self.pages.put(None)
+        writer.join()
+
+        if all(seg["done"] for seg in self.segments) and not self.errors:
+            self._clear_checkpoint()
+        else:
+            self._save_checkpoint()
+        return self.stats(time.perf_counter() - t0)
+
+    def stats(self, elapsed_s=0.0):
+        return {
+            "symbol": self.symbol,
+            "segments": len(self.segments),
+            "segments_done": sum(1 for seg in self.segments if seg["done"]),
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "ticks": self.written,
+            "seconds": round(elapsed_s, 3),
+            "errors": self.errors[:10],
+        }
+
+    def _fetch_segment_safe(self, i):
+        try:
+            self._fetch_segment(i)
+        except Exception as e:
+            self.errors.append(f"segment {i}: {e}")
+            print(f"⚠️ Backfill segment failed ({self.symbol}): {e}")
+
+    # First page by time window, the rest by fromId until a trade leaves the segment
+    def _fetch_segment(self, i):
+        seg = self.segments[i]
+        from_id = seg["last_id"] + 1 if seg["last_id"] is not None else None
+
+        while not self._stop.is_set():
+            if from_id is None:
+                params = {"symbol": self.symbol, "startTime": seg["start"], "endTime": seg["end"] - 1, "limit": PAGE_LIMIT}
+            else:
+                params = {"symbol": self.symbol, "fromId": from_id, "limit": PAGE_LIMIT}
+            trades = self._get("/api/v3/aggTrades", params)
+
+            ticks = []
+            last_id = from_id - 1 if from_id is not None else None
+            for t in trades:
+                t_val = int(t["T"])
+                if t_val >= seg["end"]:
+                    break
+                last_id = int(t["a"])
+                ticks.append((datetime.fromtimestamp(t_val / 1000.0), self.symbol, float(t["p"]), float(t["q"]), bool(t["m"]),
+                              last_id))
+
+            # Short page = nothing more in the window / at the head of the stream
+            done = len(trades) < PAGE_LIMIT or len(ticks) < len(trades)
+            with self.lock:
+                self.downloaded += len(ticks)
+            self.pages.put((i, ticks, last_id, done))
+            if done:
+                return
+            from_id = last_id + 1
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _get(self, path, params, weight=AGG_TRADES_WEIGHT):
+        url = self.base_url + path
+        for attempt in range(BACKFILL_MAX_RETRIES + 1):
+            self.limiter.acquire(weight)
+            try:
+                r = self._session().get(url, params=params, timeout=BACKFILL_TIMEOUT)
+            except requests.RequestException as e:
+                if attempt == BACKFILL_MAX_RETRIES:
+                    raise BackfillError(f"request failed: {e}")
+                time.sleep(min(2 ** attempt * 0.25, 5))
+                continue
+            with self.lock:
+                self.requests += 1
+
+            # 429 = slow down, 418 = IP banned for Retry-After seconds
+            if r.status_code in (429, 418):
+                self.throttled += 1
+                self.limiter.pause(float(r.headers.get("Retry-After", 60)))
+                continue
+            if r.status_code >= 500:
+                if attempt == BACKFILL_MAX_RETRIES:
+                    raise BackfillError(f"HTTP {r.status_code}")
+                time.sleep(min(2 ** attempt * 0.25, 5))
+                continue
+            if r.status_code != 200:
+                raise BackfillError(f"HTTP {r.status_code}: {r.text[:200]}")
+
+            # Other clients share the IP limit: stop before the exchange has to tell us
+            used = r.headers.get("X-MBX-USED-WEIGHT-1M")
+            if used and int(used) >= WEIGHT_LIMIT_PER_MINUTE * 0.95:
+                self.limiter.pause(60 - time.time() % 60)
+            return r.json()
+        raise BackfillError("rate limited, retries exhausted")
+
+    # Single consumer: writes pages in arrival order and advances the checkpoint after each write
+    def _write_loop(self):
+        while True:
+            item = self.pages.get()
+            if item is None:
+                return
+            i, ticks, last_id, done = item
+            if self._stop.is_set():
+                continue
+            if ticks and not self._save(ticks):
+                self.errors.append(f"segment {i}: write failed")
+                print(f"⚠️ Backfill write failed ({self.symbol}), stopping. Re-run to resume.")
+                self._stop.set()
+                continue
+
+            seg = self.segments[i]
+            if last_id is not None:
+                seg["last_id"] = last_id
+            seg["done"] = done
+            self.written += len(ticks)
+            self._save_checkpoint()
+            if done and self.on_segment_done:
+                self.on_segment_done(self.symbol, seg["start"], seg["end"])
+
+    def _save(self, ticks):
+        for attempt in range(3):
+            try:
+                if self.save_fn(ticks):
+                    return True
+            except Exception as e:
+                print(f"Backfill Save Error: {e}")
+            time.sleep(0.5 * (attempt + 1))
+        return False
+
+    def _load_checkpoint(self):
+        path = checkpoint_path(self.symbol, self.checkpoint_dir)
+        try:
+            with open(path) as f:
+                segments = [seg for seg in json.load(f)["segments"] if not seg["done"]]
+        except FileNotFoundError:
+            return []
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable checkpoint {path}: {e}")
+            return []
+        if segments:
+            print(f"   -> Resuming {len(segments)} unfinished backfill segments for {self.symbol}")
+        return segments
+
+    # Written to a temp file and renamed, a crash never leaves a half-written checkpoint
+    def _save_checkpoint(self):
+        path = checkpoint_path(self.symbol, self.checkpoint_dir)
+        try:
+            os.makedirs(self.checkpoint_dir, exist_ok=True)
+            tmp = path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"symbol": self.symbol, "segments": self.segments}, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"⚠️ Checkpoint Error: {e}")
+
+    def _clear_checkpoint(self):
+        try:
+            os.remove(checkpoint_path(self.symbol, self.checkpoint_dir))
+        except FileNotFoundError:
+            pass
+
+# Downloads aggTrades of symbol in [start_ms, end_ms) and hands them to save_fn in pages
+def backfill_agg_trades(symbol, start_ms, end_ms, save_fn, **kwargs):
+    return BackfillEngine(symbol, save_fn, **kwargs).run(start_ms, end_ms)
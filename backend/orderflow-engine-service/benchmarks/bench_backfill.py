@@ -0,0 +1,91 @@
+# Benchmark: aggTrade backfill throughput, one-request-at-a-time loop vs backfill.BackfillEngine.
+# Runs against benchmarks/fake_exchange.py (in-process, per-request latency) with a simulated DB write,
+# so it needs neither network nor a database.
+# Usage: python benchmarks/bench_backfill.py [--ticks 200000] [--hours 2] [--latency-ms 30] [--write-ms 20] [--workers 1 4 8]
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backfill import BackfillEngine, TokenBucket
+from fake_exchange import FakeExchange, start_fake_exchange
+
+SYMBOL = "BTCUSDT"
+
+class FakeDB:
+    def __init__(self, write_s):
+        self.write_s = write_s
+        self.rows = 0
+
+    def save(self, ticks):
+        time.sleep(self.write_s)
+        self.rows += len(ticks)
+        return True
+
+# The previous historical.fetch_binance_agg_trades loop: fetch a page, save it, sleep, repeat
+def sequential_backfill(base_url, start_ms, end_ms, save_fn):
+    session = requests.Session()
+    current = start_ms
+    while current < end_ms:
+        trades = session.get(f"{base_url}/api/v3/aggTrades",
+                             params={"symbol": SYMBOL, "startTime": current, "limit": 1000}).json()
+        if not trades:
+            current += 60000
+            continue
+        ticks = []
+        max_t = current
+        for t in trades:
+            t_val = int(t["T"])
+            if t_val >= end_ms:
+                max_t = t_val
+                break
+            ticks.append((datetime.fromtimestamp(t_val / 1000.0), SYMBOL, float(t["p"]), float(t["q"]), bool(t["m"])))
+            max_t = max(max_t, t_val)
+        if ticks:
+            save_fn(ticks)
+        current = max_t + 1 if max_t > current else current + 1000
+        time.sleep(0.02)
+
+def run(n_ticks, hours, latency_s, write_s, worker_counts):
+    end_ms = int(time.time() * 1000)
+    start_ms = end_ms - int(hours * 3_600_000)
+    exchange = FakeExchange(n_ticks, start_ms, hours * 3600, weight_limit=10**9, latency_s=latency_s)
+    server = start_fake_exchange(exchange)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    expected = exchange.count_between(start_ms, end_ms)
+
+    print(f"{expected} trades over {hours}h, latency {latency_s * 1000:.0f} ms/request, write {write_s * 1000:.0f} ms/page")
+    print(f"{'path':>14} {'seconds':>8} {'ticks/s':>10} {'requests':>9}  complete")
+
+    db = FakeDB(write_s)
+    t0 = time.perf_counter()
+    sequential_backfill(base_url, start_ms, end_ms, db.save)
+    elapsed = time.perf_counter() - t0
+    print(f"{'sequential':>14} {elapsed:>8.2f} {db.rows / elapsed:>10,.0f} {'-':>9}  {db.rows == expected}")
+
+    for workers in worker_counts:
+        db = FakeDB(write_s)
+        with tempfile.TemporaryDirectory() as checkpoints:
+            engine = BackfillEngine(SYMBOL, db.save, base_url=base_url, workers=workers,
+                                    rate_limiter=TokenBucket(10**9, 10**9), checkpoint_dir=checkpoints)
+            stats = engine.run(start_ms, end_ms)
+        print(f"{f'engine x{workers}':>14} {stats['seconds']:>8.2f} {db.rows / stats['seconds']:>10,.0f} "
+              f"{stats['requests']:>9}  {db.rows == expected}")
+
+    server.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ticks", type=int, default=200_000)
+    parser.add_argument("--hours", type=float, default=2)
+    parser.add_argument("--latency-ms", type=float, default=30)
+    parser.add_argument("--write-ms", type=float, default=20)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+    run(args.ticks, args.hours, args.latency_ms / 1000, args.write_ms / 1000, args.workers)
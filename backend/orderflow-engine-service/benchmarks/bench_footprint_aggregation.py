@@ -0,0 +1,91 @@
+# Benchmark: NumPy aggregation engine vs the original pandas path.
+# Usage: python benchmarks/bench_footprint_aggregation.py [--sizes 100000 1000000 10000000] [--timeframe 1m]
+# Needs pandas: pip install -r benchmarks/requirements.txt
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregation import aggregate_ticks
+from synthetic import generate_ticks
+
+TIMEFRAME_MAP = {
+    "1m": "1Min", "5m": "5Min",
+    "30m": "30Min","1d": "1D"
+}
+TIMEFRAME_SECONDS = { "1m": 60, "5m": 300, "30m": 1800, "1d": 86400 }
+
+# The original footprint.get_historical_footprints aggregation (pandas Grouper + nested groupby).
+def aggregate_ticks_pandas(df, timeframe="1m"):
+    df = df.set_index('time')
+    freq = TIMEFRAME_MAP.get(timeframe, "1Min")
+    grouped = df.groupby(pd.Grouper(freq=freq))
+
+    candles = []
+    for timestamp, group in grouped:
+        if group.empty: continue
+
+        buy_vol = group.loc[group['is_sell'] == False, 'quantity'].sum()
+        sell_vol = group.loc[group['is_sell'] == True, 'quantity'].sum()
+
+        footprint_map = {}
+        for price, p_group in group.groupby('price'):
+            p_buy = p_group.loc[p_group['is_sell'] == False, 'quantity'].sum()
+            p_sell = p_group.loc[p_group['is_sell'] == True, 'quantity'].sum()
+            footprint_map[f"{price:.8f}".rstrip('0').rstrip('.')] = {"buy": float(p_buy), "sell": float(p_sell)}
+
+        candles.append({
+            "time": int(timestamp.timestamp()),
+            "open": float(group['price'].iloc[0]),
+            "high": float(group['price'].max()),
+            "low": float(group['price'].min()),
+            "close": float(group['price'].iloc[-1]),
+            "volume": float(group['quantity'].sum()),
+            "delta": float(buy_vol - sell_vol),
+            "footprint": footprint_map
+        })
+    return candles
+
+# Same candles, same keys, same numbers (up to float summation order).
+def candles_match(a, b, tol=1e-6):
+    if len(a) != len(b): return False
+    for x, y in zip(a, b):
+        if x["time"] != y["time"] or x["footprint"].keys() != y["footprint"].keys():
+            return False
+        for k in ("open", "high", "low", "close", "volume", "delta"):
+            if abs(x[k] - y[k]) > tol: return False
+        for p, lvl in x["footprint"].items():
+            if abs(lvl["buy"] - y["footprint"][p]["buy"]) > tol or abs(lvl["sell"] - y["footprint"][p]["sell"]) > tol:
+                return False
+    return True
+
+def run(sizes, timeframe, duration_s):
+    print(f"{'rows':>10} {'candles':>8} {'pandas (s)':>12} {'numpy (s)':>10} {'speedup':>8}  match")
+    for n in sizes:
+        times, prices, qtys, is_sell = generate_ticks(n, duration_s=duration_s)
+        df = pd.DataFrame({
+            "time": pd.to_datetime(times, unit="s", utc=True),
+            "price": prices, "quantity": qtys, "is_sell": is_sell
+        })
+
+        t0 = time.perf_counter()
+        expected = aggregate_ticks_pandas(df, timeframe)
+        t_pandas = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        got = aggregate_ticks(times, prices, qtys, is_sell, TIMEFRAME_SECONDS[timeframe])
+        t_numpy = time.perf_counter() - t0
+
+        print(f"{n:>10} {len(got):>8} {t_pandas:>12.3f} {t_numpy:>10.3f} {t_pandas / t_numpy:>7.1f}x  {candles_match(expected, got)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000, 10_000_000])
+    parser.add_argument("--timeframe", default="1m", choices=list(TIMEFRAME_SECONDS))
+    parser.add_argument("--duration", type=int, default=3600, help="Seconds of market time covered by the ticks")
+    args = parser.parse_args()
+    run(args.sizes, args.timeframe, args.duration)
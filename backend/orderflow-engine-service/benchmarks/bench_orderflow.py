@@ -0,0 +1,111 @@
+# Benchmark: orderflow analytics (orderflow.py) throughput.
+#   live        CandleAggregator.process_tick ticks/s, every live timeframe's analytics read at --fps
+#               (the broadcaster's _live_header calls), vs recomputing the stats of the open 1m footprint
+#               from scratch on every read (what a client without server analytics does)
+#   history     aggregate_ticks (incl. running delta extremes) + annotate, candles/s per timeframe
+#   identity    live closed candles vs the history path: categorical stats must match exactly,
+#               deltas within float summation noise
+# Usage: python benchmarks/bench_orderflow.py [--rate 200] [--duration 3600] [--row-size 1] [--fps 10]
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregation import aggregate_ticks, TIMEFRAME_SECONDS
+from binning import set_row_size, get_row_units
+from orderflow import annotate, footprint_stats
+from processing import CandleAggregator
+from synthetic import generate_stream
+
+SYMBOL = "BENCHOFUSDT"
+DAY = 1_699_920_000
+
+def live(stream, fps, rescan):
+    times, prices, qtys, is_sell, _ = stream
+    closed = {}
+    agg = CandleAggregator(SYMBOL, on_close=lambda s, tf, c: closed.setdefault(tf, []).append(c))
+    row_units = agg.row_units
+    ticks = list(zip([datetime.fromtimestamp(t) for t in times.tolist()], prices.tolist(), qtys.tolist(),
+                     is_sell.tolist(), times.tolist()))
+
+    reads = 0
+    next_read = times[0]
+    t0 = time.perf_counter()
+    for ts, price, qty, sell, t in ticks:
+        agg.process_tick(ts, price, qty, sell)
+        if t >= next_read:
+            with agg.lock:
+                for tf in agg.timeframes:
+                    agg._live_header(tf)
+                    if rescan:
+                        fp = agg._live_levels(tf, agg.current_candle["footprint"].keys())
+                        footprint_stats(fp, row_units)
+            reads += 1
+            next_read = t + 1 / fps
+    elapsed = time.perf_counter() - t0
+    return closed, {"ticks_per_s": round(len(ticks) / elapsed), "us_per_tick": round(elapsed / len(ticks) * 1e6, 3),
+                    "reads": reads}
+
+def history(stream, timeframes, row_units):
+    times, prices, qtys, is_sell, _ = stream
+    out = {}
+    for tf in timeframes:
+        t0 = time.perf_counter()
+        candles = aggregate_ticks(times, prices, qtys, is_sell, TIMEFRAME_SECONDS[tf], row_units)
+        t1 = time.perf_counter()
+        annotate(candles, row_units, 0.0)
+        t2 = time.perf_counter()
+        out[tf] = {"candles": len(candles), "aggregate_ms": round((t1 - t0) * 1000, 2),
+                   "annotate_ms": round((t2 - t1) * 1000, 2),
+                   "annotate_candles_per_s": round(len(candles) / (t2 - t1)) if t2 > t1 else None}
+        out[tf]["_candles"] = candles
+    return out
+
+def identity(closed, hist):
+    report = {}
+    for tf, candles in closed.items():
+        by_time = {c["time"]: c for c in hist[tf]["_candles"]}
+        mismatched, max_diff = 0, 0.0
+        for c in candles:
+            h = by_time[c["time"]]
+            if any(c[k] != h[k] for k in ("poc", "imbalances", "stacked")):
+                mismatched += 1
+            max_diff = max(max_diff, *(abs(c[k] - h[k]) for k in ("delta", "max_delta", "min_delta", "cvd")))
+        report[tf] = {"candles": len(candles), "mismatched": mismatched, "max_delta_diff": max_diff}
+    return report
+
+def run(args):
+    set_row_size(SYMBOL, args.row_size)
+    stream = generate_stream(args.rate, args.duration, 1, args.volatility, args.burstiness, start_ts=DAY, seed=args.seed)
+    print(f"{len(stream[0]):,} ticks, row size {args.row_size}, analytics read at {args.fps} fps")
+
+    closed, incremental = live(stream, args.fps, rescan=False)
+    _, rescanned = live(stream, args.fps, rescan=True)
+    print(f"{'live':<12} {'ticks/s':>10} {'us/tick':>8}")
+    print(f"{'incremental':<12} {incremental['ticks_per_s']:>10,} {incremental['us_per_tick']:>8}")
+    print(f"{'rescan':<12} {rescanned['ticks_per_s']:>10,} {rescanned['us_per_tick']:>8}")
+
+    timeframes = [tf for tf in closed]
+    hist = history(stream, timeframes, get_row_units(SYMBOL))
+    print(f"\n{'tf':>4} {'candles':>8} {'aggregate ms':>13} {'annotate ms':>12} {'candles/s':>10}")
+    for tf in timeframes:
+        h = hist[tf]
+        print(f"{tf:>4} {h['candles']:>8} {h['aggregate_ms']:>13} {h['annotate_ms']:>12} {h['annotate_candles_per_s'] or '-':>10}")
+
+    print(f"\n{'tf':>4} {'closed':>7} {'mismatched':>11} {'max delta diff':>15}")
+    for tf, r in identity(closed, hist).items():
+        print(f"{tf:>4} {r['candles']:>7} {r['mismatched']:>11} {r['max_delta_diff']:>15.1e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=float, default=200, help="ticks/second")
+    parser.add_argument("--duration", type=float, default=3600, help="seconds of synthetic stream")
+    parser.add_argument("--row-size", type=float, default=1.0, help="footprint row size (price)")
+    parser.add_argument("--fps", type=float, default=10, help="analytics reads per second of feed time")
+    parser.add_argument("--volatility", type=float, default=2.0)
+    parser.add_argument("--burstiness", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=42)
+    run(parser.parse_args())
@@ -0,0 +1,84 @@
+# Benchmark: footprint aggregation in TimescaleDB (GROUP BY time_bucket, price row) vs streaming raw
+# ticks to Python, per timeframe. Also checks that both modes build the same candles.
+# Needs a reachable TimescaleDB (DB_HOST, DB_USER, ... as for the service).
+# Ticks are written under a throwaway symbol and deleted afterwards.
+# Usage: python benchmarks/bench_sql_aggregation.py [--ticks 1000000] [--days 2] [--timeframes 1m 5m 1h 1d]
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import get_db_connection, release_db_connection
+from historical import copy_ticks_to_db
+from rollups import aggregate_tick_range
+from synthetic import generate_ticks
+
+BENCH_SYMBOL = "BENCHSQLUSDT"
+LOAD_BATCH = 50_000
+
+def cleanup():
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM market_ticks WHERE symbol = %s", (BENCH_SYMBOL,))
+    conn.commit()
+    cur.close()
+    release_db_connection(conn)
+
+def load(n_ticks, start_ts, duration_s):
+    times, prices, qtys, is_sell = generate_ticks(n_ticks, duration_s=duration_s, start_ts=start_ts)
+    rows = [
+        (datetime.fromtimestamp(t, tz=timezone.utc), BENCH_SYMBOL, p, q, bool(s), i)
+        for i, (t, p, q, s) in enumerate(zip(times.tolist(), prices.tolist(), qtys.tolist(), is_sell.tolist()))
+    ]
+    for i in range(0, len(rows), LOAD_BATCH):
+        copy_ticks_to_db(rows[i:i + LOAD_BATCH])
+
+def max_diff(a, b):
+    if [c["time"] for c in a] != [c["time"] for c in b]:
+        return float("inf")
+    diff = 0.0
+    for x, y in zip(a, b):
+        if x["footprint"].keys() != y["footprint"].keys():
+            return float("inf")
+        for k in ("open", "high", "low", "close", "volume", "delta", "max_delta", "min_delta"):
+            diff = max(diff, abs(x[k] - y[k]))
+        for price, level in x["footprint"].items():
+            diff = max(diff, abs(level["buy"] - y["footprint"][price]["buy"]),
+                       abs(level["sell"] - y["footprint"][price]["sell"]))
+    return diff
+
+def timed(mode, timeframe, start_s, end_s):
+    t0 = time.perf_counter()
+    candles = aggregate_tick_range(BENCH_SYMBOL, timeframe, start_s, end_s, mode=mode)
+    return candles, time.perf_counter() - t0
+
+def run(n_ticks, days, timeframes):
+    duration_s = days * 86400
+    # Whole days inside the retention window, away from any archived day
+    start_s = (int(time.time()) // 86400 - days - 1) * 86400
+    end_s = start_s + duration_s
+
+    cleanup()
+    print(f"Loading {n_ticks:,} ticks over {days} days...")
+    load(n_ticks, start_s, duration_s)
+
+    print(f"{'tf':>4} {'candles':>8} {'python rows':>12} {'sql rows':>10} {'python s':>9} {'sql s':>7} {'speedup':>8} {'max diff':>9}")
+    for timeframe in timeframes:
+        py, py_s = timed("python", timeframe, start_s, end_s)
+        sql, sql_s = timed("sql", timeframe, start_s, end_s)
+        # Rows sent by the server: every tick vs one per candle plus one per footprint level
+        sql_rows = len(sql) + sum(len(c["footprint"]) for c in sql)
+        print(f"{timeframe:>4} {len(sql):>8} {n_ticks:>12,} {sql_rows:>10,} {py_s:>9.2f} {sql_s:>7.2f} "
+              f"{py_s / sql_s:>7.1f}x {max_diff(py, sql):>9.1e}")
+    cleanup()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ticks", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=2)
+    parser.add_argument("--timeframes", nargs="+", default=["1m", "5m", "1h", "1d"])
+    args = parser.parse_args()
+    run(args.ticks, args.days, args.timeframes)
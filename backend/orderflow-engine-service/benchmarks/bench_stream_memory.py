@@ -0,0 +1,113 @@
+# Benchmark: peak memory of a large lookback, fetchall + aggregate_ticks vs server-side cursor chunks
+# folded into StreamingAggregator.
+# Default: a simulated cursor returning psycopg2-shaped rows (tuples of Python floats/bools), no DB needed.
+# --db SYMBOL --days N: the real paths (rollups.load_tick_arrays vs rollups.aggregate_tick_range)
+# against market_ticks.
+# Peak memory is measured with tracemalloc (Python objects and NumPy buffers).
+# Usage: python benchmarks/bench_stream_memory.py [--ticks 2000000] [--chunk 50000] [--timeframe 1d]
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregation import aggregate_ticks, rows_to_arrays, StreamingAggregator, TIMEFRAME_SECONDS
+from synthetic import generate_ticks
+
+GEN_BLOCK = 100_000
+
+# Rows produced on demand, like a cursor reading from the server
+class SimulatedCursor:
+    def __init__(self, n_ticks, duration_s):
+        self.n_ticks = n_ticks
+        self.duration_s = duration_s
+        self.pos = 0
+        self.pending = []
+
+    def _block(self):
+        block = min(GEN_BLOCK, self.n_ticks - self.pos)
+        start_ts = 1_700_000_000 + self.duration_s * self.pos / self.n_ticks
+        times, prices, qtys, is_sell = generate_ticks(block, duration_s=self.duration_s * block / self.n_ticks,
+                                                      start_ts=start_ts, seed=self.pos)
+        self.pos += block
+        return list(zip(times.tolist(), prices.tolist(), qtys.tolist(), is_sell.tolist()))
+
+    def fetchmany(self, size):
+        while len(self.pending) < size and self.pos < self.n_ticks:
+            self.pending.extend(self._block())
+        rows, self.pending = self.pending[:size], self.pending[size:]
+        return rows
+
+    def fetchall(self):
+        rows = self.pending
+        while self.pos < self.n_ticks:
+            rows.extend(self._block())
+        self.pending = []
+        return rows
+
+def fetchall_path(cursor, bucket_s):
+    rows = cursor.fetchall()
+    return aggregate_ticks(*rows_to_arrays(rows), bucket_s)
+
+def stream_path(cursor, bucket_s, chunk):
+    agg = StreamingAggregator(bucket_s)
+    while True:
+        rows = cursor.fetchmany(chunk)
+        if not rows:
+            break
+        agg.add(*rows_to_arrays(rows))
+    return agg.finish()
+
+def measure(fn, *args):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    candles = fn(*args)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return candles, elapsed, peak / 1024 / 1024
+
+def report(name, candles, elapsed, peak_mb):
+    print(f"{name:>10} {len(candles):>8} {elapsed:>9.2f} {peak_mb:>12.1f}")
+
+def run_simulated(n_ticks, chunk, timeframe):
+    bucket_s = TIMEFRAME_SECONDS[timeframe]
+    duration_s = bucket_s * 60
+    print(f"{n_ticks:,} simulated ticks over 60 x {timeframe}, chunk {chunk:,}")
+    print(f"{'path':>10} {'candles':>8} {'seconds':>9} {'peak MiB':>12}")
+    report("fetchall", *measure(fetchall_path, SimulatedCursor(n_ticks, duration_s), bucket_s))
+    report("stream", *measure(stream_path, SimulatedCursor(n_ticks, duration_s), bucket_s, chunk))
+
+def run_db(symbol, days, chunk, timeframe):
+    import rollups
+    from aggregation import aggregate_ticks as full_aggregate
+    from binning import get_row_units
+
+    rollups.STREAM_CHUNK_ROWS = chunk
+    end_s = int(time.time())
+    start_s = end_s - days * 86400
+
+    def fetchall_db():
+        arrays = rollups.load_tick_arrays(symbol, start_s, end_s)
+        return full_aggregate(*arrays, TIMEFRAME_SECONDS[timeframe], get_row_units(symbol))
+
+    print(f"{symbol} last {days} days from market_ticks, chunk {chunk:,}")
+    print(f"{'path':>10} {'candles':>8} {'seconds':>9} {'peak MiB':>12}")
+    # load_tick_arrays concatenates the chunks, so it holds the whole range like the old fetchall
+    report("arrays", *measure(fetchall_db))
+    report("stream", *measure(rollups.aggregate_tick_range, symbol, timeframe, start_s, end_s))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ticks", type=int, default=2_000_000)
+    parser.add_argument("--chunk", type=int, default=50_000)
+    parser.add_argument("--timeframe", default="1d", choices=sorted(TIMEFRAME_SECONDS))
+    parser.add_argument("--db", metavar="SYMBOL")
+    parser.add_argument("--days", type=int, default=7)
+    args = parser.parse_args()
+    if args.db:
+        run_db(args.db.upper(), args.days, args.chunk, args.timeframe)
+    else:
+        run_simulated(args.ticks, args.chunk, args.timeframe)
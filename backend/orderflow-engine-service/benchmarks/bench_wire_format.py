@@ -0,0 +1,44 @@
+# Benchmark: payload size and encode time of the binary candle layout (wire.py) vs JSON.
+# Candles carry the orderflow analytics, round-trip must be True.
+# Usage: python benchmarks/bench_wire_format.py [--candles 60 1000] [--ticks-per-candle 2000]
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregation import aggregate_ticks
+from orderflow import annotate
+from wire import encode_candles, decode_candles
+from synthetic import generate_ticks
+
+def best_of(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+def run(candle_counts, ticks_per_candle):
+    print(f"{'candles':>8} {'levels':>8} {'json KB':>9} {'binary KB':>10} {'ratio':>6} {'json ms':>8} {'binary ms':>10}  round-trip")
+    for n in candle_counts:
+        times, prices, qtys, is_sell = generate_ticks(n * ticks_per_candle, duration_s=n * 60, start_ts=1_700_000_040)
+        candles = annotate(aggregate_ticks(times, prices, qtys, is_sell, 60), 1)
+        levels = sum(len(c["footprint"]) for c in candles)
+
+        t_json, payload_json = best_of(lambda: json.dumps(candles).encode())
+        t_bin, payload_bin = best_of(lambda: encode_candles(candles))
+        decoded, _ = decode_candles(payload_bin)
+
+        print(f"{len(candles):>8} {levels:>8} {len(payload_json) / 1024:>9.1f} {len(payload_bin) / 1024:>10.1f} "
+              f"{len(payload_json) / len(payload_bin):>5.1f}x {t_json * 1000:>8.2f} {t_bin * 1000:>10.2f}  {decoded == candles}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--candles", type=int, nargs="+", default=[60, 1000])
+    parser.add_argument("--ticks-per-candle", type=int, default=2000)
+    args = parser.parse_args()
+    run(args.candles, args.ticks_per_candle)
@@ -0,0 +1,126 @@
+# Local stand-in for the Binance REST aggTrades endpoint, serving synthetic trades.
+# Point the service at it with BINANCE_REST_URL=http://127.0.0.1:<port>.
+#   GET /api/v3/aggTrades?symbol=&fromId=&startTime=&endTime=&limit=
+# Enforces a per-minute request weight limit (429 + Retry-After when exceeded) and reports
+# X-MBX-USED-WEIGHT-1M like the real exchange. --latency adds a delay per request.
+# Usage: python benchmarks/fake_exchange.py [--port 9100] [--ticks 1000000] [--hours 24] [--latency-ms 50]
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import generate_ticks
+
+class FakeExchange:
+    def __init__(self, n_ticks, start_ms, duration_s, weight_limit=6000, weight=2, latency_s=0.0, seed=42):
+        times, prices, qtys, is_sell = generate_ticks(n_ticks, duration_s=duration_s, start_ts=start_ms / 1000, seed=seed)
+        self.times_ms = np.floor(times * 1000).astype(np.int64)
+        self.prices = prices
+        self.qtys = qtys
+        self.is_sell = is_sell
+        self.weight_limit = weight_limit
+        self.weight = weight
+        self.latency_s = latency_s
+
+        self.lock = threading.Lock()
+        self.window = None
+        self.used = 0
+        self.requests = 0
+        self.rejected = 0
+
+    # Trade ids are the array positions
+    def count_between(self, start_ms, end_ms):
+        return int(np.searchsorted(self.times_ms, end_ms) - np.searchsorted(self.times_ms, start_ms))
+
+    # Returns (status, headers, body)
+    def agg_trades(self, params):
+        with self.lock:
+            minute = int(time.time() // 60)
+            if minute != self.window:
+                self.window, self.used = minute, 0
+            self.used += self.weight
+            self.requests += 1
+            used = self.used
+        headers = {"X-MBX-USED-WEIGHT-1M": str(used)}
+        if used > self.weight_limit:
+            self.rejected += 1
+            headers["Retry-After"] = str(60 - int(time.time() % 60))
+            return 429, headers, {"code": -1003, "msg": "Too many requests."}
+
+        if self.latency_s:
+            time.sleep(self.latency_s)
+
+        limit = min(int(params.get("limit", 500)), 1000)
+        if "fromId" in params:
+            lo = max(int(params["fromId"]), 0)
+            hi = min(lo + limit, len(self.times_ms))
+        elif "startTime" in params:
+            start = int(params["startTime"])
+            end = int(params.get("endTime", start + 3_600_000))
+            if end - start > 3_600_000:
+                return 400, headers, {"code": -1127, "msg": "More than 1 hours between startTime and endTime."}
+            lo = int(np.searchsorted(self.times_ms, start))
+            hi = min(int(np.searchsorted(self.times_ms, end, side="right")), lo + limit)
+        else:
+            hi = len(self.times_ms)
+            lo = max(hi - limit, 0)
+
+        body = [
+            {"a": i, "p": f"{self.prices[i]:.2f}", "q": f"{self.qtys[i]:.5f}", "f": i, "l": i,
+             "T": int(self.times_ms[i]), "m": bool(self.is_sell[i]), "M": True}
+            for i in range(lo, hi)
+        ]
+        return 200, headers, body
+
+def make_handler(exchange):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != "/api/v3/aggTrades":
+                status, headers, body = 404, {}, {"code": -1, "msg": "Not found"}
+            else:
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                status, headers, body = exchange.agg_trades(params)
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+    return Handler
+
+# Starts the server on a background thread. port=0 picks a free port (see server.server_address).
+def start_fake_exchange(exchange, host="127.0.0.1", port=0):
+    server = ThreadingHTTPServer((host, port), make_handler(exchange))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--ticks", type=int, default=1_000_000)
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--weight-limit", type=int, default=6000)
+    args = parser.parse_args()
+
+    end_ms = int(time.time() * 1000)
+    start_ms = end_ms - int(args.hours * 3_600_000)
+    exchange = FakeExchange(args.ticks, start_ms, args.hours * 3600, args.weight_limit, latency_s=args.latency_ms / 1000)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(exchange))
+    print(f"Fake exchange on http://127.0.0.1:{args.port} ({args.ticks} trades, last {args.hours}h)")
+    server.serve_forever()
@@ -0,0 +1,272 @@
+# Benchmark suite for the orderflow hot paths, driven by the synthetic stream generator (synthetic.py).
+# Every run writes one JSON document (parameters, environment, git commit, results) so two commits can
+# be compared with any JSON diff. Benchmarks:
+#   process_tick  CandleAggregator.process_tick throughput (all live timeframes, N symbols)
+#   aggregation   history aggregation latency by lookback (StreamingAggregator over STREAM_CHUNK_ROWS
+#                 chunks, the rollups.aggregate_tick_range path without the DB), limit=60 candles
+#   db_write      save_ticks_to_db / copy_ticks_to_db rows/s against the configured Postgres (--db)
+#   fanout        ConnectionManager fan-out with N in-process fake websocket clients:
+#                 enqueue (serialize + offer) and delivery (until every client got the frame)
+# Usage: python benchmarks/suite.py [--rate 200] [--duration 600] [--symbols 4] [--volatility 2] [--burstiness 1]
+#                                   [--only process_tick fanout] [--db] [--out results.json]
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregation import StreamingAggregator, TIMEFRAME_SECONDS
+from processing import CandleAggregator
+from synthetic import generate_stream, symbol_names
+
+BENCHMARKS = ("process_tick", "aggregation", "db_write", "fanout")
+DB_SYMBOL_PREFIX = "BENCHSUITE"
+
+def percentiles(samples_ms):
+    a = np.asarray(samples_ms)
+    return {
+        "p50_ms": round(float(np.percentile(a, 50)), 4),
+        "p95_ms": round(float(np.percentile(a, 95)), 4),
+        "p99_ms": round(float(np.percentile(a, 99)), 4),
+        "max_ms": round(float(a.max()), 4),
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return None
+
+# --- process_tick -------------------------------------------------
+def bench_process_tick(stream, symbols):
+    times, prices, qtys, is_sell, symbol_idx = stream
+    aggregators = [CandleAggregator(s) for s in symbols]
+    ticks = list(zip(
+        [datetime.fromtimestamp(t) for t in times.tolist()], prices.tolist(), qtys.tolist(),
+        is_sell.tolist(), symbol_idx.tolist()
+    ))
+
+    t0 = time.perf_counter()
+    for ts, price, qty, sell, i in ticks:
+        aggregators[i].process_tick(ts, price, qty, sell)
+    elapsed = time.perf_counter() - t0
+
+    return {
+        "ticks": len(ticks),
+        "seconds": round(elapsed, 4),
+        "ticks_per_s": round(len(ticks) / elapsed),
+        "us_per_tick": round(elapsed / len(ticks) * 1e6, 3),
+    }
+
+# --- aggregation ----------------------------------------------------
+def bench_aggregation(args, timeframes, limit=60, repeats=3):
+    from rollups import STREAM_CHUNK_ROWS
+
+    out = {}
+    for timeframe in timeframes:
+        lookback_s = TIMEFRAME_SECONDS[timeframe] * limit
+        # One symbol's share of the stream over the whole lookback, day-aligned so exactly `limit` candles
+        times, prices, qtys, is_sell, _ = generate_stream(
+            args.rate / args.symbols, lookback_s, 1, args.volatility, args.burstiness,
+            start_ts=1_699_920_000, seed=args.seed)
+
+        samples = []
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            agg = StreamingAggregator(TIMEFRAME_SECONDS[timeframe])
+            for i in range(0, len(times), STREAM_CHUNK_ROWS):
+                s = slice(i, i + STREAM_CHUNK_ROWS)
+                agg.add(times[s], prices[s], qtys[s], is_sell[s])
+            candles = agg.finish()
+            samples.append((time.perf_counter() - t0) * 1000)
+
+        out[timeframe] = {
+            "lookback_minutes": lookback_s // 60,
+            "ticks": len(times),
+            "candles": len(candles),
+            "best_ms": round(min(samples), 3),
+            "ticks_per_s": round(len(times) / (min(samples) / 1000)),
+        }
+    return out
+
+# --- db_write ---------------------------------------------------------
+def bench_db_write(stream, symbols, batch):
+    from database import get_db_connection, release_db_connection
+    from historical import save_ticks_to_db, copy_ticks_to_db
+
+    def cleanup():
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("DELETE FROM market_ticks WHERE symbol LIKE %s", (DB_SYMBOL_PREFIX + "%",))
+        conn.commit()
+        cur.close()
+        release_db_connection(conn)
+
+    try:
+        cleanup()
+    except Exception as e:
+        return {"skipped": f"database unavailable: {e}"}
+
+    times, prices, qtys, is_sell, symbol_idx = stream
+    names = [DB_SYMBOL_PREFIX + s for s in symbols]
+    rows = [
+        (datetime.fromtimestamp(t, tz=timezone.utc), names[i], p, q, bool(s), n)
+        for n, (t, p, q, s, i) in enumerate(zip(times.tolist(), prices.tolist(), qtys.tolist(), is_sell.tolist(),
+                                                symbol_idx.tolist()))
+    ]
+
+    out = {"rows": len(rows), "batch": batch}
+    for name, fn in (("save_ticks_to_db", save_ticks_to_db), ("copy_ticks_to_db", copy_ticks_to_db)):
+        cleanup()
+        t0 = time.perf_counter()
+        for i in range(0, len(rows), batch):
+            fn(rows[i:i + batch])
+        out[name] = {"rows_per_s": round(len(rows) / (time.perf_counter() - t0))}
+    cleanup()
+    return out
+
+# --- fanout -----------------------------------------------------------
+class FakeWebSocket:
+    def __init__(self, delivered):
+        self.delivered = delivered
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        self.delivered.tick()
+
+    async def send_bytes(self, data):
+        self.delivered.tick()
+
+class Delivered:
+    def __init__(self):
+        self.count = 0
+        self.target = 0
+        self.event = asyncio.Event()
+
+    def expect(self, n):
+        self.count = 0
+        self.target = n
+        self.event.clear()
+
+    def tick(self):
+        self.count += 1
+        if self.count >= self.target:
+            self.event.set()
+
+async def _fanout_round_trips(stream, n_clients, rounds, mode, format):
+    from connection_manager import ConnectionManager
+
+    times, prices, qtys, is_sell, _ = stream
+    manager = ConnectionManager()
+    delivered = Delivered()
+    symbol = "SYN0USDT"
+    for _ in range(n_clients):
+        await manager.connect(FakeWebSocket(delivered), symbol, mode, format)
+    await asyncio.sleep(0)
+
+    aggregator = CandleAggregator(symbol)
+    per_round = max(1, len(times) // rounds)
+    enqueue_ms, delivery_ms = [], []
+    for r in range(rounds):
+        s = slice(r * per_round, (r + 1) * per_round)
+        for ts, price, qty, sell in zip(times[s].tolist(), prices[s].tolist(), qtys[s].tolist(), is_sell[s].tolist()):
+            aggregator.process_tick(datetime.fromtimestamp(ts), price, qty, sell)
+
+        # Flush pass as in ConnectionManager._flush_loop, one frame per client expected
+        delivered.expect(n_clients)
+        t0 = time.perf_counter()
+        manager._send_frames(symbol, aggregator)
+        t1 = time.perf_counter()
+        await asyncio.wait_for(delivered.event.wait(), 30)
+        t2 = time.perf_counter()
+        # Delta clients also get snapshots on candle close: wait for the queues to settle
+        while any(c.queue.qsize() for c in manager.active_connections.values()):
+            await asyncio.sleep(0)
+        enqueue_ms.append((t1 - t0) * 1000)
+        delivery_ms.append((t2 - t0) * 1000)
+
+    for ws in list(manager.active_connections):
+        manager.disconnect(ws)
+    return {"enqueue": percentiles(enqueue_ms), "delivery": percentiles(delivery_ms)}
+
+def bench_fanout(stream, client_counts, rounds, mode, format):
+    out = {"mode": mode, "format": format, "rounds": rounds}
+    for n in client_counts:
+        out[str(n)] = asyncio.run(_fanout_round_trips(stream, n, rounds, mode, format))
+    return out
+
+# --- main -------------------------------------------------------------
+def run(args):
+    symbols = symbol_names(args.symbols)
+    stream = generate_stream(args.rate, args.duration, args.symbols, args.volatility, args.burstiness, seed=args.seed)
+    selected = args.only or [b for b in BENCHMARKS if b != "db_write" or args.db]
+
+    results = {}
+    for name in selected:
+        print(f"⏱️ {name}...")
+        t0 = time.perf_counter()
+        if name == "process_tick":
+            results[name] = bench_process_tick(stream, symbols)
+        elif name == "aggregation":
+            results[name] = bench_aggregation(args, args.timeframes)
+        elif name == "db_write":
+            results[name] = bench_db_write(stream, symbols, args.batch)
+        elif name == "fanout":
+            results[name] = bench_fanout(stream, args.clients, args.rounds, args.mode, args.format)
+        print(f"   done in {time.perf_counter() - t0:.1f}s")
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "params": {
+            "rate": args.rate, "duration": args.duration, "symbols": args.symbols,
+            "volatility": args.volatility, "burstiness": args.burstiness, "seed": args.seed,
+            "ticks": int(len(stream[0])),
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+        print(f"📄 Results written to {args.out}")
+    else:
+        print(text)
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=float, default=200, help="ticks/second over all symbols")
+    parser.add_argument("--duration", type=float, default=600, help="seconds of synthetic stream")
+    parser.add_argument("--symbols", type=int, default=4)
+    parser.add_argument("--volatility", type=float, default=2.0, help="price units per sqrt(second)")
+    parser.add_argument("--burstiness", type=float, default=1.0, help="1 = Poisson, >1 = clustered arrivals")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS)
+    parser.add_argument("--timeframes", nargs="+", default=["1m", "5m", "15m", "1h"],
+                        help="aggregation lookbacks: 60 candles of each timeframe")
+    parser.add_argument("--db", action="store_true", help="include db_write (needs the service's Postgres)")
+    parser.add_argument("--batch", type=int, default=500, help="db_write batch size (WRITER_BATCH_SIZE)")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--mode", default="full", choices=["full", "delta"])
+    parser.add_argument("--format", default="json", choices=["json", "binary"])
+    parser.add_argument("--out", help="JSON output file (default: stdout)")
+    run(parser.parse_args())
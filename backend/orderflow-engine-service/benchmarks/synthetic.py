@@ -0,0 +1,52 @@
+# Deterministic synthetic aggTrade generator for benchmarks.
+# Produces column arrays shaped like market_ticks rows: (epoch_seconds, price, quantity, is_sell)
+import numpy as np
+
+# n ticks spread evenly over `duration_s` seconds, random-walk price snapped to `tick_size`.
+def generate_ticks(n, duration_s=3600, start_ts=1_700_000_000, base_price=96000.0,
+                   tick_size=0.1, volatility=2.0, seed=42):
+    rng = np.random.default_rng(seed)
+
+    times = start_ts + np.sort(rng.uniform(0, duration_s, n))
+    steps = rng.normal(0, volatility, n) / np.sqrt(max(n / duration_s, 1))
+    prices = np.round((base_price + np.cumsum(steps)) / tick_size) * tick_size
+    qtys = np.round(rng.exponential(0.05, n), 5) + 0.00001
+    is_sell = rng.random(n) < 0.5
+
+    return times, prices, qtys, is_sell
+
+# Multi-symbol aggTrade stream for load tests, time-ordered across symbols.
+# rate: ticks/second over all symbols. burstiness: 1 = Poisson arrivals, > 1 = clustered
+# (gamma inter-arrival times with shape 1/burstiness, same mean rate), < 1 = more regular.
+# volatility: price units per sqrt(second), each symbol walks on its own.
+# Returns (times, prices, qtys, is_sell, symbol_idx) column arrays.
+def generate_stream(rate, duration_s, n_symbols=1, volatility=2.0, burstiness=1.0,
+                    start_ts=1_700_000_000, base_price=96000.0, tick_size=0.1, seed=42):
+    rng = np.random.default_rng(seed)
+    shape = 1.0 / burstiness
+
+    gaps = rng.gamma(shape, 1.0 / (rate * shape), int(rate * duration_s * 1.1) + 16)
+    offsets = np.cumsum(gaps)
+    while offsets[-1] < duration_s:
+        more = rng.gamma(shape, 1.0 / (rate * shape), len(gaps))
+        offsets = np.r_[offsets, offsets[-1] + np.cumsum(more)]
+    offsets = offsets[offsets < duration_s]
+    n = len(offsets)
+
+    times = start_ts + offsets
+    symbol_idx = rng.integers(0, n_symbols, n)
+    prices = np.empty(n)
+    for i in range(n_symbols):
+        mask = symbol_idx == i
+        t = times[mask]
+        dt = np.diff(t, prepend=t[0] if len(t) else 0.0)
+        steps = rng.normal(0, volatility, len(t)) * np.sqrt(dt)
+        base = base_price / (i + 1)
+        prices[mask] = np.round((base + np.cumsum(steps)) / tick_size) * tick_size
+    qtys = np.round(rng.exponential(0.05, n), 5) + 0.00001
+    is_sell = rng.random(n) < 0.5
+
+    return times, prices, qtys, is_sell, symbol_idx
+
+def symbol_names(n_symbols):
+    return [f"SYN{i}USDT" for i in range(n_symbols)]
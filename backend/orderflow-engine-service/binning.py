@@ -0,0 +1,54 @@
+# Price rows for footprints.
+# Prices are turned into exact fixed-point integers (10^-8 units) and floored to the symbol's row size:
+#   bin = round(price * 10^8) // row_units
+# Live (processing.py) and historical (aggregation.py) footprints use the same functions, so they match.
+# String keys are only produced when a candle is serialized (bin_label).
+import os
+import numpy as np
+
+PRICE_DECIMALS = 8
+PRICE_SCALE = 10 ** PRICE_DECIMALS
+
+# Per-symbol row size, e.g. ROW_SIZES="BTCUSDT:0.1,ETHUSDT:0.01"
+# Without a row size, rows are single price units: one level per exchange tick (exact prices).
+ROW_SIZES = {
+    k.strip().upper(): float(v)
+    for k, v in (item.split(":") for item in os.getenv("ROW_SIZES", "").split(",") if ":" in item)
+}
+DEFAULT_ROW_SIZE = float(os.getenv("DEFAULT_ROW_SIZE", "0"))
+
+_row_units = {}
+
+# Normalize price to string key to avoid floating point errors in JSON
+# e.g. 96000.0000001 -> "96000"
+def format_price_key(price):
+    return f"{price:.8f}".rstrip('0').rstrip('.')
+
+def size_to_units(size):
+    return max(1, int(round(size * PRICE_SCALE)))
+
+def set_row_size(symbol, size):
+    _row_units[symbol.upper()] = size_to_units(size)
+
+# Row size of symbol in price units (1 = exact prices)
+def get_row_units(symbol=None):
+    if symbol is None:
+        return size_to_units(DEFAULT_ROW_SIZE) if DEFAULT_ROW_SIZE > 0 else 1
+    symbol = symbol.upper()
+    units = _row_units.get(symbol)
+    if units is None:
+        size = ROW_SIZES.get(symbol, DEFAULT_ROW_SIZE)
+        units = size_to_units(size) if size > 0 else 1
+        _row_units[symbol] = units
+    return units
+
+def price_bin(price, row_units):
+    return int(round(price * PRICE_SCALE)) // row_units
+
+# Vectorized price_bin for NumPy arrays
+def price_bins(prices, row_units):
+    return np.rint(np.asarray(prices, dtype=np.float64) * PRICE_SCALE).astype(np.int64) // row_units
+
+# Lower edge of the row as a JSON key
+def bin_label(b, row_units):
+    return format_price_key(b * row_units / PRICE_SCALE)
@@ -1,25 +1,224 @@
 from fastapi import WebSocket
-from typing import List
+from typing import Dict, Optional
+import asyncio
+import json
+import os
+import threading
+import time
+from processing import registry, LIVE_TIMEFRAMES
+from wire import encode_candles, encode_frame, WireRangeError
+import metrics
+
+# Max frames per second sent to each client (updates in between are coalesced, latest wins)
+WS_MAX_FPS = float(os.getenv("WS_MAX_FPS", "10"))
+# Frames buffered per client. A slow client loses its oldest frames, never blocks the others.
+WS_CLIENT_QUEUE_SIZE = int(os.getenv("WS_CLIENT_QUEUE_SIZE", "8"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5.0"))
+
+STREAM_MODES = ("full", "delta")
+STREAM_FORMATS = ("json", "binary")
+
+# One connected chart: its own bounded outbound queue drained by its own sender task.
+# mode "full" = whole rich candle per frame (legacy), "delta" = snapshot + delta frames (see processing.py)
+# format "json" = text frames (default), "binary" = wire.py layout in binary frames
+class ClientChannel:
+    def __init__(self, websocket: WebSocket, symbol: Optional[str], mode: str = "full", format: str = "json",
+                 timeframe: str = "1m"):
+        self.websocket = websocket
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.mode = mode
+        self.format = format
+        self.queue = asyncio.Queue(maxsize=WS_CLIENT_QUEUE_SIZE)
+        self.task = None
+        self.dropped = 0
+
+    def wants(self, symbol):
+        return not self.symbol or not symbol or self.symbol == symbol
+
+    # Enqueue a pre-serialized frame (str or bytes); when full the oldest frame is dropped (latest wins)
+    def offer(self, payload):
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(payload)
 
 # allows to "Broadcast" messages from the ingestor to all open charts
+# Each client may subscribe to one symbol (None = every symbol, the legacy behaviour)
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        self.active_connections: Dict[WebSocket, ClientChannel] = {}
+        # symbol -> CandleAggregator with unsent changes, filled from the ingestor thread
+        self._pending: Dict[str, object] = {}
+        self._pending_lock = threading.Lock()
+        self._flush_task = None
+
+        # Stats
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.last_broadcast_ms = 0.0
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket, symbol: Optional[str] = None, mode: str = "full", format: str = "json",
+                      timeframe: str = "1m"):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        client = ClientChannel(
+            websocket, symbol.upper() if symbol else None,
+            mode if mode in STREAM_MODES else "full",
+            format if format in STREAM_FORMATS else "json",
+            timeframe if timeframe in LIVE_TIMEFRAMES else "1m"
+        )
+        client.task = asyncio.create_task(self._sender(client))
+        self.active_connections[websocket] = client
+        if client.mode == "delta":
+            self.resync(websocket)
+
+    # Queue a full snapshot (with the current seq) for a delta-mode client
+    def resync(self, websocket: WebSocket):
+        client = self.active_connections.get(websocket)
+        if not client or not client.symbol:
+            return
+        aggregator = registry.find(client.symbol)
+        frame = aggregator.subscribe_frame(client.timeframe) if aggregator else None
+        if frame:
+            client.offer(_binary_frame(frame) if client.format == "binary" else json.dumps(frame))
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        client = self.active_connections.pop(websocket, None)
+        if client:
+            self.frames_dropped += client.dropped
+            if client.task and client.task is not asyncio.current_task():
+                client.task.cancel()
+
+    # Thread-safe, cheap: only remembers that `symbol` has a new state.
+    # The aggregator is drained at most WS_MAX_FPS times per second.
+    def publish(self, symbol: str, aggregator):
+        with self._pending_lock:
+            self._pending[symbol] = aggregator
 
+    # Serialize once, hand the same text to every interested client
     async def broadcast(self, message: dict):
-        # Iterate copy of list to avoid issues if a client disconnects mid-loop
-        for connection in self.active_connections[:]:
-            try:
-                await connection.send_json(message)
-            except:
-                self.disconnect(connection)
+        self._fan_out(message.get("symbol"), json.dumps(message))
+
+    # Candles filled in by a background history sync (history_sync.py), for the clients of symbol/timeframe.
+    # Always a JSON text frame, also for binary-format clients.
+    def push_history(self, symbol: str, timeframe: str, candles: list):
+        text = json.dumps({"type": "history", "symbol": symbol, "timeframe": timeframe, "candles": candles})
+        for client in list(self.active_connections.values()):
+            if client.symbol == symbol and client.timeframe == timeframe:
+                client.offer(text)
+
+    def _fan_out(self, symbol, text):
+        for client in list(self.active_connections.values()):
+            if client.wants(symbol):
+                client.offer(text)
+
+    def start(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    # Coalescing loop: every 1/WS_MAX_FPS seconds send the latest state of each updated symbol
+    async def _flush_loop(self):
+        interval = 1.0 / WS_MAX_FPS
+        while True:
+            await asyncio.sleep(interval)
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                continue
+
+            t0 = time.perf_counter()
+            for symbol, aggregator in pending.items():
+                try:
+                    self._send_frames(symbol, aggregator)
+                except Exception as e:
+                    print(f"Broadcast Error ({symbol}): {e}")
+            elapsed = time.perf_counter() - t0
+            self.last_broadcast_ms = elapsed * 1000
+            metrics.broadcast_seconds.observe(elapsed)
+
+    # Each frame is serialized once per (timeframe, mode, format), no matter how many clients receive it
+    def _send_frames(self, symbol, aggregator):
+        frames_by_tf = aggregator.drain_frames()
+        if not frames_by_tf:
+            return
+
+        encoded = {}
+        for client in list(self.active_connections.values()):
+            if not client.wants(symbol):
+                continue
+            frames = frames_by_tf.get(client.timeframe)
+            if not frames:
+                continue
+            key = (client.timeframe, client.mode, client.format)
+            if key not in encoded:
+                encoded[key] = self._encode(frames, aggregator, client.timeframe, client.mode, client.format)
+            for payload in encoded[key]:
+                client.offer(payload)
+
+    def _encode(self, frames, aggregator, timeframe, mode, format):
+        if mode == "delta":
+            if format == "binary":
+                return [_binary_frame(f) for f in frames]
+            return [json.dumps(f) for f in frames]
+
+        messages = [self._full_message(f, aggregator, timeframe) for f in frames]
+        if format == "binary":
+            return [_binary_candle(m, timeframe) for m in messages]
+        return [json.dumps(m) for m in messages]
+
+    # Legacy frame: always the whole rich candle
+    def _full_message(self, frame, aggregator, timeframe):
+        if frame["type"] == "snapshot":
+            return frame["candle"]
+        return aggregator.snapshot(timeframe)
+
+    async def _sender(self, client: ClientChannel):
+        try:
+            while True:
+                payload = await client.queue.get()
+                if isinstance(payload, bytes):
+                    await asyncio.wait_for(client.websocket.send_bytes(payload), WS_SEND_TIMEOUT)
+                else:
+                    await asyncio.wait_for(client.websocket.send_text(payload), WS_SEND_TIMEOUT)
+                self.frames_sent += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # Dead or stuck client: drop it, the others are unaffected
+            self.disconnect(client.websocket)
+
+    def stats(self):
+        return {
+            "clients": len(self.active_connections),
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped + sum(c.dropped for c in self.active_connections.values()),
+            "last_broadcast_ms": round(self.last_broadcast_ms, 3),
+            "max_fps": WS_MAX_FPS,
+        }
+
+# Binary payloads, JSON text when the levels do not fit the packed layout (wire.WireRangeError)
+def _binary_frame(frame):
+    try:
+        return encode_frame(frame)
+    except WireRangeError:
+        return json.dumps(frame)
+
+def _binary_candle(candle, timeframe):
+    try:
+        return encode_candles([candle], symbol=candle.get("symbol", ""), timeframe=timeframe)
+    except WireRangeError:
+        return json.dumps(candle)
+
+manager = ConnectionManager()
+
+def _collect_metrics():
+    stats = manager.stats()
+    yield ("orderflow_ws_clients", "gauge", "Connected websocket clients", [({}, stats["clients"])])
+    yield ("orderflow_ws_frames_sent_total", "counter", "Frames sent to websocket clients", [({}, stats["frames_sent"])])
+    yield ("orderflow_ws_frames_dropped_total", "counter", "Frames dropped for slow websocket clients",
+           [({}, stats["frames_dropped"])])
 
-manager = ConnectionManager()
\ No newline at end of file
+metrics.register_collector(_collect_metrics)
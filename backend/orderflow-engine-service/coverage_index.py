@@ -0,0 +1,229 @@
+# Coverage index: per symbol, the time ranges (Unix ms, [start, end)) whose ticks are fully in the DB/archive.
+# Kept in memory, persisted to tick_coverage. Updated by
+#   - the live tick writer: the stream is continuous, so every persisted batch extends the range
+#     of the previous one until the stream reconnects or a batch is lost (break_live)
+#   - the backfill engine: every finished segment
+# Sync decisions (historical.sync_recent_history) ask gaps() instead of probing max(time),
+# so holes inside the window are found and only they are downloaded.
+import bisect
+import os
+import threading
+import time
+from database import get_db_connection, release_db_connection
+from psycopg2.extras import execute_values
+
+COVERAGE_TABLE = "tick_coverage"
+COVERAGE_FLUSH_INTERVAL = float(os.getenv("COVERAGE_FLUSH_INTERVAL", "10"))   # seconds between live persists
+
+# Sorted, disjoint [start, end) intervals. Touching/overlapping intervals are merged.
+class IntervalSet:
+    def __init__(self, intervals=None):
+        self.starts = []
+        self.ends = []
+        for start, end in intervals or []:
+            self.add(start, end)
+
+    def add(self, start, end):
+        if end <= start:
+            return
+        # Every interval that overlaps or touches [start, end)
+        i = bisect.bisect_left(self.ends, start)
+        j = bisect.bisect_right(self.starts, end)
+        if i < j:
+            start = min(start, self.starts[i])
+            end = max(end, self.ends[j - 1])
+        self.starts[i:j] = [start]
+        self.ends[i:j] = [end]
+
+    # Removes everything before t
+    def trim_before(self, t):
+        i = bisect.bisect_right(self.ends, t)
+        del self.starts[:i]
+        del self.ends[:i]
+        if self.starts and self.starts[0] < t:
+            self.starts[0] = t
+
+    # Missing parts of [start, end), oldest first
+    def gaps(self, start, end):
+        out = []
+        cur = start
+        i = bisect.bisect_right(self.ends, start)
+        while cur < end and i < len(self.starts):
+            if self.starts[i] >= end:
+                break
+            if self.starts[i] > cur:
+                out.append((cur, self.starts[i]))
+            cur = max(cur, self.ends[i])
+            i += 1
+        if cur < end:
+            out.append((cur, end))
+        return out
+
+    def covers(self, start, end):
+        return not self.gaps(start, end)
+
+    def latest(self):
+        return self.ends[-1] if self.ends else None
+
+    def earliest(self):
+        return self.starts[0] if self.starts else None
+
+    def intervals(self):
+        return list(zip(self.starts, self.ends))
+
+class CoverageIndex:
+    def __init__(self):
+        self.sets = {}          # symbol -> IntervalSet
+        self.live_edge = {}     # symbol -> end of the last persisted live batch (continuous stream)
+        self.dirty = set()
+        self.last_persist = 0.0
+        self.lock = threading.Lock()
+        self.persist_lock = threading.Lock()   # one persist at a time: an older snapshot never lands last
+
+    def _set(self, symbol):
+        s = self.sets.get(symbol)
+        if s is None:
+            s = self.sets[symbol] = IntervalSet()
+        return s
+
+    # A range is fully loaded (backfill segment, archive, ...)
+    def mark_loaded(self, symbol, start_ms, end_ms, persist=True):
+        symbol = symbol.upper()
+        with self.lock:
+            self._set(symbol).add(int(start_ms), int(end_ms))
+            self.dirty.add(symbol)
+        if persist:
+            self.persist()
+
+    # Live writer: a batch of the stream with ticks from first_ms to last_ms was persisted
+    def extend_live(self, symbol, first_ms, last_ms):
+        symbol = symbol.upper()
+        with self.lock:
+            edge = self.live_edge.get(symbol)
+            start = edge if edge is not None and edge <= first_ms else first_ms
+            self._set(symbol).add(int(start), int(last_ms) + 1)
+            self.live_edge[symbol] = int(last_ms) + 1
+            self.dirty.add(symbol)
+        if time.monotonic() - self.last_persist >= COVERAGE_FLUSH_INTERVAL:
+            self.persist(wait=False)
+
+    # Stream (re)connected or ticks were lost: the next live batch does not continue the previous one
+    def break_live(self, symbol=None):
+        with self.lock:
+            if symbol is None:
+                self.live_edge.clear()
+            else:
+                self.live_edge.pop(symbol.upper(), None)
+
+    def gaps(self, symbol, start_ms, end_ms):
+        with self.lock:
+            s = self.sets.get(symbol.upper())
+            return s.gaps(start_ms, end_ms) if s else [(start_ms, end_ms)]
+
+    # End of the newest covered range (ms) or None
+    def latest(self, symbol):
+        with self.lock:
+            s = self.sets.get(symbol.upper())
+            return s.latest() if s else None
+
+    # Start of the oldest covered range (ms) or None
+    def earliest(self, symbol):
+        with self.lock:
+            s = self.sets.get(symbol.upper())
+            return s.earliest() if s else None
+
+    def trim_before(self, cutoff_ms):
+        with self.lock:
+            for symbol, s in self.sets.items():
+                s.trim_before(cutoff_ms)
+                self.dirty.add(symbol)
+        self.persist()
+
+    # Loads every symbol's intervals (startup)
+    def load(self):
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute(f"""
+                SELECT symbol, (EXTRACT(EPOCH FROM start_time) * 1000)::bigint, (EXTRACT(EPOCH FROM end_time) * 1000)::bigint
+                FROM {COVERAGE_TABLE} ORDER BY symbol, start_time
+            """)
+            rows = cur.fetchall()
+        except Exception as e:
+            print(f"Coverage Read Error: {e}")
+            conn.rollback()
+            return
+        finally:
+            cur.close()
+            release_db_connection(conn)
+
+        with self.lock:
+            for symbol, start_ms, end_ms in rows:
+                self._set(symbol).add(start_ms, end_ms)
+        print(f"📚 Coverage index loaded ({len(rows)} ranges)")
+
+    # Rewrites the intervals of changed symbols (a handful of rows per symbol).
+    # Snapshot and write happen under persist_lock, so concurrent callers (writer threads, backfill, recovery)
+    # write their snapshots in the order they took them; a failed write marks its symbols dirty again.
+    # wait=False (live writer): returns False at once if another persist is running, the symbols stay dirty
+    def persist(self, wait=True):
+        if not self.persist_lock.acquire(blocking=wait):
+            return False
+        try:
+            return self._persist()
+        finally:
+            self.persist_lock.release()
+
+    def _persist(self):
+        with self.lock:
+            self.last_persist = time.monotonic()
+            if not self.dirty:
+                return True
+            changed = {symbol: self.sets[symbol].intervals() for symbol in self.dirty}
+            self.dirty = set()
+
+        conn = cur = None
+        try:
+            conn = get_db_connection()
+            cur = conn.cursor()
+            cur.execute(f"DELETE FROM {COVERAGE_TABLE} WHERE symbol = ANY(%s)", (list(changed),))
+            rows = [(symbol, s / 1000, e / 1000) for symbol, intervals in changed.items() for s, e in intervals]
+            if rows:
+                execute_values(cur, f"INSERT INTO {COVERAGE_TABLE} (symbol, start_time, end_time) VALUES %s",
+                               rows, template="(%s, to_timestamp(%s), to_timestamp(%s))")
+            conn.commit()
+            return True
+        except Exception as e:
+            print(f"Coverage Write Error: {e}")
+            if conn:
+                conn.rollback()
+            # Written again by the next persist (no connection, or the write failed)
+            with self.lock:
+                self.dirty |= set(changed)
+            return False
+        finally:
+            if cur:
+                cur.close()
+            release_db_connection(conn)
+
+def init_coverage_table():
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {COVERAGE_TABLE} (
+                symbol TEXT NOT NULL,
+                start_time TIMESTAMPTZ NOT NULL,
+                end_time TIMESTAMPTZ NOT NULL,
+                PRIMARY KEY (symbol, start_time)
+            );
+        """)
+        conn.commit()
+    except Exception as e:
+        print(f"Coverage Table Error: {e}")
+        conn.rollback()
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+coverage = CoverageIndex()
@@ -1,6 +1,10 @@
 import os 
+from datetime import datetime, timezone
 import psycopg2
 from psycopg2 import pool 
+import threading
+import time
+import metrics
 
 DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PORT = os.getenv("DB_PORT", "5432")
@@ -9,6 +13,8 @@ DB_PASS = os.getenv("DB_PASS", "password")
 DB_NAME = os.getenv("DB_NAME", "orderflow_db")
 
 db_pool = None
+_checked_out = 0 # connections handed out by get_db_connection and not yet released (metrics)
+_checked_out_lock = threading.Lock()
 
 def init_db_pool():
     global db_pool
@@ -39,31 +45,52 @@ def get_db_connection():
         init_db_pool()
     # 2. Check again
     if db_pool:
-        return db_pool.getconn()
+        t0 = time.perf_counter()
+        try:
+            conn = db_pool.getconn()
+        except pool.PoolError:
+            # Every connection is in use (ThreadedConnectionPool does not wait)
+            metrics.db_acquire_errors.inc("psycopg2")
+            raise
+        metrics.db_acquire_seconds.observe(time.perf_counter() - t0, "psycopg2")
+        _count_checkout(1)
+        return conn
     else:
+        metrics.db_acquire_errors.inc("psycopg2")
         # If it still fails, raise error so the caller knows to retry later
         raise Exception("DB Pool is not initialized (Database might be down)")
 
+def _count_checkout(n):
+    global _checked_out
+    with _checked_out_lock:
+        _checked_out += n
+
 def release_db_connection(conn):
     if db_pool and conn:
         try:
             db_pool.putconn(conn) # put away or return a connection to the pool
+            _count_checkout(-1)
         except Exception as e:
             print(f"⚠️ Error releasing connection: {e}")
         
 
 
-# Deletes data older than X days.
+# Deletes data older than X days (or older than before_s, Unix seconds, when given).
 # Uses TimescaleDB's optimized drop_chunks if available.
-def prune_database(days_to_keep=7):
+def prune_database(days_to_keep=7, before_s=None):
     conn = get_db_connection()
     try:
         cur = conn.cursor()
-        print(f"Pruning data older than {days_to_keep} days...")
+        if before_s is None:
+            print(f"Pruning data older than {days_to_keep} days...")
+            horizon = f"NOW() - INTERVAL '{days_to_keep} days'"
+        else:
+            print(f"Pruning data before {datetime.fromtimestamp(before_s, tz=timezone.utc)}...")
+            horizon = f"to_timestamp({float(before_s)})"
 
         # This drops entire file partitions (chunks) (TimescaleDB Native )
         try:
-            cur.execute(f"SELECT drop_chunks('market_ticks', INTERVAL '{days_to_keep} days');")
+            cur.execute(f"SELECT drop_chunks('market_ticks', older_than => {horizon});")
             print("Pruned using drop_chunks.")
         except Exception as e:
             # Fallback (Standard Postgres DELETE)
@@ -73,7 +100,7 @@ def prune_database(days_to_keep=7):
             
             cur.execute(f"""
                 DELETE FROM market_ticks 
-                WHERE time < NOW() - INTERVAL '{days_to_keep} days';
+                WHERE time < {horizon};
             """)
             print(f"Pruned using DELETE (Rows affected: {cur.rowcount})")
 
@@ -85,3 +112,13 @@ def prune_database(days_to_keep=7):
     finally:
         release_db_connection(conn)
 
+
+def _collect_metrics():
+    if db_pool is None:
+        return
+    # Counted at checkout/release: the pool's own bookkeeping is private to psycopg2
+    samples = [({"pool": "psycopg2", "state": "in_use"}, _checked_out)]
+    yield ("orderflow_db_pool_connections", "gauge", "Pooled DB connections by state", samples)
+    yield ("orderflow_db_pool_max", "gauge", "DB pool capacity", [({"pool": "psycopg2"}, db_pool.maxconn)])
+
+metrics.register_collector(_collect_metrics)
@@ -1,113 +1,230 @@
-import pandas as pd
-from datetime import datetime, timedelta
-from database import get_db_connection, release_db_connection
-from historical import sync_recent_history, get_latest_tick_time
-
-TIMEFRAME_MAP = {
-    "1m": "1Min", "5m": "5Min", 
-    "30m": "30Min","1d": "1D"
-}
-
-# 1. Checks DB for gaps.
-# 2. Downloads missing data if needed.
-# 3. Queries DB and aggregates ticks into Rich Candles (OHLCV + Delta + Footprint).
-def get_historical_footprints(symbol: str, timeframe: str = "1m", limit: int = 100):
-    # --- STEP 1: SMART SYNC ---
-    last_tick_ts = get_latest_tick_time(symbol) 
-    now_ms = int(datetime.now().timestamp() * 1000)
-    
-    tf_minutes_map = { "1m": 1, "3m": 3, "5m": 5, "15m": 15, "1h": 60, "4h": 240, "1d": 1440 }
-    base_minutes = tf_minutes_map.get(timeframe, 1)
-    
-    # Cap required download to 60 mins for performance speed (initial load)
-    # Background task can fill deeper history later
-    required_minutes = min(base_minutes * limit, 60)
-
-    if not last_tick_ts:
-        # DB Empty: Download
-        sync_recent_history(symbol, minutes=required_minutes)
+import base64
+from datetime import datetime
+from coverage_index import coverage
+from aggregation import TIMEFRAME_SECONDS
+from rollups import load_rollups, backfill_rollups, tick_delta
+from rollups import load_rollups_async, backfill_rollups_async, aggregate_tick_range_async, tick_delta_async
+from processing import registry, LIVE_TIMEFRAMES
+from hot_cache import hot_cache, HOT_CACHE_WARM_CANDLES
+from binning import get_row_units
+from orderflow import annotate, session_start
+import metrics
+
+# Seconds after a bucket closes before it is considered final and rolled up
+ROLLUP_SETTLE_SECONDS = 5
+
+# Session delta before a range start, (symbol, start_s) -> delta; only for fully covered sessions
+_cvd_bases = {}
+MAX_CVD_BASES = 4096
+
+# Latest `limit` candles (history_sync pushes them after a background sync). Runs on the asyncpg pool:
+# no psycopg2 connection or threadpool slot held while waiting on the DB
+async def get_historical_footprints_async(symbol: str, timeframe: str = "1m", limit: int = 100):
+    if timeframe not in TIMEFRAME_SECONDS: timeframe = "1m"
+    start_s, end_s = latest_window(TIMEFRAME_SECONDS[timeframe], limit, datetime.now().timestamp())
+    return await get_footprint_range_async(symbol, timeframe, start_s, end_s)
+
+# Candles of the bucket-aligned range [start_s, end_s): closed buckets from the hot tier or the rollup table,
+# the open bucket (when inside the range) from raw ticks
+async def get_footprint_range_async(symbol, timeframe, start_s, end_s):
+    with metrics.history_phase_seconds.time("hot"):
+        candles = get_hot_range(symbol, timeframe, start_s, end_s)
+    if candles is not None:
+        return candles
+
+    bucket_s = TIMEFRAME_SECONDS[timeframe]
+    now_s = datetime.now().timestamp()
+    _, settled_end = closed_window(bucket_s, 1, now_s)
+
+    closed = []
+    closed_end = min(end_s, settled_end)
+    if start_s < closed_end:
+        with metrics.history_phase_seconds.time("query"):
+            closed = await load_closed_candles_async(symbol, timeframe, start_s, closed_end)
+
+    candles = list(closed)
+    if end_s > settled_end:
+        with metrics.history_phase_seconds.time("aggregate"):
+            candles += await aggregate_tick_range_async(symbol, timeframe, max(start_s, settled_end), min(end_s, now_s + 1))
+
+    with metrics.history_phase_seconds.time("analytics"):
+        annotate(candles, get_row_units(symbol), await session_cvd_base_async(symbol, start_s))
+    if closed and not coverage.gaps(symbol, start_s * 1000, closed_end * 1000):
+        hot_cache.fill(symbol, timeframe, bucket_s, closed, start_s, closed_end)
+    return candles
+
+# Session CVD before start_s: net delta of the session's ticks up to there (0 at the session start).
+# Cached once the ticks of that part of the session are all stored.
+def session_cvd_base(symbol, start_s):
+    day = session_start(start_s)
+    if day == start_s:
+        return 0.0
+    base = _cvd_bases.get((symbol, start_s))
+    if base is None:
+        base = tick_delta(symbol, day, start_s)
+        _remember_cvd_base(symbol, day, start_s, base)
+    return base
+
+async def session_cvd_base_async(symbol, start_s):
+    day = session_start(start_s)
+    if day == start_s:
+        return 0.0
+    base = _cvd_bases.get((symbol, start_s))
+    if base is None:
+        base = await tick_delta_async(symbol, day, start_s)
+        _remember_cvd_base(symbol, day, start_s, base)
+    return base
+
+def _remember_cvd_base(symbol, day, start_s, base):
+    if coverage.gaps(symbol, day * 1000, start_s * 1000):
+        return
+    if len(_cvd_bases) >= MAX_CVD_BASES:
+        _cvd_bases.clear()
+    _cvd_bases[(symbol, start_s)] = base
+
+# --- PAGING (/history/footprint start, end, since, cursor) ---
+# Every range is whole buckets: start floored, end rounded up, so consecutive pages share an edge and never
+# overlap. A page holds at most `limit` candles; when a range is longer its newest part is served and
+# the cursor continues backward from the page start.
+
+def bucket_floor(t, bucket_s):
+    return int(t // bucket_s) * bucket_s
+
+def bucket_ceil(t, bucket_s):
+    return -int(-t // bucket_s) * bucket_s
+
+# The `limit` candles ending with the open bucket
+def latest_window(bucket_s, limit, now_s):
+    end_s = bucket_floor(now_s, bucket_s) + bucket_s
+    return end_s - bucket_s * limit, end_s
+
+# Opaque token for the page before end_s
+def encode_cursor(symbol, timeframe, end_s):
+    return base64.urlsafe_b64encode(f"{symbol}:{timeframe}:{end_s}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor, symbol, timeframe):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        c_symbol, c_timeframe, end_s = raw.split(":")
+        end_s = int(end_s)
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    if (c_symbol, c_timeframe) != (symbol, timeframe):
+        raise ValueError("Cursor belongs to another symbol/timeframe")
+    return end_s
+
+# (start_s, end_s) of the requested page. Raises ValueError on conflicting parameters.
+#   cursor:       the page before the previous one
+#   since:        from the bucket containing `since` (the client's last candle, re-sent as it may have changed)
+#   start / end:  explicit range (either may be omitted)
+#   nothing:      the latest `limit` candles
+def resolve_range(symbol, timeframe, limit, start=None, end=None, since=None, cursor=None):
+    bucket_s = TIMEFRAME_SECONDS[timeframe]
+    _, latest_end = latest_window(bucket_s, 1, datetime.now().timestamp())
+
+    if cursor is not None:
+        if start is not None or end is not None or since is not None:
+            raise ValueError("cursor cannot be combined with start, end or since")
+        end_s = decode_cursor(cursor, symbol, timeframe)
+        start_s = None
+    elif since is not None:
+        if start is not None or end is not None:
+            raise ValueError("since cannot be combined with start or end")
+        start_s, end_s = bucket_floor(since, bucket_s), latest_end
     else:
-        # DB has data: Check gap size
-        gap_seconds = (now_ms - last_tick_ts) / 1000
-        
-        # If gap is > 60 seconds, trigger a sync to catch up
-        if gap_seconds > 60:
-            missing_mins = int(gap_seconds / 60) + 1
-            download_mins = min(missing_mins, required_minutes)
-            sync_recent_history(symbol, minutes=download_mins)
-    
-    # --- STEP 2: QUERY DB ---
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    minutes_lookback = base_minutes * limit
-
-    query = f"""
-        SELECT time, price, quantity, is_buyer_maker
-        FROM market_ticks
-        WHERE symbol = %s
-        AND time > NOW() - INTERVAL '{minutes_lookback} minutes' 
-        ORDER BY time ASC
-    """
-    
-    cursor.execute(query, (symbol,))
-    rows = cursor.fetchall()
-    
-    cursor.close()
-    release_db_connection(conn)
-
-    if not rows: return []
-
-    # --- STEP 3: AGGREGATE ---
-    df = pd.DataFrame(rows, columns=["time", "price", "quantity", "is_sell"])
-    df['time'] = pd.to_datetime(df['time'])
-    df.set_index('time', inplace=True)
-    
-    # Resample to desired timeframe
-    freq = TIMEFRAME_MAP.get(timeframe, "1Min")
-    grouped = df.groupby(pd.Grouper(freq=freq))
-
-    candles = []
-
-    for timestamp, group in grouped:
-        if group.empty: continue
-            
-        open_ = group['price'].iloc[0]
-        close = group['price'].iloc[-1]
-        high = group['price'].max()
-        low = group['price'].min()
-        volume = group['quantity'].sum()
-
-        buy_vol = group.loc[group['is_sell'] == False, 'quantity'].sum()
-        sell_vol = group.loc[group['is_sell'] == True, 'quantity'].sum()
-        delta = buy_vol - sell_vol
-
-        # Build Footprint Map (Price -> {buy, sell})
-        price_groups = group.groupby('price')
-        footprint_map = {}
-
-        for price, p_group in price_groups:
-            p_buy = p_group.loc[p_group['is_sell'] == False, 'quantity'].sum()
-            p_sell = p_group.loc[p_group['is_sell'] == True, 'quantity'].sum()
-            
-            # Normalize price to string key to avoid floating point errors in JSON
-            # e.g. 96000.0000001 -> "96000"
-            price_key = f"{price:.8f}".rstrip('0').rstrip('.')
-            
-            footprint_map[price_key] = {
-                "buy": float(p_buy), 
-                "sell": float(p_sell)
-            }
-
-        candles.append({
-            "time": int(timestamp.timestamp()), # Unix Seconds for Lightweight Charts
-            "open": float(open_),
-            "high": float(high),
-            "low": float(low),
-            "close": float(close),
-            "volume": float(volume),
-            "delta": float(delta),
-            "footprint": footprint_map
-        })
-
-    return candles
\ No newline at end of file
+        start_s = bucket_floor(start, bucket_s) if start is not None else None
+        if end is not None:
+            end_s = bucket_ceil(end, bucket_s)
+        elif start_s is not None:
+            end_s = start_s + bucket_s * limit
+        else:
+            end_s = latest_end
+
+    end_s = min(end_s, latest_end)
+    if start_s is None or end_s - start_s > bucket_s * limit:
+        start_s = end_s - bucket_s * limit
+    return start_s, max(start_s, end_s)
+
+# Cursor for the page before start_s, None once nothing older was ever loaded
+def next_cursor(symbol, timeframe, start_s):
+    earliest = coverage.earliest(symbol)
+    if earliest is None or earliest >= start_s * 1000:
+        return None
+    return encode_cursor(symbol, timeframe, start_s)
+
+# Cap required download to 60 mins for performance speed (initial load)
+# Background task can fill deeper history later
+def sync_minutes(timeframe, limit):
+    base_minutes = TIMEFRAME_SECONDS.get(timeframe, 60) // 60
+    return min(base_minutes * limit, 60)
+
+# First bucket of a `limit` candle window ending with the open bucket, and the end of its settled part
+def closed_window(bucket_s, limit, now_s):
+    open_bucket = int(now_s // bucket_s) * bucket_s
+    window_start = open_bucket - bucket_s * (limit - 1)
+    # Buckets closed only a moment ago may still have ticks in flight (ingestor buffer)
+    settled_end = int((now_s - ROLLUP_SETTLE_SECONDS) // bucket_s) * bucket_s
+    return window_start, settled_end
+
+# Closed candles of [start_s, end_s) from the rollup table, building the missing ones from ticks
+def load_closed_candles(symbol, timeframe, start_s, end_s):
+    bucket_s = TIMEFRAME_SECONDS[timeframe]
+    candles = load_rollups(symbol, timeframe, start_s, end_s)
+
+    # Fill buckets that have no rollup yet (first request, ingestor downtime, ...)
+    have = {c["time"] for c in candles}
+    missing = [t for t in range(start_s, end_s, bucket_s) if t not in have]
+    if missing:
+        filled = backfill_rollups(symbol, timeframe, missing[0], missing[-1] + bucket_s, only_buckets=set(missing))
+        if filled:
+            candles = sorted(candles + filled, key=lambda c: c["time"])
+    return candles
+
+async def load_closed_candles_async(symbol, timeframe, start_s, end_s):
+    bucket_s = TIMEFRAME_SECONDS[timeframe]
+    candles = await load_rollups_async(symbol, timeframe, start_s, end_s)
+
+    have = {c["time"] for c in candles}
+    missing = [t for t in range(start_s, end_s, bucket_s) if t not in have]
+    if missing:
+        filled = await backfill_rollups_async(symbol, timeframe, missing[0], missing[-1] + bucket_s,
+                                              only_buckets=set(missing))
+        if filled:
+            candles = sorted(candles + filled, key=lambda c: c["time"])
+    return candles
+
+# Candles of [start_s, end_s) from RAM (hot tier + live candle), or None (miss)
+def get_hot_range(symbol, timeframe, start_s, end_s):
+    aggregator = registry.find(symbol)
+    live = aggregator.complete_snapshot(timeframe) if aggregator else None
+    if live is None or live["time"] < start_s:
+        hot_cache.miss()
+        return None
+
+    # Older page: closed buckets only
+    if live["time"] >= end_s:
+        return hot_cache.get(symbol, timeframe, start_s, end_s)
+
+    # Every closed bucket up to the live candle must be in RAM
+    closed = hot_cache.get(symbol, timeframe, start_s, live["time"])
+    if closed is None:
+        return None
+    live.pop("symbol", None)
+    return closed + [live]
+
+# Startup: loads the last HOT_CACHE_WARM_CANDLES closed candles of each live timeframe into RAM
+def warm_hot_cache(symbols, timeframes=LIVE_TIMEFRAMES):
+    now_s = datetime.now().timestamp()
+    for symbol in symbols:
+        for timeframe in timeframes:
+            bucket_s = TIMEFRAME_SECONDS[timeframe]
+            window_start, settled_end = closed_window(bucket_s, HOT_CACHE_WARM_CANDLES, now_s)
+            try:
+                candles = load_closed_candles(symbol, timeframe, window_start, settled_end)
+                annotate(candles, get_row_units(symbol), session_cvd_base(symbol, window_start))
+            except Exception as e:
+                print(f"⚠️ Hot cache warm-up failed ({symbol} {timeframe}): {e}")
+                continue
+            if not coverage.gaps(symbol, window_start * 1000, settled_end * 1000):
+                hot_cache.fill(symbol, timeframe, bucket_s, candles, window_start, settled_end)
+    print(f"🔥 Hot cache warm: {hot_cache.stats()['candles']} candles")
@@ -1,9 +1,12 @@
+import io
 import time
-import os
 from datetime import datetime
-from binance.client import Client
 from database import get_db_connection, release_db_connection
 from psycopg2.extras import execute_values
+from rollups import backfill_rollups
+from backfill import backfill_agg_trades
+from coverage_index import coverage
+import archive
 
 TIMEFRAME_MAP = {
     "1m": "1Min", "3m": "3Min", "5m": "5Min", 
@@ -11,89 +14,154 @@ TIMEFRAME_MAP = {
     "1h": "1H", "4h": "4H", "1d": "1D"
 }
 
-API_KEY = os.getenv("BINANCE_API_KEY")
-API_SECRET = os.getenv("BINANCE_API_SECRET")
-client = Client(API_KEY, API_SECRET)
+STAGING_TABLE = "market_ticks_staging"
+NULL_FIELD = "\\N" # COPY text format NULL
+# Uncovered time right before NOW that is not worth a download (live writer lag)
+SYNC_TOLERANCE_MS = 60_000
+
+# Ticks are (time, symbol, price, qty, is_sell, trade_id) tuples, trade_id = the exchange's aggTrade id.
+# market_ticks is unique on (symbol, trade_id, time) (time: TimescaleDB unique indexes must include it), so
+# writing the same trade twice is a no-op (ON CONFLICT DO NOTHING) no matter how batches are cut, while
+# distinct trades with equal time/price/qty/side are all kept.
+# Rows stored before trade ids existed have a NULL id and are never matched: re-fetching such a range
+# stores its trades again (prune or archive the old range instead).
+def init_tick_table():
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS market_ticks (
+                time TIMESTAMPTZ NOT NULL,
+                symbol TEXT NOT NULL,
+                price DOUBLE PRECISION,
+                quantity DOUBLE PRECISION,
+                is_buyer_maker BOOLEAN,
+                trade_id BIGINT
+            );
+        """)
+        cur.execute("ALTER TABLE market_ticks ADD COLUMN IF NOT EXISTS trade_id BIGINT;")
+        try:
+            cur.execute("SELECT create_hypertable('market_ticks', 'time', if_not_exists => TRUE);")
+        except Exception as e:
+            conn.rollback()
+            print(f"⚠️ Tick hypertable not created ({e}), using plain table")
+        cur.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS market_ticks_trade_id_idx
+            ON market_ticks (symbol, trade_id, time);
+        """)
+        conn.commit()
+    except Exception as e:
+        print(f"Tick Table Error: {e}")
+        conn.rollback()
+    finally:
+        cur.close()
+        release_db_connection(conn)
 
 #Bulk insert ticks into TimescaleDB.
+# Returns False if the insert failed (so the background writer can retry).
 def save_ticks_to_db(ticks):
-    if not ticks: return
+    if not ticks: return True
 
     conn = get_db_connection()
     cursor = conn.cursor()
-    # "ON CONFLICT DO NOTHING" ensures we don't crash on duplicates
+    # "ON CONFLICT DO NOTHING" skips trades already stored (unique trade id, see init_tick_table)
     query = """
-        INSERT INTO market_ticks (time, symbol, price, quantity, is_buyer_maker)
+        INSERT INTO market_ticks (time, symbol, price, quantity, is_buyer_maker, trade_id)
         VALUES %s
         ON CONFLICT DO NOTHING
     """
     try:
         execute_values(cursor, query, ticks)
         conn.commit()
+        return True
     except Exception as e:
         print(f"Insert Error: {e}")
         conn.rollback()
+        return False
     finally:
         cursor.close()
         release_db_connection(conn)
 
-# Finds the timestamp of the very last tick stored in the DB.
-def get_latest_tick_time(symbol):
+# High-throughput bulk load: COPY into a session temp table, then merge into market_ticks.
+# The merge skips trades already stored through the unique trade id index (ON CONFLICT).
+# Returns False if the load failed.
+def copy_ticks_to_db(ticks):
+    if not ticks: return True
+
+    buf = io.StringIO()
+    for ts, symbol, price, qty, is_sell, trade_id in ticks:
+        tid = NULL_FIELD if trade_id is None else trade_id
+        buf.write(f"{ts.isoformat()}\t{symbol}\t{price!r}\t{qty!r}\t{'t' if is_sell else 'f'}\t{tid}\n")
+    buf.seek(0)
+
     conn = get_db_connection()
-    cur = conn.cursor()
+    cursor = conn.cursor()
     try:
-        cur.execute("SELECT max(time) FROM market_ticks WHERE symbol = %s", (symbol,))
-        row = cur.fetchone()
-        if row and row[0]:
-            # Convert Postgres Timestamptz to Unix Milliseconds
-            return int(row[0].timestamp() * 1000)
+        # Temp table lives as long as the pooled connection, rows are cleared on commit
+        cursor.execute(f"""
+            CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} (
+                time TIMESTAMPTZ NOT NULL,
+                symbol TEXT NOT NULL,
+                price DOUBLE PRECISION,
+                quantity DOUBLE PRECISION,
+                is_buyer_maker BOOLEAN,
+                trade_id BIGINT
+            ) ON COMMIT DELETE ROWS
+        """)
+        cursor.copy_expert(
+            f"COPY {STAGING_TABLE} (time, symbol, price, quantity, is_buyer_maker, trade_id) FROM STDIN",
+            buf
+        )
+        cursor.execute(f"""
+            INSERT INTO market_ticks (time, symbol, price, quantity, is_buyer_maker, trade_id)
+            SELECT time, symbol, price, quantity, is_buyer_maker, trade_id
+            FROM {STAGING_TABLE}
+            ON CONFLICT DO NOTHING
+        """)
+        conn.commit()
+        return True
     except Exception as e:
-        print(f"DB Read Error (Table might not exist yet): {e}")
+        print(f"COPY Error: {e}")
         conn.rollback()
+        return False
     finally:
-        cur.close()
+        cursor.close()
         release_db_connection(conn)
-    return None
 
-# Determines smart start time.
-# If DB has recent data, resume from there.
-# If DB is empty or stale (>24h old), start fresh from 'minutes_back'.
-def get_safe_start_time(symbol, minutes_back):
+# Parts of the last `minutes` the coverage index does not know about (interior holes included), in ms
+def missing_ranges(symbol, minutes=30):
     now = int(time.time() * 1000)
-    target_start = now - (minutes_back * 60 * 1000)
-    
-    last_db_ts = get_latest_tick_time(symbol)
-    
-    # Case 1: DB Empty
-    if not last_db_ts:
-        return target_start
-        
-    # Case 2: DB Stale (Data is older than 24 hours)
-    # We ignore old data to avoid trying to backfill years of history
-    if last_db_ts < (now - 86400000):
-        print(f"⚠️ DB data is stale ({datetime.fromtimestamp(last_db_ts/1000)}). Skipping gap fill.")
-        return target_start
-
-    # Case 3: Good Data
-    print(f"   -> Resuming from {datetime.fromtimestamp(last_db_ts/1000)}")
-    return last_db_ts + 1
+    start_ts = now - (minutes * 60 * 1000)
+
+    gaps = coverage.gaps(symbol, start_ts, now)
+    # A live stream's coverage trails NOW by the writer's flush interval, that is not a gap
+    if gaps and gaps[-1][1] == now and gaps[-1][0] > start_ts and now - gaps[-1][0] < SYNC_TOLERANCE_MS:
+        gaps.pop()
+    return gaps
 
 # Blocking function to ensure data exists up to NOW.
+# Downloads only the missing ranges.
 def sync_recent_history(symbol, minutes=30):
     print(f"⚡ Instant Sync: Ensuring last {minutes} minutes for {symbol}...")
-    start_ts = get_safe_start_time(symbol, minutes)
-    
-    # Safety fallback
-    if not start_ts: 
-        start_ts = int(time.time() * 1000) - (minutes * 60000)
-    
-    fetch_binance_agg_trades(symbol, start_ts)
+    gaps = missing_ranges(symbol, minutes)
+    if not gaps:
+        print("   -> Data is up to date.")
+        return
+    for gap_start, gap_end in gaps:
+        fetch_binance_agg_trades(symbol, gap_start, gap_end)
+    coverage.persist()
 
 # Background task entry point
+# Downloads ticks, then builds the 1m rollups for the closed minutes of that range.
 def load_tick_history(symbol, minutes_back=60):
     sync_recent_history(symbol, minutes_back)
 
-# Fetches aggTrades in batches of 1000.
+    now_s = int(time.time())
+    end_s = (now_s // 60) * 60
+    backfill_rollups(symbol, "1m", end_s - minutes_back * 60, end_s)
+
+# Fetches aggTrades in [start_ts_ms, end_ts_ms) with the parallel backfill engine (backfill.py)
+# and COPYs them into market_ticks while the next pages download.
 def fetch_binance_agg_trades(symbol, start_ts_ms, end_ts_ms=None):
     current_start = int(start_ts_ms)
     limit_time = int(end_ts_ms) if end_ts_ms else int(time.time() * 1000)
@@ -102,64 +170,14 @@ def fetch_binance_agg_trades(symbol, start_ts_ms, end_ts_ms=None):
         print("   -> Data is up to date.")
         return
 
-    loop_count = 0
-    max_loops = 50000 
-    total_downloaded = 0
-
     print(f"   -> Fetching {symbol} from {datetime.fromtimestamp(current_start/1000)} to {datetime.fromtimestamp(limit_time/1000)}")
-
-    while current_start < limit_time and loop_count < max_loops:
-        loop_count += 1
-        try:
-            trades = client.get_aggregate_trades(symbol=symbol, startTime=current_start, limit=1000)
-            
-            if not trades:
-                print(f"      [!] No trades at {current_start}, jumping 1 min...")
-                current_start += 60000 
-                continue
-
-            processed_ticks = []
-            
-            # Initialize max_t to current_start.
-            # This prevents it from resetting to 0 if the loop is skipped or breaks early.
-            max_t = current_start
-
-            for t in trades:
-                t_val = int(t['T'])
-                
-                if t_val > limit_time: 
-                    max_t = t_val
-                    break 
-
-                p_val = float(t['p'])
-                q_val = float(t['q'])
-                is_sell = bool(t['m'])
-                ts_obj = datetime.fromtimestamp(t_val / 1000.0)
-                
-                processed_ticks.append((ts_obj, symbol, p_val, q_val, is_sell))
-                
-                # Track the latest time seen in this batch
-                if t_val > max_t:
-                    max_t = t_val
-
-            if processed_ticks:
-                save_ticks_to_db(processed_ticks)
-                total_downloaded += len(processed_ticks)
-
-            # Update pointer for next loop
-            if max_t > current_start:
-                 current_start = max_t + 1
-            else:
-                 # Force jump to avoid infinite loop if API returns stuck data
-                 current_start += 1000
-
-            if current_start >= limit_time:
-                break
-                
-            time.sleep(0.02) # Respect rate limits
-
-        except Exception as e:
-            print(f"⚠️ Fetch Warning: {e}")
-            time.sleep(1)
-            
-    print(f"✅ Sync Complete. Downloaded {total_downloaded} ticks.")
\ No newline at end of file
+    stats = backfill_agg_trades(symbol, current_start, limit_time, copy_ticks_to_db,
+                                on_segment_done=coverage.mark_loaded)
+
+    # Old history lands in the DB after its days were archived: those days take the new ticks in
+    # (also after a partial sync, the retention job no longer scans them)
+    archive.merge_archived_days(symbol, current_start / 1000, limit_time / 1000)
+    if stats["errors"]:
+        print(f"⚠️ Sync Incomplete ({stats['segments_done']}/{stats['segments']} segments). Re-run to resume: {stats['errors'][0]}")
+        return
+    print(f"✅ Sync Complete. Downloaded {stats['ticks']} ticks in {stats['seconds']}s ({stats['requests']} requests).")
@@ -0,0 +1,77 @@
+# Stale-while-revalidate for /history/footprint.
+# The endpoint answers with what the DB already has and calls schedule(); the catch-up download runs
+# in a worker thread. Requests for the same symbol and sync window while a job is in flight join it
+# instead of starting their own download. When the job finishes, every (timeframe, limit) requested
+# meanwhile is read again and pushed to that symbol's websocket clients:
+#   {"type": "history", "symbol", "timeframe", "candles": [...]}
+import asyncio
+from historical import sync_recent_history, missing_ranges
+from footprint import get_historical_footprints_async, sync_minutes
+from connection_manager import manager
+import metrics
+
+class SyncJob:
+    def __init__(self, symbol, minutes):
+        self.symbol = symbol
+        self.minutes = minutes
+        self.views = set() # (timeframe, limit) to push once synced
+        self.task = None
+
+# Lives on the event loop: schedule() is only called from async handlers, no locking needed
+class SyncScheduler:
+    def __init__(self):
+        self.jobs = {} # (symbol, minutes) -> SyncJob in flight
+
+        # Stats
+        self.started = 0
+        self.joined = 0
+        self.failed = 0
+
+    # Returns True if the window is being synced in the background (the response may be incomplete)
+    def schedule(self, symbol, timeframe, limit):
+        symbol = symbol.upper()
+        minutes = sync_minutes(timeframe, limit)
+        key = (symbol, minutes)
+
+        job = self.jobs.get(key)
+        if job is None:
+            if not missing_ranges(symbol, minutes):
+                return False
+            job = SyncJob(symbol, minutes)
+            self.jobs[key] = job
+            job.task = asyncio.create_task(self._run(key, job))
+            self.started += 1
+        else:
+            self.joined += 1
+        job.views.add((timeframe, limit))
+        return True
+
+    async def _run(self, key, job):
+        try:
+            with metrics.history_phase_seconds.time("sync"):
+                await asyncio.to_thread(sync_recent_history, job.symbol, job.minutes)
+        except Exception as e:
+            self.failed += 1
+            print(f"⚠️ Background sync failed ({job.symbol}): {e}")
+            return
+        finally:
+            # Requests from here on read the synced data directly
+            self.jobs.pop(key, None)
+
+        for timeframe, limit in job.views:
+            try:
+                candles = await get_historical_footprints_async(job.symbol, timeframe, limit)
+            except Exception as e:
+                print(f"⚠️ History push failed ({job.symbol} {timeframe}): {e}")
+                continue
+            manager.push_history(job.symbol, timeframe, candles)
+
+    def stats(self):
+        return {
+            "in_flight": len(self.jobs),
+            "started": self.started,
+            "joined": self.joined,
+            "failed": self.failed,
+        }
+
+scheduler = SyncScheduler()
@@ -0,0 +1,247 @@
+# Hot tier: the last HOT_CACHE_CANDLES closed rich candles per symbol/timeframe, in RAM.
+# Fed by the live aggregator (every closed candle) and filled from the DB path (startup warm-up, misses).
+#
+# Each ring also tracks the time range it fully covers, [lo, hi): every closed candle in there is in the
+# ring (buckets without trades have no candle). A read is a hit only inside that range.
+# Live candles extend hi; a restarted/reconnected stream (reset_live) starts a new range because the
+# ticks in between were not seen.
+#
+# Storage is array-backed: times/OHLCV in fixed NumPy columns, each footprint as two small arrays
+# (price units int64, [buy, sell] float64). Dicts are rebuilt only when candles are read.
+import os
+import threading
+import time
+import numpy as np
+from binning import PRICE_SCALE, format_price_key
+
+HOT_CACHE_CANDLES = int(os.getenv("HOT_CACHE_CANDLES", "720"))       # per symbol/timeframe
+HOT_CACHE_MAX_MB = float(os.getenv("HOT_CACHE_MAX_MB", "256"))       # all rings together
+HOT_CACHE_WARM_CANDLES = int(os.getenv("HOT_CACHE_WARM_CANDLES", "60"))
+
+FIELDS = ("open", "high", "low", "close", "volume", "delta")
+# Orderflow analytics (orderflow.py) kept as they came with the candle
+ANALYTICS = ("max_delta", "min_delta", "cvd", "poc", "imbalances", "stacked")
+_EMPTY_UNITS = np.empty(0, dtype=np.int64)
+_EMPTY_QTY = np.empty((2, 0), dtype=np.float64)
+
+class CandleRing:
+    def __init__(self, bucket_s, capacity=HOT_CACHE_CANDLES):
+        self.bucket_s = bucket_s
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.int64)
+        self.values = np.zeros((capacity, len(FIELDS)), dtype=np.float64)
+        self.units = [_EMPTY_UNITS] * capacity   # footprint price units per slot (ascending)
+        self.qty = [_EMPTY_QTY] * capacity       # footprint [buy, sell] rows per slot
+        self.analytics = [None] * capacity       # orderflow analytics dict per slot
+        self.head = 0    # slot of the oldest candle
+        self.count = 0
+        self.lo = None   # covered range [lo, hi)
+        self.hi = None
+        self.live_gap = True # next live candle starts a new covered range
+        self.labels = {}     # price units -> JSON key
+        self.level_bytes = 0
+        self.last_access = time.monotonic()
+
+    def nbytes(self):
+        return self.times.nbytes + self.values.nbytes + self.level_bytes
+
+    def _slot(self, i):
+        return (self.head + i) % self.capacity
+
+    def _time_at(self, i):
+        return int(self.times[self._slot(i)])
+
+    # Index of the first candle with time >= t (binary search over the ring)
+    def _find(self, t):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._time_at(mid) < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _store(self, slot, candle):
+        self.times[slot] = candle["time"]
+        self.values[slot] = [candle[f] for f in FIELDS]
+        fp = candle.get("footprint") or {}
+        units = np.fromiter((int(round(float(k) * PRICE_SCALE)) for k in fp), dtype=np.int64, count=len(fp))
+        qty = np.array([[lvl["buy"] for lvl in fp.values()], [lvl["sell"] for lvl in fp.values()]], dtype=np.float64)
+        order = np.argsort(units, kind="stable")
+        self.level_bytes -= self.units[slot].nbytes + self.qty[slot].nbytes
+        self.units[slot] = units[order]
+        self.qty[slot] = qty.reshape(2, len(fp))[:, order]
+        self.level_bytes += self.units[slot].nbytes + self.qty[slot].nbytes
+        self.analytics[slot] = {k: candle[k] for k in ANALYTICS if k in candle}
+
+    # Adds a closed candle, time order is kept. Same bucket = replace.
+    def put(self, candle):
+        t = candle["time"]
+        if self.count and t <= self._time_at(self.count - 1):
+            i = self._find(t)
+            if i < self.count and self._time_at(i) == t:
+                self._store(self._slot(i), candle)
+            # Older than the newest and not stored: only fill() inserts history
+            return
+
+        if self.count == self.capacity:
+            evicted = int(self.times[self.head])
+            self.head = (self.head + 1) % self.capacity
+            self.count -= 1
+            if self.lo is not None and self.lo <= evicted:
+                self.lo = evicted + self.bucket_s
+        self._store(self._slot(self.count), candle)
+        self.count += 1
+
+    # Live candle (aggregator close): contiguous with what the live stream delivered before
+    def add_live(self, candle):
+        t = candle["time"]
+        if self.live_gap or self.hi is None:
+            self.lo, self.hi = t, t + self.bucket_s
+            self.live_gap = False
+        elif t >= self.hi:
+            self.hi = t + self.bucket_s
+        self.put(candle)
+
+    # Complete candles of [start_s, end_s) from the DB path, merged with the covered range when they touch
+    def fill(self, candles, start_s, end_s):
+        if self.lo is None or (start_s <= self.hi and end_s >= self.lo):
+            lo = start_s if self.lo is None else min(self.lo, start_s)
+            hi = end_s if self.hi is None else max(self.hi, end_s)
+            existing = self.read_all()
+        elif end_s < self.lo:
+            return # Older, disjoint history: keep the live range
+        else:
+            lo, hi = start_s, end_s
+            existing = []
+
+        merged = {c["time"]: c for c in candles if start_s <= c["time"] < end_s}
+        for c in existing:
+            # Ring candles win inside their covered range (live), DB candles elsewhere
+            if self.lo <= c["time"] < self.hi:
+                merged[c["time"]] = c
+            else:
+                merged.setdefault(c["time"], c)
+
+        times = sorted(merged)
+        if len(times) > self.capacity:
+            lo = max(lo, times[-self.capacity - 1] + self.bucket_s)
+            times = times[-self.capacity:]
+
+        self.head, self.count = 0, 0
+        self.level_bytes = 0
+        self.units = [_EMPTY_UNITS] * self.capacity
+        self.qty = [_EMPTY_QTY] * self.capacity
+        self.analytics = [None] * self.capacity
+        for t in times:
+            self._store(self.count, merged[t])
+            self.count += 1
+        self.lo, self.hi = lo, hi
+
+    def covers(self, start_s, end_s):
+        return self.lo is not None and self.lo <= start_s and end_s <= self.hi
+
+    def _candle(self, slot):
+        labels = self.labels
+        fp = {}
+        qty = self.qty[slot]
+        for u, b, s in zip(self.units[slot].tolist(), qty[0].tolist(), qty[1].tolist()):
+            label = labels.get(u)
+            if label is None:
+                label = labels[u] = format_price_key(u / PRICE_SCALE)
+            fp[label] = {"buy": b, "sell": s}
+        o, h, l, c, v, d = self.values[slot].tolist()
+        out = {"time": int(self.times[slot]), "open": o, "high": h, "low": l, "close": c,
+               "volume": v, "delta": d, "footprint": fp}
+        if self.analytics[slot]:
+            out.update(self.analytics[slot])
+        return out
+
+    # Candles with start_s <= time < end_s, oldest first
+    def read(self, start_s, end_s):
+        i = self._find(start_s)
+        out = []
+        while i < self.count and self._time_at(i) < end_s:
+            out.append(self._candle(self._slot(i)))
+            i += 1
+        return out
+
+    def read_all(self):
+        return [self._candle(self._slot(i)) for i in range(self.count)]
+
+class HotCache:
+    def __init__(self, capacity=HOT_CACHE_CANDLES, max_bytes=HOT_CACHE_MAX_MB * 1024 * 1024):
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.rings = {}  # (symbol, timeframe) -> CandleRing
+        self.lock = threading.Lock()
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _ring(self, symbol, timeframe, bucket_s, create=True):
+        key = (symbol.upper(), timeframe)
+        ring = self.rings.get(key)
+        if ring is None and create:
+            ring = self.rings[key] = CandleRing(bucket_s, self.capacity)
+        if ring is not None:
+            ring.last_access = time.monotonic()
+        return ring
+
+    # Live close hook (ingestor): every closed candle of every live timeframe
+    def add_live(self, symbol, timeframe, bucket_s, candle):
+        with self.lock:
+            self._ring(symbol, timeframe, bucket_s).add_live(candle)
+            self._enforce_cap()
+
+    def fill(self, symbol, timeframe, bucket_s, candles, start_s, end_s):
+        with self.lock:
+            self._ring(symbol, timeframe, bucket_s).fill(candles, start_s, end_s)
+            self._enforce_cap()
+
+    # The live stream of symbol restarted: whatever happened in between is unknown
+    def reset_live(self, symbol):
+        with self.lock:
+            for (sym, _), ring in self.rings.items():
+                if sym == symbol.upper():
+                    ring.live_gap = True
+
+    # Closed candles of [start_s, end_s), or None when the range is not fully in RAM
+    def get(self, symbol, timeframe, start_s, end_s):
+        with self.lock:
+            ring = self._ring(symbol, timeframe, None, create=False)
+            if ring is None or not ring.covers(start_s, end_s):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return ring.read(start_s, end_s)
+
+    def miss(self):
+        with self.lock:
+            self.misses += 1
+
+    # Memory cap: drop whole rings, least recently used first
+    def _enforce_cap(self):
+        total = sum(r.nbytes() for r in self.rings.values())
+        while total > self.max_bytes and len(self.rings) > 1:
+            key = min(self.rings, key=lambda k: self.rings[k].last_access)
+            total -= self.rings.pop(key).nbytes()
+            self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "rings": len(self.rings),
+                "candles": sum(r.count for r in self.rings.values()),
+                "bytes": sum(r.nbytes() for r in self.rings.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+            }
+
+hot_cache = HotCache()
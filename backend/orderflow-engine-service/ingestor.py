@@ -1,107 +1,377 @@
 # the Live Listener
-# This replaces wss.js logic but specifically for Orderflow. It keeps a buffer and flushes to the DB.
+# This replaces wss.js logic but specifically for Orderflow.
+# Ticks and closed candles are handed to background writers (writer.py) that flush to the DB,
+# so a slow DB never stalls the websocket thread.
+# One process handles N symbols: symbols are spread over a few combined-stream connections (shards)
+# and every symbol gets its own CandleAggregator from processing.registry.
+# Tick sources: the live exchange socket (optionally recorded to disk) or a recorded feed replayed at
+# 1x / Nx / max speed (replay.py). Both go through handle_message.
 import websocket
 import json
+import os
 import threading
 import time
-import asyncio
+from collections import Counter
 from datetime import datetime
-from historical import save_ticks_to_db
-from processing import aggregator
+from historical import copy_ticks_to_db
+from processing import registry
+from rollups import save_rollup_batch
 from connection_manager import manager
+from writer import BatchWriter
+from hot_cache import hot_cache
+from coverage_index import coverage
+from aggregation import TIMEFRAME_SECONDS
+import metrics
+import profiles
+from replay import FeedRecorder, FeedReplayer, resolve_files, parse_speed
+from journal import journal, JOURNAL_ENABLED
+from recovery import recover_open_candles
 
-SYMBOL = "btcusdt" # Lowercase for WS
-WS_URL = f"wss://stream.binance.com:9443/ws/{SYMBOL}@aggTrade"
-BUFFER = []
-BUFFER_LOCK = threading.Lock()
+STREAM_URL = "wss://stream.binance.com:9443/stream" # Combined streams endpoint
+DEFAULT_SYMBOLS = [s.strip().upper() for s in os.getenv("INGEST_SYMBOLS", "BTCUSDT").split(",") if s.strip()]
+# Binance allows up to 1024 streams per connection. Smaller shards keep a reconnect cheap.
+MAX_STREAMS_PER_CONNECTION = int(os.getenv("MAX_STREAMS_PER_CONNECTION", "200"))
+RECORD_FEED = os.getenv("RECORD_FEED", "0") == "1"   # record the live feed without ?record=true
 
-ws_app = None
+# Persists a batch of live ticks and extends each symbol's covered range with it.
+# Items are (tick, journal segment id or None), the ids tell the journal which of its segments are stored.
+def save_live_ticks(items):
+    global _lost_ticks
+    # Dropped/failed ticks break the continuity the coverage index relies on
+    lost = tick_writer.dropped + tick_writer.failed
+    if lost != _lost_ticks:
+        _lost_ticks = lost
+        coverage.break_live()
+
+    ticks = [tick for tick, _ in items]
+    if not copy_ticks_to_db(ticks):
+        coverage.break_live()
+        return False
+    journal.mark_persisted(Counter(seg for _, seg in items if seg is not None))
+
+    spans = {}
+    for ts, symbol, *_ in ticks:
+        ms = int(ts.timestamp() * 1000)
+        span = spans.get(symbol)
+        if span is None:
+            spans[symbol] = [ms, ms]
+        elif ms < span[0]:
+            span[0] = ms
+        elif ms > span[1]:
+            span[1] = ms
+    for symbol, (first_ms, last_ms) in spans.items():
+        coverage.extend_live(symbol, first_ms, last_ms)
+    return True
+
+_lost_ticks = 0
+tick_writer = BatchWriter("ticks", save_live_ticks)
+# Replayed ticks are stored but never extend coverage: the recording may have gaps the index cannot see
+replay_writer = BatchWriter("replay", copy_ticks_to_db)
+rollup_writer = BatchWriter("rollups", save_rollup_batch, batch_size=50)
+
+shards = []
+SHARDS_LOCK = threading.Lock()
 is_running = False
+_live_symbols = frozenset() # symbols on the live sockets, replays skip them
+
+recorder = None # FeedRecorder while the live feed is recorded
+replayer = None # FeedReplayer of the last replay
+
+# Closed candles of every live timeframe go into the rollup table (via the rollup writer)
+# and into the in-memory hot tier; 1m closes also extend the live session profile.
+# Replayed symbols skip both: a partial or gappy recording would overwrite complete rollups (the later
+# upsert wins), and the hot tier treats consecutive closes as gap-free.
+def persist_closed_candle(symbol, timeframe, candle):
+    if symbol in _live_symbols:
+        rollup_writer.submit((symbol, timeframe, candle))
+        hot_cache.add_live(symbol, timeframe, TIMEFRAME_SECONDS[timeframe], candle)
+    profiles.engine.on_candle(symbol, timeframe, candle)
+
+registry.set_on_close(persist_closed_candle)
 
-# Helper to run async broadcast from sync thread
-def broadcast_sync(data):
-    loop = asyncio.get_event_loop()
-    if loop.is_running():
-        asyncio.run_coroutine_threadsafe(manager.broadcast(data), loop)
+# live=False: the tick comes from a recording (replay_writer, no journal)
+def handle_trade(data, live=True):
+    # Extract
+    ts = datetime.fromtimestamp(data["T"] / 1000.0)
+    price = float(data['p'])
+    qty = float(data['q'])
+    is_sell = data['m']
+    symbol = data['s']
+    trade_id = data.get('a')
+    metrics.ticks_received.inc(symbol)
 
-def on_message(ws, message):
-    if not is_running: 
-        ws.close()
+    # 1. PROCESS AGGREGATION (Live Update)
+    aggregator = registry.get(symbol)
+    aggregator.process_tick(ts, price, qty, is_sell)
+
+    # 2. Broadcast to frontend
+    # Only marks the symbol as updated, the manager coalesces and sends at WS_MAX_FPS
+    manager.publish(symbol, aggregator)
+
+    # 3. Save to DB (queued, the writer thread batches by size/time)
+    if not live:
+        replay_writer.submit((ts, symbol, price, qty, is_sell, trade_id))
+        return
+    # Journaled first: a crash loses nothing still waiting in the queue (recovery.replay_journal)
+    seg = journal.append(ts, symbol, price, qty, is_sell, trade_id) if JOURNAL_ENABLED else None
+    tick_writer.submit(((ts, symbol, price, qty, is_sell, trade_id), seg))
+
+# Raw combined-stream message -> handle_trade. Shared by the live sockets and the replayer.
+# symbols: accepted symbols (None = any), exclude: symbols to skip
+def handle_message(message, symbols=None, exclude=(), live=True):
+    t0 = time.perf_counter()
+    msg = json.loads(message)
+    data = msg.get("data")
+    # Skip SUBSCRIBE/UNSUBSCRIBE acks and trades of symbols just removed
+    if not data or data.get("e") != "aggTrade":
         return
-    
+    symbol = data.get("s")
+    if (symbols is not None and symbol not in symbols) or symbol in exclude:
+        return
+    handle_trade(data, live)
+    metrics.tick_process_seconds.observe(time.perf_counter() - t0)
+
+def _replay_message(message, symbols):
     try:
-        data = json.loads(message)
-        # Extract
-        ts = datetime.fromtimestamp(data["T"] / 1000.0)
-        price = float(data['p'])
-        qty = float(data['q'])
-        is_sell = data['m']
-        symbol = "BTCUSDT"
-
-        # 1. PROCESS AGGREGATION (Live Update)
-        rich_candle = aggregator.process_tick(ts, price, qty, is_sell)
-
-        # 2. Broadcast to frontend
-        # need to find the main event loop to send the message
+        handle_message(message, symbols, exclude=_live_symbols, live=False)
+    except Exception as e:
+        print(f"Replay Msg Error: {e}")
+
+# One combined-stream websocket carrying the aggTrade streams of several symbols.
+# Symbols are added/removed on the open socket with SUBSCRIBE/UNSUBSCRIBE.
+class StreamShard:
+    def __init__(self):
+        self.symbols = set()
+        self.ws_app = None
+        self.is_running = False
+        self.request_id = 0
+
+    def url(self):
+        streams = "/".join(f"{s.lower()}@aggTrade" for s in sorted(self.symbols))
+        return f"{STREAM_URL}?streams={streams}"
+
+    def has_room(self):
+        return len(self.symbols) < MAX_STREAMS_PER_CONNECTION
+
+    def add(self, symbol):
+        self.symbols.add(symbol)
+        if self.is_running:
+            self.send_method("SUBSCRIBE", [symbol])
+        else:
+            self.start()
+
+    def remove(self, symbol):
+        self.symbols.discard(symbol)
+        if not self.symbols:
+            self.stop()
+        else:
+            self.send_method("UNSUBSCRIBE", [symbol])
+
+    def send_method(self, method, symbols):
+        self.request_id += 1
         try:
-            if ws.loop:
-                asyncio.run_coroutine_threadsafe(manager.broadcast(rich_candle), ws.loop)
+            self.ws_app.send(json.dumps({
+                "method": method,
+                "params": [f"{s.lower()}@aggTrade" for s in symbols],
+                "id": self.request_id
+            }))
         except Exception as e:
-            # Loop might be closed or not ready
+            # Socket not open yet: on_open re-subscribes the whole set
             pass
 
-        # 3. Save to DB (BATCH)
-        with BUFFER_LOCK:
-            BUFFER.append((ts, symbol, price, qty, is_sell))
-            # Batch insert every 50 ticks
-            if len(BUFFER) >= 50:
-                save_ticks_to_db(BUFFER)
-                BUFFER.clear()
-    except Exception as e:
-        print(f"WS Msg Error: {e}")
-
-def on_error(ws, error):
-    print("WS Error:", error)
-
-def on_close(ws, close_status_code, close_msg):
-    print("WS Closed")
-
-def on_open(ws):
-    print("🟢 Live Tick Stream Started")
-
-# Run WS in a separate thread so it doesn't block the API
-def run_ws(loop):
-    global ws_app
-    while is_running:
-        ws_app = websocket.WebSocketApp(
-            WS_URL,
-            on_open=on_open,
-            on_message=on_message,
-            on_error=on_error,
-            on_close=on_close
-        )
-        ws_app.loop = loop # Attach loop to instance
-        ws_app.run_forever()
-        if not is_running: break # If stopped manually, break loop
-        time.sleep(2)
-
-def start_ingestor(loop):
-    global is_running
-    if is_running:
-        return "Already running"
-    
-    is_running = True
-    t = threading.Thread(target=run_ws, args=(loop,))
-    t.daemon = True
-    t.start()
+    def on_message(self, ws, message):
+        if not self.is_running:
+            ws.close()
+            return
+
+        if recorder:
+            recorder.write(message)
+        try:
+            handle_message(message, self.symbols)
+        except Exception as e:
+            print(f"WS Msg Error: {e}")
+
+    def on_error(self, ws, error):
+        print("WS Error:", error)
+
+    def on_close(self, ws, close_status_code, close_msg):
+        print(f"WS Closed ({len(self.symbols)} symbols)")
+
+    def on_open(self, ws):
+        print(f"🟢 Live Tick Stream Started: {', '.join(sorted(self.symbols))}")
+        # (Re)connected: ticks during the outage were not seen
+        for symbol in list(self.symbols):
+            hot_cache.reset_live(symbol)
+            coverage.break_live(symbol)
+        # Covers symbols added while the socket was connecting
+        self.send_method("SUBSCRIBE", list(self.symbols))
+
+    # Run WS in a separate thread so it doesn't block the API
+    def run(self):
+        while self.is_running and self.symbols:
+            self.ws_app = websocket.WebSocketApp(
+                self.url(),
+                on_open=self.on_open,
+                on_message=self.on_message,
+                on_error=self.on_error,
+                on_close=self.on_close
+            )
+            self.ws_app.run_forever()
+            if not self.is_running: break # If stopped manually, break loop
+            time.sleep(2)
+            metrics.ws_reconnects.inc()
+
+    def start(self):
+        self.is_running = True
+        t = threading.Thread(target=self.run)
+        t.daemon = True
+        t.start()
+
+    def stop(self):
+        self.is_running = False
+        if self.ws_app:
+            self.ws_app.close() # Close socket to break the run_forever loop
+
+def active_symbols():
+    with SHARDS_LOCK:
+        return sorted(s for shard in shards for s in shard.symbols)
+
+def _refresh_live_symbols():
+    global _live_symbols
+    _live_symbols = frozenset(s for shard in shards for s in shard.symbols)
+
+# Fresh candle state: ticks since the symbol was last seen were missed
+def _reset_symbol(symbol):
+    registry.remove(symbol)
+    hot_cache.reset_live(symbol)
+    coverage.break_live(symbol)
+
+def start_ingestor(symbols=None, record=False):
+    global is_running, recorder
+    symbols = [s.upper() for s in (symbols or DEFAULT_SYMBOLS)]
+
+    with SHARDS_LOCK:
+        if (record or RECORD_FEED) and recorder is None:
+            recorder = FeedRecorder()
+
+        active = {s for shard in shards for s in shard.symbols}
+        new_symbols = [s for s in symbols if s not in active]
+        if not new_symbols:
+            return "Already running"
+
+        tick_writer.start()
+        rollup_writer.start()
+
+        for symbol in new_symbols:
+            _reset_symbol(symbol)
+            shard = next((sh for sh in shards if sh.has_room()), None)
+            if shard is None:
+                shard = StreamShard()
+                shards.append(shard)
+            shard.add(symbol)
+
+        _refresh_live_symbols()
+        is_running = True
+    # The open candles (and session CVD) get their part from before the stream from the DB
+    for symbol in new_symbols:
+        threading.Thread(target=recover_open_candles, args=(symbol,), daemon=True).start()
     return "Started"
 
-def stop_ingestor():
-    global is_running, ws_app
-    if not is_running:
-        return "Already stopped"
-    
-    is_running = False
-    if ws_app:
-        ws_app.close() # Close socket to break the run_forever loop
-    return "Stopped"
\ No newline at end of file
+# Plays recorded files (a name or glob in replay.RECORD_DIR) through the ingest path.
+# speed: "1" = real time, "10" = ten times faster, "max" = no pacing. Raises replay.ReplayError on bad input.
+def start_replay(symbols=None, pattern=None, speed="1"):
+    global replayer
+    files = resolve_files(pattern)
+    speed = parse_speed(speed)
+
+    with SHARDS_LOCK:
+        if replayer and replayer.is_alive():
+            return "Replay already running"
+
+        replay_writer.start()
+        rollup_writer.start()
+
+        symbols = [s.upper() for s in symbols] if symbols else None
+        targets = symbols or [s for s in registry.symbols() if s not in _live_symbols]
+        for symbol in targets:
+            if symbol not in _live_symbols:
+                _reset_symbol(symbol)
+
+        replayer = FeedReplayer(files, _replay_message, speed, symbols)
+        replayer.start()
+    return "Replay started"
+
+def _stop_replay(symbols):
+    if not (replayer and replayer.is_alive()):
+        return False
+    if symbols and replayer.symbols is not None and not replayer.symbols & {s.upper() for s in symbols}:
+        return False
+    replayer.stop()
+    replayer.thread.join(timeout=5)
+    return True
+
+def stop_ingestor(symbols=None):
+    global is_running, recorder
+
+    replay_stopped = _stop_replay(symbols)
+    with SHARDS_LOCK:
+        if not shards:
+            if replay_stopped:
+                flush_writers()
+                journal.close()
+                return "Stopped"
+            return "Already stopped"
+
+        targets = [s.upper() for s in symbols] if symbols else [s for shard in shards for s in shard.symbols]
+        for symbol in targets:
+            for shard in shards:
+                if symbol in shard.symbols:
+                    shard.remove(symbol)
+            registry.remove(symbol)
+
+        shards[:] = [sh for sh in shards if sh.symbols]
+        _refresh_live_symbols()
+        is_running = bool(shards)
+        if not shards and recorder:
+            recorder.close()
+            recorder = None
+
+    # Persist everything still queued so no buffered ticks are lost
+    flush_writers()
+    if not shards:
+        journal.close()
+    return "Stopped"
+
+def flush_writers(timeout=30):
+    tick_writer.flush(timeout)
+    replay_writer.flush(timeout)
+    rollup_writer.flush(timeout)
+
+def writer_stats():
+    return {"ticks": tick_writer.stats(), "replay": replay_writer.stats(), "rollups": rollup_writer.stats()}
+
+def source_stats():
+    return {
+        "recorder": recorder.stats() if recorder else None,
+        "replay": replayer.stats() if replayer else None,
+        "journal": journal.stats(),
+    }
+
+def _collect_metrics():
+    symbols = active_symbols()
+    yield ("orderflow_ingestor_symbols", "gauge", "Symbols currently ingested", [({}, len(symbols))])
+    yield ("orderflow_exchange_connections", "gauge", "Exchange websocket shards running",
+           [({}, sum(1 for shard in shards if shard.is_running))])
+    writers = writer_stats()
+    for key, kind, help in (
+        ("queue_depth", "gauge", "Items waiting in the writer queue"),
+        ("queue_max", "gauge", "Writer queue capacity"),
+        ("written", "counter", "Items persisted"),
+        ("dropped", "counter", "Items dropped because the queue was full"),
+        ("failed", "counter", "Items lost after all write retries"),
+    ):
+        suffix = "_total" if kind == "counter" else ""
+        yield (f"orderflow_writer_{key}{suffix}", kind, help,
+               [({"writer": name}, stats[key]) for name, stats in writers.items()])
+
+metrics.register_collector(_collect_metrics)
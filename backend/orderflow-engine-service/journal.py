@@ -0,0 +1,143 @@
+# Append-only journal of the ticks on their way to the DB: what sits in the tick writer's queue survives a crash.
+# Every tick is appended before it is handed to the tick writer, tagged with the id of its segment (append's
+# return value). The writer reports how many ticks of which segments it persisted (mark_persisted), and a
+# closed segment file is deleted once all of its ticks are in market_ticks. The shard threads may append and
+# submit in any interleaving: counts are per segment, not a position in one global sequence.
+# A segment with dropped or failed ticks never completes and stays on disk for the next startup.
+# Files left on disk at startup were never confirmed: recovery.replay_journal writes them again before the
+# ingestor starts (the COPY merge skips rows that made it the first time).
+#
+# Files: JOURNAL_DIR/ticks-<opened, Unix ms>.log, a new one every JOURNAL_SEGMENT_SECONDS,
+# one line per tick: "<trade time, Unix ms>\t<symbol>\t<price>\t<qty>\t<1 = taker sold>\t<aggTrade id or empty>"
+# Lines are flushed to the OS on every tick (a process crash loses nothing); JOURNAL_FSYNC=1 also syncs
+# them to disk (power loss), at the cost of a disk write per tick.
+import glob
+import os
+import threading
+import time
+from datetime import datetime
+
+JOURNAL_DIR = os.getenv("JOURNAL_DIR", "journal")
+JOURNAL_ENABLED = os.getenv("TICK_JOURNAL", "1") == "1"
+JOURNAL_SEGMENT_SECONDS = float(os.getenv("JOURNAL_SEGMENT_SECONDS", "10"))
+JOURNAL_FSYNC = os.getenv("JOURNAL_FSYNC", "0") == "1"
+JOURNAL_REPLAY_BATCH = 50_000
+
+def format_tick(ts, symbol, price, qty, is_sell, trade_id):
+    tid = "" if trade_id is None else trade_id
+    return f"{int(round(ts.timestamp() * 1000))}\t{symbol}\t{price!r}\t{qty!r}\t{1 if is_sell else 0}\t{tid}\n"
+
+# Line -> tick tuple as handed to the tick writer: (datetime, symbol, price, qty, is_sell, trade_id)
+def parse_tick(line):
+    ms, symbol, price, qty, sell, tid = line.rstrip("\n").split("\t")
+    return (datetime.fromtimestamp(int(ms) / 1000.0), symbol, float(price), float(qty), sell == "1",
+            int(tid) if tid else None)
+
+class TickJournal:
+    def __init__(self, directory=JOURNAL_DIR, segment_seconds=JOURNAL_SEGMENT_SECONDS):
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.file = None
+        self.opened_at = 0.0
+        self.current = None  # id of the open segment
+        self.next_id = 0
+        self.segments = {}   # id -> [path, ticks appended, ticks persisted, closed]
+        self.appended = 0    # ticks appended by this process
+        self.persisted = 0   # of those, confirmed in the DB
+        self.lock = threading.Lock()
+
+        # Stats
+        self.deleted = 0
+
+    # Returns the segment id the tick must be reported with (mark_persisted)
+    def append(self, ts, symbol, price, qty, is_sell, trade_id=None):
+        line = format_tick(ts, symbol, price, qty, is_sell, trade_id)
+        with self.lock:
+            if self.file is None or time.monotonic() - self.opened_at >= self.segment_seconds:
+                self._rotate()
+            self.file.write(line)
+            self.file.flush()
+            if JOURNAL_FSYNC:
+                os.fsync(self.file.fileno())
+            self.segments[self.current][1] += 1
+            self.appended += 1
+            return self.current
+
+    def _rotate(self):
+        self._close_current()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"ticks-{int(time.time() * 1000)}.log")
+        self.file = open(path, "a", encoding="utf-8")
+        self.opened_at = time.monotonic()
+        self.current = self.next_id
+        self.next_id += 1
+        self.segments[self.current] = [path, 0, 0, False]
+
+    def _close_current(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+            seg = self.segments[self.current]
+            seg[3] = True
+            self._release(self.current, seg)
+
+    # The tick writer stored ticks of these segments: {segment id: count}
+    def mark_persisted(self, counts):
+        with self.lock:
+            for seg_id, n in counts.items():
+                self.persisted += n
+                seg = self.segments.get(seg_id)
+                if seg is not None:
+                    seg[2] += n
+                    self._release(seg_id, seg)
+
+    # A closed segment whose ticks are all persisted is deleted
+    def _release(self, seg_id, seg):
+        if not seg[3] or seg[2] < seg[1]:
+            return
+        del self.segments[seg_id]
+        try:
+            os.remove(seg[0])
+            self.deleted += 1
+        except OSError as e:
+            print(f"⚠️ Tick journal: could not delete {seg[0]}: {e}")
+
+    # Ingestor stopped (writers flushed): closes the open segment, deleted too when fully persisted.
+    # Segments still incomplete (dropped/failed ticks) stay on disk for the next startup.
+    def close(self):
+        with self.lock:
+            self._close_current()
+            if self.segments:
+                print(f"⚠️ Tick journal: {len(self.segments)} segment(s) with unconfirmed ticks kept for replay")
+
+    def stats(self):
+        with self.lock:
+            return {
+                "enabled": JOURNAL_ENABLED,
+                "segments": len(self.segments),
+                "appended": self.appended,
+                "persisted": self.persisted,
+                "unconfirmed": self.appended - self.persisted,
+                "deleted_segments": self.deleted,
+            }
+
+# Segments left by a previous process, oldest first
+def leftover_segments(directory=JOURNAL_DIR):
+    return sorted(glob.glob(os.path.join(directory, "ticks-*.log")))
+
+# Ticks of a segment in batches of JOURNAL_REPLAY_BATCH. A torn last line (crash mid-write) is skipped.
+def read_segment(path, batch_size=JOURNAL_REPLAY_BATCH):
+    batch = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                batch.append(parse_tick(line))
+            except ValueError:
+                continue
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+journal = TickJournal()
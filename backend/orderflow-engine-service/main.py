@@ -1,14 +1,30 @@
 # this starts the ingestor(web socket) on boot and exposes an API endpoint for the frontend to trigger a backfill
-from fastapi import FastAPI, BackgroundTasks, WebSocket
+from fastapi import FastAPI, BackgroundTasks, WebSocket, Request, Response
+from fastapi.responses import JSONResponse
+from typing import Optional
 from fastapi.middleware.cors import CORSMiddleware 
 from pydantic import BaseModel
 import uvicorn
 import asyncio
+import json
+import time
 import ingestor
 import historical
 import footprint
 import database
+import rollups
+import archive
+import wire
+import history_sync
+import metrics
+import profiles
+import recovery
 from connection_manager import manager
+from hot_cache import hot_cache
+from coverage_index import coverage, init_coverage_table
+from async_db import db, DatabaseUnavailable
+from replay import ReplayError
+from journal import journal
 
 app = FastAPI()
 
@@ -18,45 +34,112 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allow POST, GET, OPTIONS, etc.
     allow_headers=["*"],  # Allow all headers
+    expose_headers=["X-History-Sync", "X-Range-Start", "X-Range-End", "X-Next-Cursor"],
 )
 
 @app.on_event("startup")
 async def startup_event():
     print("🚀 Server B (Orderflow) Starting...")
+    # Coalescing websocket broadcaster (sends at most WS_MAX_FPS frames/s per symbol)
+    manager.start()
+    # psycopg2 pool: ingestor, writers, backfill, archive (threads). asyncpg pool: API handlers.
     database.init_db_pool()
-    database.prune_database(days_to_keep=7) 
+    await db.connect()
+    db.start_health_checks()
+    historical.init_tick_table()
+    rollups.init_rollup_table()
+    init_coverage_table()
+    coverage.load()
+    # Ticks the previous process received but never confirmed in the DB (crash), before anything reads them
+    await asyncio.to_thread(recovery.replay_journal)
+    # Ticks past the retention horizon go to the on-disk archive, then leave the DB
+    await asyncio.to_thread(archive.archive_and_prune, days_to_keep=7)
+    # Recent candles of the default symbols into RAM (hot tier), off the event loop
+    asyncio.create_task(asyncio.to_thread(footprint.warm_hot_cache, ingestor.DEFAULT_SYMBOLS))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await asyncio.to_thread(ingestor.flush_writers)
+    journal.close()
+    coverage.persist()
+    await db.close()
 
 @app.get("/")
 def home():
     return {
         "status": "Orderflow Engine Ready", 
-        "ingestor_active": ingestor.is_running
+        "ingestor_active": ingestor.is_running,
+        "symbols": ingestor.active_symbols()
     }
 
 # --- WEBSOCKET ENDPOINT ---------------------------------
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    # frontend connects here: ws://localhost:8000/ws
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, symbol: Optional[str] = None, timeframe: str = "1m",
+                             mode: str = "full", format: str = "json"):
+    # frontend connects here: ws://localhost:8000/ws?symbol=BTCUSDT
+    # (without symbol the client receives every ingested symbol)
+    # timeframe: any of processing.LIVE_TIMEFRAMES (default 1m)
+    # mode=delta: snapshot + incremental frames with seq numbers (see processing.py)
+    # format=binary: frames use the packed layout from wire.py instead of JSON, the header names symbol/timeframe
+    await manager.connect(websocket, symbol, mode, format, timeframe)
     try:
         while True:
-            # Keep connection alive
-            await websocket.receive_text()
+            # Keep connection alive, delta clients send {"type": "resync"} after a seq gap
+            text = await websocket.receive_text()
+            try:
+                msg = json.loads(text)
+            except ValueError:
+                continue
+            if isinstance(msg, dict) and msg.get("type") == "resync":
+                manager.resync(websocket)
     except:
         manager.disconnect(websocket)
 
 # --- CONTROL ENDPOINTS ----------------------------------
+# symbol: comma separated list (e.g. BTCUSDT,ETHUSDT). Omitted = INGEST_SYMBOLS on start, all on stop.
+# source=live (default): exchange websocket, record=true also writes the raw feed to RECORD_DIR.
+# source=replay: plays recorded files through the same pipeline.
+#   file: recording name or glob in RECORD_DIR (default: all), speed: 1, 10, 100, ... or max,
+#   symbol: only these symbols (default: every symbol in the files; symbols that are live are skipped).
 @app.post("/ingest/start")
-async def start_ingest(): 
-    # Pass the running event loop to the thread so it can broadcast back
-    loop = asyncio.get_running_loop()
-    status = ingestor.start_ingestor(loop)
-    return {"status": status}
+async def start_ingest(symbol: Optional[str] = None, source: str = "live", record: bool = False,
+                       file: Optional[str] = None, speed: str = "1"):
+    if source == "replay":
+        try:
+            status = ingestor.start_replay(parse_symbols(symbol), file, speed)
+        except ReplayError as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
+        return {"status": status, "replay": ingestor.source_stats()["replay"]}
+    if source != "live":
+        return JSONResponse(status_code=400, content={"error": f"Unknown source '{source}' (live or replay)"})
+
+    status = ingestor.start_ingestor(parse_symbols(symbol), record)
+    return {"status": status, "symbols": ingestor.active_symbols()}
 
 @app.post("/ingest/stop")
-async def stop_ingest():
-    status = ingestor.stop_ingestor()
-    return {"status": status}
+async def stop_ingest(symbol: Optional[str] = None):
+    # Stopping flushes the DB writers (blocking), keep it off the event loop
+    status = await asyncio.to_thread(ingestor.stop_ingestor, parse_symbols(symbol))
+    return {"status": status, "symbols": ingestor.active_symbols()}
+
+# Writer queue depth, drops and flush latency
+@app.get("/ingest/stats")
+def ingest_stats():
+    return {
+        "symbols": ingestor.active_symbols(),
+        "writers": ingestor.writer_stats(),
+        "sources": ingestor.source_stats(),
+        "websocket": manager.stats(),
+        "hot_cache": hot_cache.stats(),
+        "history_sync": history_sync.scheduler.stats(),
+        "profiles": profiles.engine.stats(),
+        "db": db.stats()
+    }
+
+def parse_symbols(symbol: Optional[str]):
+    if not symbol:
+        return None
+    return [s.strip().upper() for s in symbol.split(",") if s.strip()]
 
 # --- HISTORICAL -------------------------------------------
 class AssetRequest(BaseModel):
@@ -69,14 +152,76 @@ async def load_ticks(req: AssetRequest, background_tasks: BackgroundTasks):
     background_tasks.add_task(historical.load_tick_history, req.symbol, 60)
     return {"status": "Backfill started", "symbol": req.symbol}
 
+MAX_HISTORY_CANDLES = 1000
+
 @app.get("/history/footprint")
-def history_footprint(symbol: str, timeframe: str = "1m"):
-    # Returns Rich Candles (with Footprint data) from TimescaleDB
-    data = footprint.get_historical_footprints(symbol, timeframe, limit=60)
-    return data
+async def history_footprint(request: Request, symbol: str, timeframe: str = "1m", format: str = "json",
+                            limit: int = 60, start: Optional[int] = None, end: Optional[int] = None,
+                            since: Optional[int] = None, cursor: Optional[str] = None):
+    # Returns Rich Candles (with Footprint data) from what TimescaleDB has right now.
+    # Default: the latest `limit` candles. start/end (Unix seconds) select a range, since=<last candle time>
+    # returns that candle and everything newer, cursor pages backward (X-Next-Cursor of the previous page).
+    # Ranges are whole buckets, X-Range-Start/X-Range-End tell the page edges, pages join without overlap.
+    # The time filter is a plain half-open range on the hypertable's time column, so only the chunks of
+    # the page are scanned.
+    # Missing ticks of the latest window are downloaded in the background (one job per symbol/window,
+    # shared by concurrent requests), the completed candles are then pushed to websocket clients as
+    # {"type": "history"}.
+    symbol = symbol.upper()
+    if timeframe not in footprint.TIMEFRAME_SECONDS: timeframe = "1m"
+    limit = max(1, min(limit, MAX_HISTORY_CANDLES))
+    try:
+        start_s, end_s = footprint.resolve_range(symbol, timeframe, limit, start, end, since, cursor)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    _, latest_end = footprint.latest_window(footprint.TIMEFRAME_SECONDS[timeframe], 1, time.time())
+    if end_s == latest_end:
+        sync = "pending" if history_sync.scheduler.schedule(symbol, timeframe, limit) else "complete"
+    else:
+        sync = "partial" if coverage.gaps(symbol, start_s * 1000, end_s * 1000) else "complete"
+
+    try:
+        with metrics.history_request_seconds.time():
+            data = await footprint.get_footprint_range_async(symbol, timeframe, start_s, end_s)
+    except DatabaseUnavailable as e:
+        return JSONResponse(status_code=503, content={"error": str(e)}, headers={"Retry-After": "1"})
+
+    headers = {"X-History-Sync": sync, "X-Range-Start": str(start_s), "X-Range-End": str(end_s)}
+    prev_page = footprint.next_cursor(symbol, timeframe, start_s)
+    if prev_page:
+        headers["X-Next-Cursor"] = prev_page
+    # Opt-in binary layout (wire.py): ?format=binary or Accept: application/x-orderflow-candles
+    # (JSON when the price range does not fit the packed offsets)
+    if format == "binary" or wire.MEDIA_TYPE in request.headers.get("accept", ""):
+        try:
+            content = wire.encode_candles(data, symbol=symbol, timeframe=timeframe)
+            return Response(content=content, media_type=wire.MEDIA_TYPE, headers=headers)
+        except wire.WireRangeError:
+            pass
+    return JSONResponse(content=data, headers=headers)
+
+@app.get("/profiles/session")
+async def session_profiles(symbol: str, days: int = 1, row_size: float = 10, va: float = 70,
+                           block_size: float = 50, single_print: int = 1):
+    # Session Volume Profile and TPO of the last `days` UTC sessions (oldest first, the live one last),
+    # built from the tick-exact 1m footprints: rows/levels/stats in the shape the chart indicators draw.
+    # row_size / block_size are price steps of the volume rows / TPO blocks, va the value area in %.
+    days = max(1, min(days, profiles.MAX_PROFILE_DAYS))
+    if row_size <= 0 or block_size <= 0 or not 0 < va <= 100:
+        return JSONResponse(status_code=400, content={"error": "row_size and block_size must be > 0, va in (0, 100]"})
+    try:
+        return await profiles.engine.get_profiles(symbol, days, row_size, va / 100, block_size, max(1, single_print))
+    except DatabaseUnavailable as e:
+        return JSONResponse(status_code=503, content={"error": str(e)}, headers={"Retry-After": "1"})
+
+# Prometheus scrape target: ingest, writers, DB pools, websocket fan-out, /history/footprint phases
+@app.get("/metrics")
+def metrics_endpoint():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 @app.get("/health")
 def health():
-    return {"status": "ok", "service": "Orderflow Engine"}
+    return {"status": "ok", "service": "Orderflow Engine", "db_healthy": db.healthy}
 
 
@@ -0,0 +1,140 @@
+# Prometheus metrics, text exposition format 0.0.4 (served by main.py at /metrics).
+# Hand-rolled, no client library: counters and histograms are updated in place by the hot paths
+# (one lock + a few adds per observation); values that modules already track (queue depth, clients, pool size)
+# are read at scrape time by collectors registered with register_collector().
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency buckets in seconds
+FAST_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+SLOW_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_metrics = []
+_collectors = []
+
+def _label_str(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _fmt(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {} if labelnames else {(): 0} # label values -> count
+        self.lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        with self.lock:
+            items = list(self.values.items())
+        return [f"{self.name}{_label_str(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=SLOW_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {} # label values -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, *labels):
+        i = 0
+        n = len(self.buckets)
+        while i < n and value > self.buckets[i]:
+            i += 1
+        with self.lock:
+            s = self.series.get(labels)
+            if s is None:
+                s = self.series[labels] = [0] * (n + 3)
+            s[i] += 1          # per-bucket count, made cumulative on render
+            s[n + 1] += value
+            s[n + 2] += 1
+
+    # with histogram.time("phase"): ...
+    @contextmanager
+    def time(self, *labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, *labels)
+
+    def render(self):
+        with self.lock:
+            items = [(k, list(v)) for k, v in self.series.items()]
+        names = self.labelnames + ("le",)
+        lines = []
+        n = len(self.buckets)
+        for labels, s in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), s[:n + 1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_label_str(names, labels + (_fmt(bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, labels)} {_fmt(s[n + 1])}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, labels)} {s[n + 2]}")
+        return lines
+
+# fn() -> iterable of (name, kind, help, [(labels dict, value), ...]), called on every scrape
+def register_collector(fn):
+    _collectors.append(fn)
+
+def render():
+    lines = []
+    for m in _metrics:
+        lines.append(f"# HELP {m.name} {m.help}")
+        lines.append(f"# TYPE {m.name} {m.kind}")
+        lines.extend(m.render())
+
+    # Several collectors may report the same family (e.g. one per DB pool): one HELP/TYPE block each
+    families = {}
+    for fn in _collectors:
+        try:
+            for name, kind, help, samples in fn():
+                families.setdefault(name, (kind, help, []))[2].extend(samples)
+        except Exception as e:
+            print(f"⚠️ Metrics collector failed: {e}")
+    for name, (kind, help, samples) in families.items():
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            if value is not None:
+                lines.append(f"{name}{_label_str(tuple(labels), tuple(labels.values()))} {_fmt(value)}")
+    return "\n".join(lines) + "\n"
+
+# --- SHARED METRICS ---------------------------------------------
+ticks_received = Counter("orderflow_ticks_received_total", "aggTrade ticks received from the exchange", ["symbol"])
+tick_process_seconds = Histogram("orderflow_tick_process_seconds",
+                                 "Parse + aggregate + publish time per tick", buckets=FAST_BUCKETS)
+ws_reconnects = Counter("orderflow_exchange_reconnects_total", "Exchange websocket reconnects (per shard loop)")
+writer_flush_seconds = Histogram("orderflow_writer_flush_seconds", "Background writer flush latency", ["writer"])
+broadcast_seconds = Histogram("orderflow_broadcast_seconds", "Websocket fan-out pass duration", buckets=FAST_BUCKETS + SLOW_BUCKETS[3:])
+db_acquire_seconds = Histogram("orderflow_db_acquire_seconds", "Wait for a pooled DB connection", ["pool"],
+                               buckets=FAST_BUCKETS + SLOW_BUCKETS[3:])
+db_acquire_errors = Counter("orderflow_db_acquire_errors_total", "Failed DB connection acquisitions (exhausted, timeout, down)", ["pool"])
+history_phase_seconds = Histogram("orderflow_history_phase_seconds",
+                                  "/history/footprint phases (sync, hot, query, aggregate, analytics)", ["phase"])
+history_request_seconds = Histogram("orderflow_history_request_seconds", "/history/footprint total latency")
@@ -0,0 +1,115 @@
+# Orderflow analytics of a Rich Candle, on top of OHLCV/delta/footprint:
+#   poc                   price row with the most volume (lowest row on ties)
+#   max_delta, min_delta  extremes of the running delta inside the candle, in tick order
+#   cvd                   cumulative delta of the UTC session (day) up to the candle's last tick
+#   imbalances            diagonal bid/ask imbalances, same rule as the chart's footprint series:
+#                           ask at row p: buy(p) >= IMBALANCE_MIN_VOLUME and buy(p) >= ratio * sell(p - 1 row)
+#                           bid at row p: sell(p) >= IMBALANCE_MIN_VOLUME and sell(p) >= ratio * buy(p + 1 row)
+#                         (an empty diagonal neighbour counts as an imbalance)
+#   stacked               STACKED_IMBALANCE_ROWS+ adjacent rows with same-side imbalances:
+#                         [{"side": "ask"|"bid", "low", "high", "rows"}]
+#
+# FootprintStats keeps poc and the imbalance sets current per touched price row: a footprint only ever grows,
+# so the running max is the POC, and a change at row p can only flip the flags of p and its two diagonal
+# neighbours. The live aggregator touches the row of every tick; the history path touches every row of a
+# finished candle, so both go through the same code and give the same answers.
+import os
+from binning import PRICE_SCALE
+
+IMBALANCE_RATIO = float(os.getenv("IMBALANCE_RATIO", "3"))
+IMBALANCE_MIN_VOLUME = float(os.getenv("IMBALANCE_MIN_VOLUME", "5"))
+STACKED_IMBALANCE_ROWS = int(os.getenv("STACKED_IMBALANCE_ROWS", "3"))
+
+SESSION_SECONDS = 86400
+
+def session_start(ts):
+    return int(ts // SESSION_SECONDS) * SESSION_SECONDS
+
+class FootprintStats:
+    # level(b) -> [buy, sell] of price bin b, or None
+    def __init__(self, level):
+        self.level = level
+        self.poc = None
+        self.poc_volume = 0.0
+        self.ask = set()
+        self.bid = set()
+
+    # Row b changed (only ever increases)
+    def touch(self, b):
+        lvl = self.level(b)
+        if lvl is None:
+            return
+        buy, sell = lvl
+        v = buy + sell
+        if v > self.poc_volume or (v == self.poc_volume and (self.poc is None or b < self.poc)):
+            self.poc = b
+            self.poc_volume = v
+
+        # buy(b) -> ask at b, sell(b) -> bid at b, ask at b + 1 (sell below), bid at b - 1 (buy above)
+        above = self.level(b + 1)
+        below = self.level(b - 1)
+        self._flag(self.ask, b, buy, below[1] if below else 0)
+        self._flag(self.bid, b, sell, above[0] if above else 0)
+        if above:
+            self._flag(self.ask, b + 1, above[0], sell)
+        if below:
+            self._flag(self.bid, b - 1, below[1], buy)
+
+    def _flag(self, flags, b, qty, opposite):
+        if qty >= IMBALANCE_MIN_VOLUME and (opposite == 0 or qty >= IMBALANCE_RATIO * opposite):
+            flags.add(b)
+        else:
+            flags.discard(b)
+
+    # JSON fields, label(b) -> price key
+    def fields(self, label):
+        ask = sorted(self.ask)
+        bid = sorted(self.bid)
+        return {
+            "poc": label(self.poc) if self.poc is not None else None,
+            "imbalances": {"ask": [label(b) for b in ask], "bid": [label(b) for b in bid]},
+            "stacked": stacked_zones(ask, "ask", label) + stacked_zones(bid, "bid", label),
+        }
+
+# Runs of adjacent bins (sorted) at least STACKED_IMBALANCE_ROWS long
+def stacked_zones(bins, side, label):
+    zones = []
+    i = 0
+    while i < len(bins):
+        j = i
+        while j + 1 < len(bins) and bins[j + 1] == bins[j] + 1:
+            j += 1
+        if j - i + 1 >= STACKED_IMBALANCE_ROWS:
+            zones.append({"side": side, "low": label(bins[i]), "high": label(bins[j]), "rows": j - i + 1})
+        i = j + 1
+    return zones
+
+# Stats of a finished candle's footprint ({price key: {"buy", "sell"}})
+def footprint_stats(footprint, row_units):
+    levels = {}
+    labels = {}
+    for key, lvl in footprint.items():
+        b = int(round(float(key) * PRICE_SCALE)) // row_units
+        levels[b] = (lvl["buy"], lvl["sell"])
+        labels[b] = key
+    stats = FootprintStats(levels.get)
+    for b in levels:
+        stats.touch(b)
+    return stats, labels.get
+
+# History path: adds poc / imbalances / stacked / cvd to time-ordered candles in place.
+# cvd_base: session delta before the first candle (0 when it opens the session). max_delta/min_delta come
+# with the candles (aggregation / rollup table).
+def annotate(candles, row_units, cvd_base=0.0):
+    session = None
+    cvd = 0.0
+    for i, c in enumerate(candles):
+        day = session_start(c["time"])
+        if day != session:
+            session = day
+            cvd = cvd_base if i == 0 else 0.0
+        cvd += c["delta"]
+        c["cvd"] = cvd
+        stats, label = footprint_stats(c["footprint"], row_units)
+        c.update(stats.fields(label))
+    return candles
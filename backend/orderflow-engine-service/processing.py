@@ -1,21 +1,98 @@
 # turns raw ticks into "Rich Candles"
-# It keeps the current state in memory(RAM). 
+# It keeps the current state in memory(RAM).
 # When a new tick arrives, it updates the math. When the minute changes, it resets.
+#
+# Footprints are keyed by integer price bins (binning.py), levels are [buy, sell] lists.
+# String price keys are only built when a candle or frame is handed out.
+#
+# Only the 1m candle is updated per tick. Higher timeframes (LIVE_TIMEFRAMES) are rolled up
+# from closed 1m candles, and their live view = closed part + the open 1m candle.
+#
+# Live stream frames (drain_frames), one sequence number per symbol and timeframe:
+#   {"type": "snapshot", "symbol", "timeframe", "seq", "candle": {...full rich candle...}}
+#       sent on subscribe, on resync and for every candle that closed/opened
+#   {"type": "delta", "symbol", "timeframe", "seq", "time", "open", "high", "low", "close", "volume", "delta",
+#    <orderflow analytics>, "levels": {price: {"buy", "sell"}}}
+#       only the price levels touched since the previous frame (absolute values, not increments)
+# Every candle and frame carries the orderflow analytics (orderflow.py): poc, max_delta, min_delta, cvd,
+# imbalances, stacked. Delta extremes follow every tick; footprint stats catch up on read with the price rows
+# touched since the previous read, never by rescanning the footprint.
+# A client that sees seq jump by more than 1 lost frames and should ask for a resync.
+import os
+import threading
 from datetime import datetime
+from aggregation import TIMEFRAME_SECONDS
+from binning import PRICE_SCALE, get_row_units, bin_label
+from orderflow import FootprintStats, session_start
 
-class CandleAggregator:
+# Closed candles kept for the next frame (a fast replay can close several between frames)
+MAX_PENDING_CLOSED = 100
+
+LIVE_TIMEFRAMES = ["1m"] + [
+    tf.strip() for tf in os.getenv("LIVE_TIMEFRAMES", "5m,15m,1h,4h,1d").split(",")
+    if tf.strip() in TIMEFRAME_SECONDS and tf.strip() != "1m"
+]
+
+# Frame bookkeeping for one (symbol, timeframe) stream
+class StreamState:
     def __init__(self):
+        self.seq = 0
+        self.frame_time = None   # candle time the last frame described
+        self.closed = []         # candles closed since the last frame (final state)
+
+class CandleAggregator:
+    def __init__(self, symbol=None, on_close=None, timeframes=None):
+        self.symbol = symbol
         self.current_candle = None
         self.last_minute = None
+        # Called with (symbol, timeframe, candle) for each finished candle
+        self.on_close = on_close
+        # Ticks arrive on the websocket thread, snapshots are taken by the broadcaster
+        self.lock = threading.Lock()
+
+        self.row_units = get_row_units(symbol)
+        self.labels = {} # price bin -> JSON key, formatted once per level
+
+        self.timeframes = timeframes or LIVE_TIMEFRAMES
+        self.higher = [(tf, TIMEFRAME_SECONDS[tf]) for tf in self.timeframes if tf != "1m"]
+        self._init_state()
+
+    def _init_state(self):
+        # Closed 1m candles merged into the open bucket of each higher timeframe
+        self.rollups = {tf: None for tf, _ in self.higher}
+        # The first candle of every timeframe after (re)start misses the ticks before we connected
+        self.partial = {tf: True for tf in self.timeframes}
+        self.streams = {tf: StreamState() for tf in self.timeframes}
+        self.dirty = set() # price bins touched since the last frame
+
+        # Footprint stats per timeframe (open candle = closed part + open 1m candle) and the price bins
+        # touched since each was last read. A row only ever grows, so touching it once per read is enough.
+        self.tf_stats = {tf: self._tf_stats(tf) for tf in self.timeframes}
+        self.pending = {tf: set() for tf in self.timeframes}
+        self.pending_sets = list(self.pending.values())
+        # Session CVD: delta of the closed 1m candles of the current UTC day
+        self.session = None
+        self.session_delta = 0.0
+        # Time of the first tick since (re)start, the restart recovery rebuilds everything before it
+        self.first_tick = None
+        self.started = threading.Event()
 
     # Takes a raw tick and updates the current Rich Candle.
-    # Returns: The updated Candle Object.
+    # Returns: The updated Candle Object (live reference, use snapshot() from other threads).
     def process_tick(self, tick_time, price, qty, is_sell):
+        with self.lock:
+            return self._apply_tick(tick_time, price, qty, is_sell)
+
+    def _apply_tick(self, tick_time, price, qty, is_sell):
         # 1. Determine Minute (Unix Timestamp floor)
         minute_ts = int(tick_time.timestamp() // 60) * 60
 
         # 2. Check for New Candle
         if self.last_minute is None or minute_ts > self.last_minute:
+            if self.first_tick is None:
+                self.first_tick = tick_time.timestamp()
+                self.started.set()
+            self.close_candle(minute_ts)
             self.reset_candle(minute_ts, price)
 
         self.last_minute = minute_ts
@@ -23,7 +100,7 @@ class CandleAggregator:
 
         # 3. Update OHLCV
         c["close"] = price
-        if price > c["high"]: c["high"] = price 
+        if price > c["high"]: c["high"] = price
         if price < c['low']: c['low'] = price
         c['volume'] += qty
 
@@ -33,23 +110,240 @@ class CandleAggregator:
             c["delta"] -= qty
         else:
             c["delta"] += qty
+        if c["delta"] > c["max_delta"]: c["max_delta"] = c["delta"]
+        if c["delta"] < c["min_delta"]: c["min_delta"] = c["delta"]
 
         # 5. Update Footprint (Volume Profile inside candle)
-        # Key string must be price for JSON compatibility
-        p_str = f"{price:.8f}".rstrip('0').rstrip('.') # Normalize price key
-        if p_str not in c["footprint"]:
-            c["footprint"][p_str] = {"buy":0, "sell":0}
+        # Integer row of the price: [buy, sell]
+        b = int(round(price * PRICE_SCALE)) // self.row_units
+        lvl = c["footprint"].get(b)
+        if lvl is None:
+            lvl = c["footprint"][b] = [0, 0]
 
         if is_sell:
-            c["footprint"][p_str]["sell"] += qty
+            lvl[1] += qty
         else:
-            c['footprint'][p_str]['buy'] += qty
+            lvl[0] += qty
+        self.dirty.add(b)
+        for pending in self.pending_sets:
+            pending.add(b)
 
         return c
 
+    # Consistent copy of the open candle for `timeframe`, safe to serialize while ticks keep coming
+    def snapshot(self, timeframe="1m"):
+        with self.lock:
+            return self._live_view(timeframe)
+
+    # Like snapshot(), but None while the open candle still misses ticks from before the stream started
+    def complete_snapshot(self, timeframe="1m"):
+        with self.lock:
+            if self.current_candle is None or self.partial.get(timeframe, True):
+                return None
+            return self._live_view(timeframe)
+
+    # Snapshot for a client that just subscribed (or asked to resync).
+    # Carries the current seq: the next streamed frame is seq + 1.
+    def subscribe_frame(self, timeframe="1m"):
+        with self.lock:
+            if self.current_candle is None or timeframe not in self.streams:
+                return None
+            return {"type": "snapshot", "symbol": self.symbol, "timeframe": timeframe,
+                    "seq": self.streams[timeframe].seq, "candle": self._live_view(timeframe)}
+
+    # Frames describing everything that changed since the previous call, per timeframe.
+    # Called by the broadcaster at most WS_MAX_FPS times per second.
+    def drain_frames(self):
+        with self.lock:
+            c = self.current_candle
+            if c is None:
+                return {}
+
+            out = {}
+            for tf in self.timeframes:
+                st = self.streams[tf]
+                view_time = self._bucket(tf, c["time"])
+                frames = []
+                if st.frame_time != view_time:
+                    # Candle rolled over: final state of the closed candle(s), then the new one
+                    for closed in st.closed:
+                        if st.frame_time is not None and closed["time"] >= st.frame_time:
+                            frames.append(self._next_frame(tf, {"type": "snapshot", "candle": closed}))
+                    frames.append(self._next_frame(tf, {"type": "snapshot", "candle": self._live_view(tf)}))
+                    st.frame_time = view_time
+                elif self.dirty:
+                    frame = {"type": "delta"}
+                    frame.update(self._live_header(tf))
+                    frame["levels"] = self._live_levels(tf, self.dirty)
+                    frames.append(self._next_frame(tf, frame))
+                st.closed = []
+                out[tf] = frames
+
+            self.dirty.clear()
+            return out
+
+    def _next_frame(self, timeframe, frame):
+        st = self.streams[timeframe]
+        st.seq += 1
+        frame["symbol"] = self.symbol
+        frame["timeframe"] = timeframe
+        frame["seq"] = st.seq
+        return frame
+
+    def _bucket(self, timeframe, ts):
+        secs = TIMEFRAME_SECONDS[timeframe]
+        return (ts // secs) * secs
+
+    # OHLCV/delta + orderflow analytics of the open candle for timeframe (no footprint)
+    def _live_header(self, timeframe):
+        c = self.current_candle
+        base = self.rollups.get(timeframe)
+        if base is None:
+            header = {"time": self._bucket(timeframe, c["time"]), "open": c["open"], "high": c["high"],
+                      "low": c["low"], "close": c["close"], "volume": c["volume"], "delta": c["delta"],
+                      "max_delta": c["max_delta"], "min_delta": c["min_delta"]}
+        else:
+            header = {
+                "time": base["time"], "open": base["open"],
+                "high": max(base["high"], c["high"]), "low": min(base["low"], c["low"]),
+                "close": c["close"],
+                "volume": base["volume"] + c["volume"], "delta": base["delta"] + c["delta"],
+                "max_delta": max(base["max_delta"], base["delta"] + c["max_delta"]),
+                "min_delta": min(base["min_delta"], base["delta"] + c["min_delta"])
+            }
+        header["cvd"] = self.session_delta + c["delta"]
+        header.update(self._timeframe_stats(timeframe).fields(self._label))
+        return header
+
+    # Footprint stats of timeframe's open candle, caught up with the bins touched since the last call
+    def _timeframe_stats(self, timeframe):
+        stats = self.tf_stats[timeframe]
+        pending = self.pending[timeframe]
+        for b in pending:
+            stats.touch(b)
+        pending.clear()
+        return stats
+
+    # Stats over the open bucket of timeframe: closed 1m candles (rollup) + the open 1m candle
+    def _tf_stats(self, timeframe):
+        if timeframe == "1m":
+            return FootprintStats(self.current_candle["footprint"].get if self.current_candle else {}.get)
+
+        def level(b):
+            lvl = self.current_candle["footprint"].get(b) if self.current_candle else None
+            base = self.rollups[timeframe]
+            prev = base["footprint"].get(b) if base is not None else None
+            if prev is None:
+                return lvl
+            if lvl is None:
+                return prev
+            return (lvl[0] + prev[0], lvl[1] + prev[1])
+        return FootprintStats(level)
+
+    def _label(self, b):
+        label = self.labels.get(b)
+        if label is None:
+            label = self.labels[b] = bin_label(b, self.row_units)
+        return label
+
+    # Footprint levels of the open candle for timeframe, restricted to the price bins `keys`
+    def _live_levels(self, timeframe, keys):
+        fp = self.current_candle["footprint"]
+        base = self.rollups.get(timeframe)
+        base_fp = base["footprint"] if base is not None else {}
+        levels = {}
+        for b in sorted(keys):
+            lvl = fp.get(b)
+            prev = base_fp.get(b)
+            buy = (lvl[0] if lvl else 0) + (prev[0] if prev else 0)
+            sell = (lvl[1] if lvl else 0) + (prev[1] if prev else 0)
+            levels[self._label(b)] = {"buy": buy, "sell": sell}
+        return levels
+
+    # Copy of a closed candle with string price keys and its analytics
+    def _serialize(self, candle, stats):
+        out = dict(candle)
+        out["footprint"] = {self._label(b): {"buy": lvl[0], "sell": lvl[1]}
+                            for b, lvl in sorted(candle["footprint"].items())}
+        out["cvd"] = self.session_delta
+        out.update(stats.fields(self._label))
+        return out
+
+    # Full copy of the open candle for timeframe
+    def _live_view(self, timeframe):
+        c = self.current_candle
+        if c is None:
+            return None
+        view = {"symbol": self.symbol}
+        view.update(self._live_header(timeframe))
+        base = self.rollups.get(timeframe)
+        keys = c["footprint"].keys() if base is None else c["footprint"].keys() | base["footprint"].keys()
+        view["footprint"] = self._live_levels(timeframe, keys)
+        return view
+
+    # Forget the in-progress candles (e.g. ingestor restarted, ticks were missed)
+    def reset(self):
+        with self.lock:
+            self.current_candle = None
+            self.last_minute = None
+            self._init_state()
+
+    # Closes the 1m candle, rolls it into every higher timeframe and closes those whose
+    # bucket ends before next_minute. Partial first candles are not handed to on_close.
+    def close_candle(self, next_minute=None):
+        closed = self.current_candle
+        if closed is None:
+            # Buckets restored before the first live tick (restore) may have ended meanwhile
+            for tf, secs in self.higher:
+                r = self.rollups[tf]
+                if r is not None and (next_minute is None or (next_minute // secs) * secs != r["time"]):
+                    self._emit_close(tf, r, self._timeframe_stats(tf))
+                    self.rollups[tf] = None
+                    self.tf_stats[tf] = self._tf_stats(tf)
+            return
+
+        self.session_delta += closed["delta"]
+        self._emit_close("1m", closed, self._timeframe_stats("1m"))
+        for tf, secs in self.higher:
+            # Catch up while the open 1m candle still counts separately from the rollup
+            stats = self._timeframe_stats(tf)
+            r = self.rollups[tf]
+            if r is None:
+                r = self._new_rollup(tf, closed)
+                self.rollups[tf] = r
+            else:
+                merge_candle(r, closed)
+            if next_minute is None or (next_minute // secs) * secs != r["time"]:
+                self._emit_close(tf, r, stats)
+                self.rollups[tf] = None
+                self.tf_stats[tf] = self._tf_stats(tf)
+
+    def _new_rollup(self, timeframe, c):
+        r = dict(c)
+        r["time"] = self._bucket(timeframe, c["time"])
+        r["footprint"] = {b: list(lvl) for b, lvl in c["footprint"].items()}
+        return r
+
+    def _emit_close(self, timeframe, candle, stats):
+        was_partial = self.partial[timeframe]
+        self.partial[timeframe] = False
+        candle = self._serialize(candle, stats)
+
+        st = self.streams[timeframe]
+        if len(st.closed) < MAX_PENDING_CLOSED:
+            st.closed.append(candle)
+
+        if was_partial or not self.on_close:
+            return
+        try:
+            self.on_close(self.symbol, timeframe, candle)
+        except Exception as e:
+            print(f"Candle Close Error: {e}")
+
     # Start a fresh Candle
     def reset_candle(self, timestamp, price):
         self.current_candle = {
+            "symbol": self.symbol,
             "time": timestamp, # Lightweight Charts expects seconds
             "open": price,
             "high": price,
@@ -58,7 +352,144 @@ class CandleAggregator:
             "volume": 0,
 
             "delta": 0,
+            # Running delta extremes, set by the candle's first tick
+            "max_delta": float("-inf"),
+            "min_delta": float("inf"),
             "footprint": {}
         }
+        self.tf_stats["1m"] = self._tf_stats("1m")
+        self.pending["1m"].clear()
+        self.dirty.clear()
+
+        # New UTC session: CVD starts over
+        day = session_start(timestamp)
+        if day != self.session:
+            self.session = day
+            self.session_delta = 0.0
+
+    # Restart recovery (recovery.py): prepends what the open candles missed before the first live tick.
+    # minute: the first live minute, pre_closed: closed 1m candles (time order) of the open buckets and of the
+    # session before it, pre_current: ticks of that minute before the first live tick (a candle, or None).
+    # Footprints are keyed by price bin. complete: timeframe -> True when the DB had every earlier tick of
+    # the candle, which then counts as a full candle (streamed as such and persisted on close).
+    def restore(self, minute, pre_closed, pre_current, complete):
+        with self.lock:
+            c = self.current_candle
+            # The first live minute already closed (partial): its earlier ticks go into the rollups only
+            tail = pre_current if c is not None and c["time"] > minute else None
+
+            if c is None and pre_current is not None:
+                self.current_candle = _copy_candle(pre_current, minute)
+                self.current_candle["symbol"] = self.symbol
+                self.last_minute = minute
+                self.partial["1m"] = not complete.get("1m", False)
+            elif c is not None and c["time"] == minute:
+                if pre_current is not None:
+                    self.current_candle = _prepended(pre_current, c, minute)
+                self.partial["1m"] = not complete.get("1m", False)
+
+            for tf, secs in self.higher:
+                bucket = (minute // secs) * secs
+                r = self.rollups[tf]
+                live_bucket = r["time"] if r is not None else (
+                    self._bucket(tf, self.current_candle["time"]) if self.current_candle else bucket)
+                if live_bucket != bucket:
+                    continue # That bucket closed (partial) before the DB part was ready
+                pre = None
+                for p in [p for p in pre_closed if p["time"] >= bucket] + ([tail] if tail else []):
+                    if pre is None:
+                        pre = _copy_candle(p, bucket)
+                    else:
+                        merge_candle(pre, p)
+                if pre is not None:
+                    self.rollups[tf] = _prepended(pre, r, bucket) if r is not None else pre
+                self.partial[tf] = not complete.get(tf, False)
+
+            # Session CVD: delta of the session's candles the live side never saw
+            if self.session is None:
+                self.session = session_start(minute)
+            for p in pre_closed + ([tail] if tail else []):
+                if session_start(p["time"]) == self.session:
+                    self.session_delta += p["delta"]
+
+            # Footprint stats start over with every row of the rebuilt candles, the next frame sends them all
+            fp = self.current_candle["footprint"] if self.current_candle else {}
+            for tf in self.timeframes:
+                self.tf_stats[tf] = self._tf_stats(tf)
+                self.pending[tf].update(fp)
+                base = self.rollups.get(tf)
+                if base is not None:
+                    self.pending[tf].update(base["footprint"])
+                self.dirty.update(self.pending[tf])
+
+# Adds candle `c` (later in time) into `into`, in place
+def merge_candle(into, c):
+    if c["high"] > into["high"]: into["high"] = c["high"]
+    if c["low"] < into["low"]: into["low"] = c["low"]
+    into["close"] = c["close"]
+    into["volume"] += c["volume"]
+    # c's running delta starts where into's ended
+    into["max_delta"] = max(into["max_delta"], into["delta"] + c["max_delta"])
+    into["min_delta"] = min(into["min_delta"], into["delta"] + c["min_delta"])
+    into["delta"] += c["delta"]
+    fp = into["footprint"]
+    for b, lvl in c["footprint"].items():
+        cur = fp.get(b)
+        if cur is None:
+            fp[b] = list(lvl)
+        else:
+            cur[0] += lvl[0]
+            cur[1] += lvl[1]
+
+# Copy of candle c (footprint included) at `time`
+def _copy_candle(c, time):
+    out = dict(c)
+    out["time"] = time
+    out["footprint"] = {b: list(lvl) for b, lvl in c["footprint"].items()}
+    return out
+
+# New candle at `time`: `pre` followed by `c`
+def _prepended(pre, c, time):
+    out = _copy_candle(pre, time)
+    merge_candle(out, c)
+    if "symbol" in c:
+        out["symbol"] = c["symbol"]
+    return out
+
+# One CandleAggregator per symbol.
+# Adding a market is a dict entry, the ingestor looks aggregators up by the stream's symbol.
+class AggregatorRegistry:
+    def __init__(self, on_close=None):
+        self.aggregators = {}
+        self.on_close = on_close
+        self.lock = threading.Lock()
+
+    # Returns the aggregator for symbol, creating it on first use
+    def get(self, symbol):
+        symbol = symbol.upper()
+        agg = self.aggregators.get(symbol)
+        if agg is None:
+            with self.lock:
+                agg = self.aggregators.get(symbol)
+                if agg is None:
+                    agg = CandleAggregator(symbol, on_close=self.on_close)
+                    self.aggregators[symbol] = agg
+        return agg
+
+    # Returns the aggregator for symbol or None (never creates one)
+    def find(self, symbol):
+        return self.aggregators.get(symbol.upper())
+
+    def remove(self, symbol):
+        with self.lock:
+            self.aggregators.pop(symbol.upper(), None)
+
+    def set_on_close(self, on_close):
+        self.on_close = on_close
+        for agg in list(self.aggregators.values()):
+            agg.on_close = on_close
+
+    def symbols(self):
+        return list(self.aggregators.keys())
 
-aggregator = CandleAggregator()
\ No newline at end of file
+registry = AggregatorRegistry()
@@ -0,0 +1,309 @@
+# Session Volume Profile + TPO, computed server-side from tick-exact footprints.
+# A session is a UTC day (same as the frontend's prepareVPData / prepareTPOData). Its inputs are the closed
+# 1m candles: the footprint gives the traded volume per price (every tick, no spreading of a candle's volume
+# over its high-low range), high/low per 30m period give the TPO letters.
+#
+# Per session only the raw accumulators are kept (NumPy: price units + [buy, sell], high/low per TPO period);
+# row size, block size and value area % are applied when a profile is rendered (a few NumPy passes).
+# Candles are read from the rollup table directly, not through the hot tier: a day of 1m candles would
+# evict the live ring's contents.
+#   - completed sessions: built once, cached (LRU) when the coverage index has no gap in the day
+#   - live session: fed by the aggregator's 1m closes (on_candle), caught up from the DB if a candle was
+#     missed, the open candle is added at render time only
+import os
+import threading
+from collections import OrderedDict
+from operator import itemgetter
+from datetime import datetime
+import numpy as np
+from binning import PRICE_SCALE, size_to_units
+from coverage_index import coverage
+from processing import registry
+from footprint import load_closed_candles_async, closed_window
+
+SESSION_SECONDS = 86400
+TPO_PERIOD_SECONDS = 1800
+TPO_PERIODS = SESSION_SECONDS // TPO_PERIOD_SECONDS
+TPO_LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXabcdefghijklmnopqrstuvwx"   # one per 30m period of the day
+PROFILE_CACHE_SESSIONS = int(os.getenv("PROFILE_CACHE_SESSIONS", "256"))
+MAX_PROFILE_DAYS = 30
+
+_units = {} # footprint key -> price units
+_BUY = itemgetter("buy")
+_SELL = itemgetter("sell")
+
+def label_units(label):
+    u = _units.get(label)
+    if u is None:
+        u = _units[label] = int(round(float(label) * PRICE_SCALE))
+    return u
+
+# Price units of many footprint keys (known keys resolve with one C-level lookup each)
+def labels_units(keys):
+    units = list(map(_units.get, keys))
+    if None in units:
+        units = list(map(label_units, keys))
+    return np.fromiter(units, dtype=np.int64, count=len(units))
+
+class SessionData:
+    def __init__(self, start_s):
+        self.start = start_s
+        self.covered_until = start_s # every 1m candle before this is merged
+        self.units = np.empty(0, dtype=np.int64)   # price units (ascending)
+        self.qty = np.empty((2, 0))                 # [buy, sell] per price
+        self.highs = np.full(TPO_PERIODS, -np.inf)  # per TPO period of the day
+        self.lows = np.full(TPO_PERIODS, np.inf)
+
+    # Merges closed 1m candles (time order), skipping those already in: the footprint levels of all of them
+    # become flat units / buy / sell columns, combined with the session's levels in one unique + bincount pass
+    def add_candles(self, candles):
+        candles = [c for c in candles if c["time"] >= self.covered_until]
+        if not candles:
+            return
+        keys = [k for c in candles for k in c["footprint"]]
+        levels = [lvl for c in candles for lvl in c["footprint"].values()]
+        n = len(keys)
+        units = np.concatenate([self.units, labels_units(keys)])
+        buy = np.concatenate([self.qty[0], np.fromiter(map(_BUY, levels), dtype=np.float64, count=n)])
+        sell = np.concatenate([self.qty[1], np.fromiter(map(_SELL, levels), dtype=np.float64, count=n)])
+        self.units, inv = np.unique(units, return_inverse=True)
+        self.qty = np.stack([np.bincount(inv, weights=buy, minlength=len(self.units)),
+                             np.bincount(inv, weights=sell, minlength=len(self.units))])
+
+        times = np.fromiter((c["time"] for c in candles), dtype=np.int64, count=len(candles))
+        periods = (times - self.start) // TPO_PERIOD_SECONDS
+        highs = np.fromiter((c["high"] for c in candles), dtype=np.float64, count=len(candles))
+        lows = np.fromiter((c["low"] for c in candles), dtype=np.float64, count=len(candles))
+        np.maximum.at(self.highs, periods, highs)
+        np.minimum.at(self.lows, periods, lows)
+        self.covered_until = int(times[-1]) + 60
+
+    # (units, buy, sell, period index, period high, period low)
+    def arrays(self):
+        periods = np.flatnonzero(np.isfinite(self.highs))
+        return (self.units, self.qty[0], self.qty[1], periods, self.highs[periods], self.lows[periods])
+
+# Value area: from the POC row, add the larger neighbour (above first on ties) until pct of the total.
+# Returns the lowest and highest row index inside.
+def value_area(counts, poc, pct):
+    target = counts.sum() * pct
+    current = counts[poc]
+    up, down = poc + 1, poc - 1
+    n = len(counts)
+    while current < target:
+        up_v = counts[up] if up < n else None
+        down_v = counts[down] if down >= 0 else None
+        if up_v is not None and (down_v is None or up_v >= down_v):
+            current += up_v
+            up += 1
+        elif down_v is not None:
+            current += down_v
+            down -= 1
+        else:
+            break
+    return down + 1, up - 1
+
+def _price(units):
+    return np.round(units / PRICE_SCALE, 8)
+
+def volume_profile(units, buy, sell, row_size, va_pct):
+    if len(units) == 0:
+        return None
+    row_units = size_to_units(row_size)
+    rows, inv = np.unique(units // row_units, return_inverse=True)
+    row_buy = np.bincount(inv, weights=buy, minlength=len(rows))
+    row_sell = np.bincount(inv, weights=sell, minlength=len(rows))
+    vol = row_buy + row_sell
+    poc = int(np.argmax(vol))
+    lo, hi = value_area(vol, poc, va_pct)
+    prices = _price(rows * row_units).tolist()
+
+    return {
+        "rowSize": row_size,
+        "rows": [
+            {"price": p, "vol": v, "buy": b, "sell": s}
+            for p, v, b, s in zip(prices, vol.tolist(), row_buy.tolist(), row_sell.tolist())
+        ],
+        "maxVolume": float(vol[poc]),
+        "totalVolume": float(vol.sum()),
+        "levels": {"poc": prices[poc], "val": prices[lo], "vah": prices[hi]},
+        "stats": {
+            "above": float(vol[poc + 1:].sum()),
+            "below": float(vol[:poc].sum()),
+            "minPrice": prices[0],
+            "maxPrice": prices[-1],
+        },
+    }
+
+def tpo_profile(start_s, periods, highs, lows, block_size, va_pct, single_print_min):
+    if len(periods) == 0:
+        return None
+    order = np.argsort(periods)
+    periods, highs, lows = periods[order], highs[order], lows[order]
+
+    # Every block between each period's low and high row
+    block_units = size_to_units(block_size)
+    lo_b = np.rint(lows * PRICE_SCALE).astype(np.int64) // block_units
+    hi_b = np.rint(highs * PRICE_SCALE).astype(np.int64) // block_units
+    n_blocks = hi_b - lo_b + 1
+    first = np.repeat(np.cumsum(n_blocks) - n_blocks, n_blocks)
+    blocks = np.repeat(lo_b, n_blocks) + (np.arange(n_blocks.sum()) - first)
+    block_period = np.repeat(periods, n_blocks)
+
+    rows, inv, counts = np.unique(blocks, return_inverse=True, return_counts=True)
+    poc = int(np.argmax(counts))
+    lo, hi = value_area(counts, poc, va_pct)
+    prices = _price(rows * block_units).tolist()
+
+    # Runs of single prints (one TPO), at least single_print_min rows long
+    single = []
+    run = []
+    for p, c in zip(prices, counts.tolist()):
+        if c == 1:
+            run.append(p)
+        else:
+            if len(run) >= single_print_min:
+                single.extend(run)
+            run = []
+    if len(run) >= single_print_min:
+        single.extend(run)
+
+    block_prices = _price(blocks * block_units).tolist()
+    return {
+        "blockSize": block_size,
+        "blocks": [
+            {"price": p, "slotIndex": s, "time": start_s + s * TPO_PERIOD_SECONDS, "letter": TPO_LETTERS[s % len(TPO_LETTERS)]}
+            for p, s in zip(block_prices, block_period.tolist())
+        ],
+        "rowCounts": dict(zip(prices, counts.tolist())),
+        "maxStack": int(counts[poc]),
+        "levels": {"poc": prices[poc], "val": prices[lo], "vah": prices[hi]},
+        "singlePrints": single,
+        "stats": {
+            "above": int(counts[poc + 1:].sum()),
+            "below": int(counts[:poc].sum()),
+            "minPrice": prices[0],
+            "maxPrice": prices[-1],
+        },
+    }
+
+class ProfileEngine:
+    def __init__(self, max_sessions=PROFILE_CACHE_SESSIONS):
+        self.max_sessions = max_sessions
+        self.completed = OrderedDict() # (symbol, session start) -> SessionData (LRU)
+        self.live = {}                 # symbol -> SessionData of the current session
+        self.lock = threading.Lock()
+
+        # Stats
+        self.hits = 0
+        self.builds = 0
+
+    # Aggregator close hook (ingestor): every closed 1m candle extends the live session when contiguous
+    def on_candle(self, symbol, timeframe, candle):
+        if timeframe != "1m":
+            return
+        with self.lock:
+            session = self.live.get(symbol.upper())
+            if session and session.covered_until == candle["time"]:
+                session.add_candles([candle])
+
+    # Profiles of the last `days` sessions (oldest first), the current one included
+    async def get_profiles(self, symbol, days=1, row_size=10.0, va_pct=0.7, block_size=50.0, single_print_min=1):
+        symbol = symbol.upper()
+        now_s = datetime.now().timestamp()
+        today = int(now_s // SESSION_SECONDS) * SESSION_SECONDS
+        _, settled_end = closed_window(60, 1, now_s)
+
+        out = []
+        for start in range(today - (days - 1) * SESSION_SECONDS, today + 1, SESSION_SECONDS):
+            if start == today:
+                session = await self._live_session(symbol, start, settled_end)
+                extra = self._open_candle(symbol, start)
+            else:
+                session = await self._completed_session(symbol, start)
+                extra = None
+            profile = self._render(session, extra, row_size, va_pct, block_size, single_print_min)
+            if profile:
+                profile["complete"] = start != today
+                out.append(profile)
+        return out
+
+    async def _completed_session(self, symbol, start):
+        key = (symbol, start)
+        with self.lock:
+            session = self.completed.get(key)
+            if session is not None:
+                self.completed.move_to_end(key)
+                self.hits += 1
+                return session
+
+        session = SessionData(start)
+        session.add_candles(await load_closed_candles_async(symbol, "1m", start, start + SESSION_SECONDS))
+        session.covered_until = start + SESSION_SECONDS
+        self.builds += 1
+        # Days with missing ticks are rebuilt next time (a sync may fill them meanwhile)
+        if not coverage.gaps(symbol, start * 1000, (start + SESSION_SECONDS) * 1000):
+            with self.lock:
+                self.completed[key] = session
+                while len(self.completed) > self.max_sessions:
+                    self.completed.popitem(last=False)
+        return session
+
+    async def _live_session(self, symbol, start, settled_end):
+        with self.lock:
+            session = self.live.get(symbol)
+            if session is None or session.start != start:
+                session = self.live[symbol] = SessionData(start)
+            behind = session.covered_until
+        # Catch up on closed candles the hook did not deliver (first request, missed closes, restart)
+        if behind < settled_end:
+            candles = await load_closed_candles_async(symbol, "1m", behind, settled_end)
+            with self.lock:
+                session.add_candles(candles)
+                session.covered_until = max(session.covered_until, settled_end)
+        return session
+
+    # The still-open 1m candle of the live aggregator, not merged into the session
+    def _open_candle(self, symbol, start):
+        aggregator = registry.find(symbol)
+        candle = aggregator.snapshot("1m") if aggregator else None
+        if candle and candle["time"] >= start:
+            return candle
+        return None
+
+    def _render(self, session, extra, row_size, va_pct, block_size, single_print_min):
+        with self.lock:
+            arrays = session.arrays()
+        if extra:
+            tmp = SessionData(session.start)
+            tmp.add_candles([extra])
+            arrays = tuple(np.concatenate(pair) for pair in zip(arrays, tmp.arrays()))
+        units, buy, sell, periods, highs, lows = arrays
+        if len(units) == 0:
+            return None
+
+        if extra:
+            # The open candle's TPO period may already be in the session: merge high/low per period
+            uniq, inv = np.unique(periods, return_inverse=True)
+            highs_m = np.full(len(uniq), -np.inf)
+            lows_m = np.full(len(uniq), np.inf)
+            np.maximum.at(highs_m, inv, highs)
+            np.minimum.at(lows_m, inv, lows)
+            periods, highs, lows = uniq, highs_m, lows_m
+
+        return {
+            "time": session.start,
+            "volumeProfile": volume_profile(units, buy, sell, row_size, va_pct),
+            "tpo": tpo_profile(session.start, periods, highs, lows, block_size, va_pct, single_print_min),
+        }
+
+    def stats(self):
+        with self.lock:
+            return {
+                "completed_cached": len(self.completed),
+                "live_sessions": len(self.live),
+                "hits": self.hits,
+                "builds": self.builds,
+            }
+
+engine = ProfileEngine()
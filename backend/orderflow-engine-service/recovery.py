@@ -0,0 +1,101 @@
+# Restart recovery of the live state.
+#   1. replay_journal (startup, before the ingestor runs): ticks the previous process received but never
+#      confirmed in market_ticks (journal.py) are written again.
+#   2. recover_open_candles (per symbol, when its stream starts): the open candle of every live timeframe is
+#      rebuilt up to the first live tick and prepended to the aggregator (CandleAggregator.restore):
+#        - downtime before that tick is downloaded (at most RECOVERY_SYNC_MINUTES),
+#        - closed 1m candles of the open buckets and of the session come from the rollup table,
+#        - the first live minute's earlier ticks from market_ticks.
+#      An open candle whose range has no coverage gap is then complete: streamed and persisted like any other.
+# The work is bounded: one journal segment batch at a time, one session of 1m rollups and one minute of ticks.
+import os
+import time
+from aggregation import TIMEFRAME_SECONDS, aggregate_ticks
+from binning import PRICE_SCALE
+from coverage_index import coverage
+from footprint import load_closed_candles
+from historical import copy_ticks_to_db, fetch_binance_agg_trades
+from journal import leftover_segments, read_segment
+from orderflow import session_start
+from processing import registry
+from rollups import load_tick_arrays
+
+RECOVERY_SYNC_MINUTES = int(os.getenv("RECOVERY_SYNC_MINUTES", "60"))
+RECOVERY_FIRST_TICK_WAIT = float(os.getenv("RECOVERY_FIRST_TICK_WAIT", "10"))   # seconds
+
+# Writes the leftover journal segments to market_ticks and deletes them. Returns the number of ticks.
+# A segment that fails stays on disk for the next startup.
+def replay_journal():
+    paths = leftover_segments()
+    if not paths:
+        return 0
+    t0 = time.perf_counter()
+    total = 0
+    for path in paths:
+        ok = True
+        for batch in read_segment(path):
+            if not copy_ticks_to_db(batch):
+                ok = False
+                break
+            total += len(batch)
+        if not ok:
+            print(f"⚠️ Tick journal replay failed at {os.path.basename(path)}, kept for the next start")
+            break
+        os.remove(path)
+    print(f"📒 Tick journal: replayed {total} ticks from {len(paths)} segment(s) in {time.perf_counter() - t0:.2f}s")
+    return total
+
+# Candle from the rollup table / aggregate_ticks -> aggregator shape (footprint keyed by price bin)
+def _binned(c, row_units):
+    fp = {}
+    for key, lvl in c["footprint"].items():
+        b = int(round(float(key) * PRICE_SCALE)) // row_units
+        cur = fp.get(b)
+        if cur is None:
+            fp[b] = [lvl["buy"], lvl["sell"]]
+        else:
+            cur[0] += lvl["buy"]
+            cur[1] += lvl["sell"]
+    delta = c["delta"]
+    return {
+        "time": c["time"], "open": c["open"], "high": c["high"], "low": c["low"], "close": c["close"],
+        "volume": c["volume"], "delta": delta,
+        # Rollups written before the delta extremes existed: the close is the only known point
+        "max_delta": c["max_delta"] if c.get("max_delta") is not None else delta,
+        "min_delta": c["min_delta"] if c.get("min_delta") is not None else delta,
+        "footprint": fp,
+    }
+
+# Thread target, started by the ingestor for every symbol whose stream (re)starts
+def recover_open_candles(symbol):
+    aggregator = registry.get(symbol)
+    # The first live tick splits the candles: the DB side up to it, the live side from it on
+    aggregator.started.wait(RECOVERY_FIRST_TICK_WAIT)
+    t0 = time.perf_counter()
+    cutoff = aggregator.first_tick or time.time()
+    minute = int(cutoff // 60) * 60
+    buckets = {tf: (minute // TIMEFRAME_SECONDS[tf]) * TIMEFRAME_SECONDS[tf] for tf in aggregator.timeframes}
+    start = min([session_start(minute)] + list(buckets.values()))
+    cutoff_ms = int(cutoff * 1000)
+
+    try:
+        # Downtime: the coverage index knows what is missing (no tolerance for the writer lag here)
+        sync_from = max(start * 1000, cutoff_ms - RECOVERY_SYNC_MINUTES * 60_000)
+        for gap_start, gap_end in coverage.gaps(symbol, sync_from, cutoff_ms):
+            fetch_binance_agg_trades(symbol, gap_start, gap_end)
+        coverage.persist()
+
+        row_units = aggregator.row_units
+        pre_closed = [_binned(c, row_units) for c in load_closed_candles(symbol, "1m", start, minute)]
+        current = aggregate_ticks(*load_tick_arrays(symbol, minute, cutoff), 60, row_units)
+        pre_current = _binned(current[0], row_units) if current else None
+    except Exception as e:
+        print(f"⚠️ Open candle recovery failed ({symbol}): {e}")
+        return
+
+    complete = {tf: not coverage.gaps(symbol, b * 1000, cutoff_ms) for tf, b in buckets.items()}
+    if registry.find(symbol) is not aggregator:
+        return # Stopped or reset meanwhile
+    aggregator.restore(minute, pre_closed, pre_current, complete)
+    print(f"♻️ Recovered {symbol} open candles ({len(pre_closed)} closed 1m, "
+          f"{sum(complete.values())}/{len(complete)} complete) in {time.perf_counter() - t0:.2f}s")
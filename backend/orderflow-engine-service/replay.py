@@ -0,0 +1,178 @@
+# Recorded feeds: capture the raw exchange messages, play them back through the ingestor later.
+# Files are gzip text, one message per line: "<receive time, Unix ms>\t<raw combined-stream message>",
+# one file per UTC hour: RECORD_DIR/<YYYYMMDD-HH>.jsonl.gz
+# The replayer hands every message to the same handler the live socket uses (ingestor.handle_message),
+# so parse -> aggregate -> broadcast -> persist is exercised exactly like in production. Only the
+# bookkeeping differs: replayed ticks never extend the coverage index (ingestor.replay_writer), and their
+# closed candles stay out of the rollup table and the hot tier (ingestor.persist_closed_candle).
+# Pacing follows the recorded receive times: speed 1 = real time, 10 = ten times faster, "max" = no waiting.
+import glob
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+RECORD_DIR = os.getenv("RECORD_DIR", "recordings")
+RECORD_FLUSH_INTERVAL = float(os.getenv("RECORD_FLUSH_INTERVAL", "5"))   # seconds between file flushes
+
+class ReplayError(Exception):
+    pass
+
+# Appends raw messages to the current hour's file. Called from the websocket threads.
+class FeedRecorder:
+    def __init__(self, directory=RECORD_DIR):
+        self.directory = directory
+        self.file = None
+        self.hour = None
+        self.last_flush = 0.0
+        self.closed = False
+        self.lock = threading.Lock()
+
+        # Stats
+        self.messages = 0
+        self.files = 0
+
+    def write(self, message):
+        now_ms = int(time.time() * 1000)
+        hour = now_ms // 3_600_000
+        with self.lock:
+            if self.closed:
+                return # A socket thread still delivering after stop
+            if hour != self.hour:
+                self._rotate(hour)
+            self.file.write(f"{now_ms}\t{message}\n")
+            self.messages += 1
+            if time.monotonic() - self.last_flush >= RECORD_FLUSH_INTERVAL:
+                self.file.flush()
+                self.last_flush = time.monotonic()
+
+    def _rotate(self, hour):
+        if self.file:
+            self.file.close()
+        os.makedirs(self.directory, exist_ok=True)
+        name = datetime.fromtimestamp(hour * 3600, tz=timezone.utc).strftime("%Y%m%d-%H") + ".jsonl.gz"
+        # Appending adds a gzip member, the file stays readable as one stream
+        self.file = gzip.open(os.path.join(self.directory, name), "at", encoding="utf-8")
+        self.hour = hour
+        self.files += 1
+        print(f"⏺️ Recording feed to {name}")
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            if self.file:
+                self.file.close()
+            self.file = None
+            self.hour = None
+
+    def stats(self):
+        return {"recording": self.file is not None, "messages": self.messages, "files": self.files}
+
+# Recording files matching `pattern` (a name or glob inside RECORD_DIR), oldest first.
+# Paths outside RECORD_DIR are refused: the pattern comes from an HTTP parameter.
+def resolve_files(pattern, directory=RECORD_DIR):
+    root = os.path.realpath(directory)
+    paths = sorted(glob.glob(os.path.join(root, pattern or "*.jsonl.gz")))
+    paths = [p for p in paths if os.path.realpath(p).startswith(root + os.sep) and os.path.isfile(p)]
+    if not paths:
+        raise ReplayError(f"No recording matches '{pattern}' in {directory}")
+    return paths
+
+def parse_speed(speed):
+    if speed in (None, "", "max"):
+        return None if speed == "max" else 1.0
+    try:
+        value = float(speed)
+    except ValueError:
+        raise ReplayError(f"Invalid speed '{speed}' (a number > 0 or 'max')")
+    if value <= 0:
+        raise ReplayError("speed must be > 0")
+    return value
+
+# Plays recorded messages in a daemon thread. handler(message, symbols) is the live socket's handler,
+# symbols limits the replay (None = every symbol in the files).
+class FeedReplayer:
+    def __init__(self, files, handler, speed=1.0, symbols=None):
+        self.files = files
+        self.handler = handler
+        self.speed = speed # None = as fast as possible
+        self.symbols = set(symbols) if symbols else None
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.state = "idle"
+        self.error = None
+
+        # Stats
+        self.messages = 0
+        self.started_at = None
+        self.finished_at = None
+        self.first_ms = None
+        self.last_ms = None
+
+    def start(self):
+        self.state = "running"
+        self.started_at = time.monotonic()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def is_alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def _lines(self):
+        for path in self.files:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    yield line.rstrip("\n")
+
+    def _run(self):
+        t0_wall = time.monotonic()
+        try:
+            for line in self._lines():
+                if self.stop_event.is_set():
+                    break
+                recv_ms, sep, message = line.partition("\t")
+                if not sep:
+                    # Plain message per line: pace by the trade time instead
+                    message = recv_ms
+                    recv_ms = json.loads(message).get("data", {}).get("T", 0)
+                recv_ms = int(recv_ms)
+
+                if self.first_ms is None:
+                    self.first_ms = recv_ms
+                self.last_ms = recv_ms
+                if self.speed is not None:
+                    delay = t0_wall + (recv_ms - self.first_ms) / 1000 / self.speed - time.monotonic()
+                    if delay > 0.001 and self.stop_event.wait(delay):
+                        break
+
+                self.handler(message, self.symbols)
+                self.messages += 1
+            self.state = "stopped" if self.stop_event.is_set() else "finished"
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            print(f"⚠️ Replay failed: {e}")
+        self.finished_at = time.monotonic()
+        print(f"⏏️ Replay {self.state}: {self.messages} messages")
+
+    def stats(self):
+        end = self.finished_at or time.monotonic()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        feed_s = (self.last_ms - self.first_ms) / 1000 if self.first_ms is not None else 0.0
+        return {
+            "state": self.state,
+            "error": self.error,
+            "files": [os.path.basename(p) for p in self.files],
+            "speed": self.speed or "max",
+            "symbols": sorted(self.symbols) if self.symbols else None,
+            "messages": self.messages,
+            "elapsed_s": round(elapsed, 3),
+            "feed_s": round(feed_s, 3),
+            "effective_speed": round(feed_s / elapsed, 2) if elapsed > 0 else None,
+            "messages_per_s": round(self.messages / elapsed) if elapsed > 0 else None,
+        }
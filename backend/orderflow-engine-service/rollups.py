@@ -0,0 +1,422 @@
+# Precomputed Rich Candles (OHLCV + Delta + Footprint) per symbol/timeframe.
+# Closed candles are written here by the live aggregator (1m) and by the backfill step,
+# so /history/footprint reads one row per candle instead of re-aggregating raw ticks.
+import asyncio
+import json
+import os
+import numpy as np
+from psycopg2.extras import execute_values, Json
+from database import get_db_connection, release_db_connection
+from aggregation import StreamingAggregator, rows_to_arrays, TIMEFRAME_SECONDS
+from binning import get_row_units, PRICE_SCALE
+from async_db import db, DatabaseUnavailable
+import archive
+
+ROLLUP_TABLE = "footprint_rollups"
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "50000"))   # ticks per server-side cursor fetch
+
+TICK_RANGE_QUERY = """
+    SELECT EXTRACT(EPOCH FROM time)::double precision, price, quantity, is_buyer_maker
+    FROM market_ticks
+    WHERE symbol = %s
+    AND time >= to_timestamp(%s) AND time < to_timestamp(%s)
+    ORDER BY time ASC
+"""
+# SQL aggregation mode: TimescaleDB groups the ticks, Python only receives one row per candle and one per
+# (candle, price row). Bins use the same fixed-point rule as binning.price_bin. time_bucket's default origin
+# (2000-01-03 00:00 UTC) is a whole number of days from the epoch, so buckets match the Python path.
+FOOTPRINT_AGGREGATION = os.getenv("FOOTPRINT_AGGREGATION", "sql")   # "sql" or "python"
+_sql_available = True
+
+SQL_BUCKET = "EXTRACT(EPOCH FROM time_bucket(make_interval(secs => {bucket}), time))::bigint"
+# The running delta (max_delta/min_delta) is a window sum over each bucket in time order
+SQL_BUCKETS_QUERY = """
+    SELECT bucket, first(price, time), max(price), min(price), last(price, time), sum(quantity),
+           sum(signed), max(running), min(running)
+    FROM (
+        SELECT bucket, time, price, quantity, signed,
+               sum(signed) OVER (PARTITION BY bucket ORDER BY time ROWS UNBOUNDED PRECEDING) AS running
+        FROM (
+            SELECT {bucket_expr} AS bucket, time, price, quantity,
+                   CASE WHEN is_buyer_maker THEN -quantity ELSE quantity END AS signed
+            FROM market_ticks
+            WHERE symbol = {symbol}
+            AND time >= to_timestamp({start}) AND time < to_timestamp({end})
+        ) ticks
+    ) running_ticks
+    GROUP BY bucket
+    ORDER BY bucket
+"""
+SQL_LEVELS_QUERY = """
+    SELECT {bucket_expr} AS bucket,
+           round(price * """ + str(PRICE_SCALE) + """)::bigint / {row_units} AS bin,
+           coalesce(sum(quantity) FILTER (WHERE NOT is_buyer_maker), 0),
+           coalesce(sum(quantity) FILTER (WHERE is_buyer_maker), 0)
+    FROM market_ticks
+    WHERE symbol = {symbol}
+    AND time >= to_timestamp({start}) AND time < to_timestamp({end})
+    GROUP BY bucket, bin
+    ORDER BY bucket, bin
+"""
+
+def _sql_queries(params):
+    return tuple(
+        q.format(bucket_expr=SQL_BUCKET.format(bucket=params["bucket"]), **params)
+        for q in (SQL_BUCKETS_QUERY, SQL_LEVELS_QUERY)
+    )
+
+SQL_QUERIES = _sql_queries({"bucket": "%(bucket)s", "symbol": "%(symbol)s", "start": "%(start)s",
+                            "end": "%(end)s", "row_units": "%(row_units)s"})
+SQL_QUERIES_ASYNC = _sql_queries({"bucket": "$1", "symbol": "$2", "start": "$3", "end": "$4", "row_units": "$5"})
+
+# Net delta (buy - sell volume) of a tick range: the session CVD before a page (orderflow.py)
+TICK_DELTA_QUERY = """
+    SELECT coalesce(sum(CASE WHEN is_buyer_maker THEN -quantity ELSE quantity END), 0)
+    FROM market_ticks
+    WHERE symbol = %s
+    AND time >= to_timestamp(%s) AND time < to_timestamp(%s)
+"""
+TICK_DELTA_QUERY_ASYNC = """
+    SELECT coalesce(sum(CASE WHEN is_buyer_maker THEN -quantity ELSE quantity END), 0)
+    FROM market_ticks
+    WHERE symbol = $1
+    AND time >= to_timestamp($2) AND time < to_timestamp($3)
+"""
+
+TICK_RANGE_QUERY_ASYNC = """
+    SELECT EXTRACT(EPOCH FROM time)::double precision, price, quantity, is_buyer_maker
+    FROM market_ticks
+    WHERE symbol = $1
+    AND time >= to_timestamp($2) AND time < to_timestamp($3)
+    ORDER BY time ASC
+"""
+
+def init_rollup_table():
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+                time TIMESTAMPTZ NOT NULL,
+                symbol TEXT NOT NULL,
+                timeframe TEXT NOT NULL,
+                open DOUBLE PRECISION,
+                high DOUBLE PRECISION,
+                low DOUBLE PRECISION,
+                close DOUBLE PRECISION,
+                volume DOUBLE PRECISION,
+                delta DOUBLE PRECISION,
+                max_delta DOUBLE PRECISION,
+                min_delta DOUBLE PRECISION,
+                footprint JSONB NOT NULL,
+                PRIMARY KEY (symbol, timeframe, time)
+            );
+        """)
+        # Tables from before the orderflow analytics: rows written then keep NULL extremes
+        cur.execute(f"""
+            ALTER TABLE {ROLLUP_TABLE}
+            ADD COLUMN IF NOT EXISTS max_delta DOUBLE PRECISION,
+            ADD COLUMN IF NOT EXISTS min_delta DOUBLE PRECISION;
+        """)
+        # Convert to Hypertable (TimescaleDB)
+        try:
+            cur.execute(f"SELECT create_hypertable('{ROLLUP_TABLE}', 'time', if_not_exists => TRUE);")
+        except Exception as e:
+            conn.rollback()
+            print(f"⚠️ Rollup hypertable not created ({e}), using plain table")
+        conn.commit()
+    except Exception as e:
+        print(f"Rollup Table Error: {e}")
+        conn.rollback()
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+# Upserts closed candles. A later write for the same bucket (e.g. backfill after live) wins.
+# Returns False if the write failed.
+def save_rollups(symbol, timeframe, candles):
+    if not candles: return True
+
+    rows = [
+        (c["time"], symbol, timeframe, c["open"], c["high"], c["low"], c["close"],
+         c["volume"], c["delta"], c.get("max_delta"), c.get("min_delta"), Json(c["footprint"]))
+        for c in candles
+    ]
+    query = f"""
+        INSERT INTO {ROLLUP_TABLE} (time, symbol, timeframe, open, high, low, close, volume, delta,
+                                    max_delta, min_delta, footprint)
+        VALUES %s
+        ON CONFLICT (symbol, timeframe, time) DO UPDATE SET
+            open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low, close = EXCLUDED.close,
+            volume = EXCLUDED.volume, delta = EXCLUDED.delta,
+            max_delta = EXCLUDED.max_delta, min_delta = EXCLUDED.min_delta, footprint = EXCLUDED.footprint
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        execute_values(cur, query, rows, template="(to_timestamp(%s), %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)")
+        conn.commit()
+        return True
+    except Exception as e:
+        print(f"Rollup Insert Error: {e}")
+        conn.rollback()
+        return False
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+# Reads precomputed candles with start_s <= time < end_s (Unix seconds), oldest first.
+def load_rollups(symbol, timeframe, start_s, end_s):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(f"""
+            SELECT EXTRACT(EPOCH FROM time)::bigint, open, high, low, close, volume, delta,
+                   max_delta, min_delta, footprint
+            FROM {ROLLUP_TABLE}
+            WHERE symbol = %s AND timeframe = %s
+            AND time >= to_timestamp(%s) AND time < to_timestamp(%s)
+            ORDER BY time ASC
+        """, (symbol, timeframe, start_s, end_s))
+        rows = cur.fetchall()
+    except Exception as e:
+        print(f"Rollup Read Error: {e}")
+        conn.rollback()
+        rows = []
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+    return [
+        {
+            "time": int(t), "open": o, "high": h, "low": l, "close": c,
+            "volume": v, "delta": d, "max_delta": mx, "min_delta": mn,
+            "footprint": fp if isinstance(fp, dict) else json.loads(fp)
+        }
+        for t, o, h, l, c, v, d, mx, mn, fp in rows
+    ]
+
+# Raw ticks with start_s <= time < end_s as column arrays (epoch_seconds, price, qty, is_sell),
+# in time-ordered chunks of at most STREAM_CHUNK_ROWS ticks.
+# Days moved to the archive are sliced from their memory-mapped files, the rest streams from market_ticks
+# through a server-side cursor, so no reader ever holds the whole range.
+def iter_tick_chunks(symbol, start_s, end_s, chunk_rows=None):
+    chunk_rows = chunk_rows or STREAM_CHUNK_ROWS
+    for source, day_s, s, e in archive.split_range(symbol, start_s, end_s):
+        if source == "archive":
+            yield from _slice_chunks(archive.read_day_range(symbol, day_s, s, e), chunk_rows)
+        else:
+            yield from stream_tick_arrays(symbol, s, e, chunk_rows)
+
+def _slice_chunks(columns, chunk_rows):
+    for i in range(0, len(columns[0]), chunk_rows):
+        yield tuple(col[i:i + chunk_rows] for col in columns)
+
+# market_ticks only. Named cursor: rows stay on the server until fetched chunk by chunk.
+def stream_tick_arrays(symbol, start_s, end_s, chunk_rows=None):
+    chunk_rows = chunk_rows or STREAM_CHUNK_ROWS
+    conn = get_db_connection()
+    cur = conn.cursor(name=f"ticks_{symbol.lower()}_{id(conn)}")
+    cur.itersize = chunk_rows
+    try:
+        cur.execute(TICK_RANGE_QUERY, (symbol, start_s, end_s))
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield rows_to_arrays(rows)
+    finally:
+        cur.close()
+        # Ends the read transaction that held the cursor
+        conn.rollback()
+        release_db_connection(conn)
+
+# Whole range as one set of arrays (small ranges only)
+def load_tick_arrays(symbol, start_s, end_s):
+    chunks = list(iter_tick_chunks(symbol, start_s, end_s))
+    if not chunks:
+        return rows_to_arrays([])
+    if len(chunks) == 1:
+        return chunks[0]
+    return tuple(np.concatenate(cols) for cols in zip(*chunks))
+
+# Net delta of the ticks in [start_s, end_s), archived days included
+def tick_delta(symbol, start_s, end_s):
+    total = 0.0
+    for source, day_s, s, e in archive.split_range(symbol, start_s, end_s):
+        if source == "archive":
+            total += _archived_delta(symbol, day_s, s, e)
+            continue
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute(TICK_DELTA_QUERY, (symbol, s, e))
+            total += cur.fetchone()[0]
+            conn.commit()
+        finally:
+            cur.close()
+            release_db_connection(conn)
+    return total
+
+def _archived_delta(symbol, day_s, start_s, end_s):
+    _, _, qtys, is_sell = archive.read_day_range(symbol, day_s, start_s, end_s)
+    return float(np.where(is_sell, -qtys, qtys).sum())
+
+# Aggregates raw ticks into candles for [start_s, end_s) without persisting them.
+# DB ranges are grouped by TimescaleDB (mode "sql", FOOTPRINT_AGGREGATION) or streamed as raw chunks
+# (mode "python", also the fallback); archived days are always sliced from their memory maps.
+# Everything is folded into a StreamingAggregator: memory is bounded by chunk size and candle count.
+def aggregate_tick_range(symbol, timeframe, start_s, end_s, mode=None):
+    bucket_s, row_units = TIMEFRAME_SECONDS[timeframe], get_row_units(symbol)
+    agg = StreamingAggregator(bucket_s, row_units)
+    use_sql = _use_sql(mode)
+    for source, day_s, s, e in archive.split_range(symbol, start_s, end_s):
+        if source == "archive":
+            for chunk in _slice_chunks(archive.read_day_range(symbol, day_s, s, e), STREAM_CHUNK_ROWS):
+                agg.add(*chunk)
+        elif not (use_sql and _add_sql_groups(agg, symbol, s, e, bucket_s, row_units)):
+            for chunk in stream_tick_arrays(symbol, s, e):
+                agg.add(*chunk)
+    return agg.finish()
+
+def _use_sql(mode):
+    return (mode or FOOTPRINT_AGGREGATION) == "sql" and _sql_available
+
+# Without TimescaleDB (first/last/time_bucket missing) SQL mode is switched off for good
+def _sql_failed(e):
+    global _sql_available
+    if "does not exist" in str(e):
+        _sql_available = False
+        print(f"⚠️ SQL footprint aggregation unavailable ({e}), using the Python path")
+    else:
+        print(f"⚠️ SQL footprint aggregation failed ({e}), falling back to the Python path")
+
+# Returns False when the range must go through the Python path instead
+def _add_sql_groups(agg, symbol, start_s, end_s, bucket_s, row_units):
+    params = {"bucket": bucket_s, "symbol": symbol, "start": start_s, "end": end_s, "row_units": row_units}
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(SQL_QUERIES[0], params)
+        buckets = cur.fetchall()
+        cur.execute(SQL_QUERIES[1], params)
+        levels = cur.fetchall()
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        _sql_failed(e)
+        return False
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+    agg.add_grouped(buckets, levels)
+    return True
+
+# Backfill step: builds rollups for [start_s, end_s) from historical ticks.
+# Only buckets listed in `only_buckets` are written when given (used to fill holes).
+def backfill_rollups(symbol, timeframe, start_s, end_s, only_buckets=None):
+    candles = aggregate_tick_range(symbol, timeframe, start_s, end_s)
+    if only_buckets is not None:
+        candles = [c for c in candles if c["time"] in only_buckets]
+    save_rollups(symbol, timeframe, candles)
+    return candles
+
+# Batch entry point for the background writer: items are (symbol, timeframe, candle)
+def save_rollup_batch(items):
+    groups = {}
+    for symbol, timeframe, candle in items:
+        groups.setdefault((symbol, timeframe), []).append(candle)
+    ok = True
+    for (symbol, timeframe), candles in groups.items():
+        ok = save_rollups(symbol, timeframe, candles) and ok
+    return ok
+
+# --- ASYNC (API handlers, asyncpg) ---------------------------------
+# Same queries as above on the asyncpg pool (async_db.py). Fixed SQL text, so each runs as a
+# prepared statement from the connection's statement cache. Aggregation goes to a worker thread.
+
+async def save_rollups_async(symbol, timeframe, candles):
+    if not candles: return True
+    try:
+        await db.executemany(f"""
+            INSERT INTO {ROLLUP_TABLE} (time, symbol, timeframe, open, high, low, close, volume, delta,
+                                        max_delta, min_delta, footprint)
+            VALUES (to_timestamp($1), $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
+            ON CONFLICT (symbol, timeframe, time) DO UPDATE SET
+                open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low, close = EXCLUDED.close,
+                volume = EXCLUDED.volume, delta = EXCLUDED.delta,
+                max_delta = EXCLUDED.max_delta, min_delta = EXCLUDED.min_delta, footprint = EXCLUDED.footprint
+        """, [
+            (float(c["time"]), symbol, timeframe, c["open"], c["high"], c["low"], c["close"],
+             c["volume"], c["delta"], c.get("max_delta"), c.get("min_delta"), c["footprint"])
+            for c in candles
+        ])
+        return True
+    except Exception as e:
+        print(f"Rollup Insert Error: {e}")
+        return False
+
+async def load_rollups_async(symbol, timeframe, start_s, end_s):
+    rows = await db.fetch(f"""
+        SELECT EXTRACT(EPOCH FROM time)::bigint, open, high, low, close, volume, delta,
+               max_delta, min_delta, footprint
+        FROM {ROLLUP_TABLE}
+        WHERE symbol = $1 AND timeframe = $2
+        AND time >= to_timestamp($3) AND time < to_timestamp($4)
+        ORDER BY time ASC
+    """, symbol, timeframe, float(start_s), float(end_s))
+    return [
+        {
+            "time": int(t), "open": o, "high": h, "low": l, "close": c,
+            "volume": v, "delta": d, "max_delta": mx, "min_delta": mn, "footprint": fp
+        }
+        for t, o, h, l, c, v, d, mx, mn, fp in rows
+    ]
+
+async def tick_delta_async(symbol, start_s, end_s):
+    total = 0.0
+    for source, day_s, s, e in archive.split_range(symbol, start_s, end_s):
+        if source == "archive":
+            total += await asyncio.to_thread(_archived_delta, symbol, day_s, s, e)
+        else:
+            rows = await db.fetch(TICK_DELTA_QUERY_ASYNC, symbol, float(s), float(e))
+            total += rows[0][0]
+    return total
+
+async def aggregate_tick_range_async(symbol, timeframe, start_s, end_s, mode=None):
+    bucket_s, row_units = TIMEFRAME_SECONDS[timeframe], get_row_units(symbol)
+    agg = StreamingAggregator(bucket_s, row_units)
+    use_sql = _use_sql(mode)
+    for source, day_s, s, e in archive.split_range(symbol, start_s, end_s):
+        if source == "archive":
+            for chunk in _slice_chunks(archive.read_day_range(symbol, day_s, s, e), STREAM_CHUNK_ROWS):
+                await asyncio.to_thread(agg.add, *chunk)
+        elif not (use_sql and await _add_sql_groups_async(agg, symbol, s, e, bucket_s, row_units)):
+            async for rows in db.iter_chunks(TICK_RANGE_QUERY_ASYNC, symbol, float(s), float(e),
+                                             chunk_rows=STREAM_CHUNK_ROWS):
+                await asyncio.to_thread(agg.add, *rows_to_arrays(rows))
+    return await asyncio.to_thread(agg.finish)
+
+async def _add_sql_groups_async(agg, symbol, start_s, end_s, bucket_s, row_units):
+    args = (float(bucket_s), symbol, float(start_s), float(end_s), row_units)
+    try:
+        # Two connections, both groupings run at once
+        buckets, levels = await asyncio.gather(
+            db.fetch(SQL_QUERIES_ASYNC[0], *args[:4]),
+            db.fetch(SQL_QUERIES_ASYNC[1], *args)
+        )
+    except DatabaseUnavailable:
+        raise
+    except Exception as e:
+        _sql_failed(e)
+        return False
+    await asyncio.to_thread(agg.add_grouped, buckets, levels)
+    return True
+
+async def backfill_rollups_async(symbol, timeframe, start_s, end_s, only_buckets=None):
+    candles = await aggregate_tick_range_async(symbol, timeframe, start_s, end_s)
+    if only_buckets is not None:
+        candles = [c for c in candles if c["time"] in only_buckets]
+    await save_rollups_async(symbol, timeframe, candles)
+    return candles
@@ -0,0 +1,5 @@
+# The service is a flat set of modules (imported by name, as main.py does): the tests import them the same way
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
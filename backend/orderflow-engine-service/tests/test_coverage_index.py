@@ -0,0 +1,79 @@
+import coverage_index
+from coverage_index import IntervalSet, CoverageIndex
+
+def test_add_merges_overlapping_and_touching():
+    s = IntervalSet([(10, 20), (30, 40)])
+    s.add(20, 25)   # touches the first
+    s.add(38, 50)   # overlaps the second
+    assert s.intervals() == [(10, 25), (30, 50)]
+
+def test_add_bridges_several_intervals():
+    s = IntervalSet([(0, 5), (10, 15), (20, 25), (40, 45)])
+    s.add(3, 22)
+    assert s.intervals() == [(0, 25), (40, 45)]
+
+def test_add_keeps_disjoint_intervals_sorted():
+    s = IntervalSet()
+    for start, end in [(50, 60), (10, 20), (30, 40)]:
+        s.add(start, end)
+    assert s.intervals() == [(10, 20), (30, 40), (50, 60)]
+    assert s.earliest() == 10
+    assert s.latest() == 60
+
+def test_add_ignores_empty_intervals():
+    s = IntervalSet()
+    s.add(10, 10)
+    s.add(20, 10)
+    assert s.intervals() == []
+    assert s.latest() is None
+
+def test_gaps_of_empty_set_is_whole_range():
+    assert IntervalSet().gaps(0, 100) == [(0, 100)]
+
+def test_gaps_between_and_around_intervals():
+    s = IntervalSet([(10, 20), (30, 40)])
+    assert s.gaps(0, 50) == [(0, 10), (20, 30), (40, 50)]
+    assert s.gaps(15, 35) == [(20, 30)]
+    assert s.gaps(10, 20) == []
+    assert s.covers(12, 18)
+    assert not s.covers(12, 31)
+
+def test_gaps_at_interval_edges():
+    s = IntervalSet([(10, 20)])
+    # [start, end): an interval ending at the range start covers nothing of it
+    assert s.gaps(20, 30) == [(20, 30)]
+    assert s.gaps(0, 10) == [(0, 10)]
+
+def test_trim_before_cuts_and_drops():
+    s = IntervalSet([(0, 10), (20, 30), (40, 50)])
+    s.trim_before(25)
+    assert s.intervals() == [(25, 30), (40, 50)]
+    s.trim_before(30)
+    assert s.intervals() == [(40, 50)]
+
+def _index(monkeypatch):
+    index = CoverageIndex()
+    monkeypatch.setattr(index, "persist", lambda wait=True: True)
+    return index
+
+def test_extend_live_joins_consecutive_batches(monkeypatch):
+    index = _index(monkeypatch)
+    index.extend_live("btcusdt", 1000, 1500)
+    index.extend_live("BTCUSDT", 1800, 2000)
+    assert index.gaps("BTCUSDT", 1000, 2001) == []
+
+def test_break_live_starts_a_new_range(monkeypatch):
+    index = _index(monkeypatch)
+    index.extend_live("BTCUSDT", 1000, 1500)
+    index.break_live("BTCUSDT")
+    index.extend_live("BTCUSDT", 1800, 2000)
+    assert index.gaps("BTCUSDT", 1000, 2001) == [(1501, 1800)]
+
+def test_failed_persist_keeps_symbols_dirty(monkeypatch):
+    def unavailable():
+        raise Exception("DB Pool is not initialized")
+    monkeypatch.setattr(coverage_index, "get_db_connection", unavailable)
+    index = CoverageIndex()
+    index.mark_loaded("BTCUSDT", 0, 1000, persist=False)
+    assert index.persist() is False
+    assert index.dirty == {"BTCUSDT"}
@@ -0,0 +1,69 @@
+from datetime import datetime
+import pytest
+import footprint
+from footprint import encode_cursor, decode_cursor, resolve_range
+
+NOW = 1_700_000_030   # 30s into a minute
+LATEST_END = 1_700_000_040   # end of the open 1m bucket
+
+class FrozenDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return datetime.fromtimestamp(NOW, tz)
+
+@pytest.fixture(autouse=True)
+def frozen_now(monkeypatch):
+    monkeypatch.setattr(footprint, "datetime", FrozenDatetime)
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("BTCUSDT", "5m", 1_699_999_800)
+    assert "=" not in cursor
+    assert decode_cursor(cursor, "BTCUSDT", "5m") == 1_699_999_800
+
+def test_cursor_of_another_symbol_or_timeframe_is_rejected():
+    cursor = encode_cursor("BTCUSDT", "1m", 1_699_999_800)
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, "ETHUSDT", "1m")
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, "BTCUSDT", "5m")
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "!!!", encode_cursor("BTCUSDT", "1m", "x")])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, "BTCUSDT", "1m")
+
+def test_default_is_latest_window():
+    assert resolve_range("BTCUSDT", "1m", 10) == (LATEST_END - 600, LATEST_END)
+
+def test_start_only_pages_forward():
+    assert resolve_range("BTCUSDT", "1m", 5, start=1_699_990_030) == (1_699_990_020, 1_699_990_320)
+
+def test_end_is_rounded_up_to_a_whole_bucket():
+    assert resolve_range("BTCUSDT", "1m", 5, end=1_699_990_030) == (1_699_989_780, 1_699_990_080)
+
+def test_end_in_the_future_is_clamped():
+    assert resolve_range("BTCUSDT", "1m", 5, end=NOW + 3600) == (LATEST_END - 300, LATEST_END)
+
+def test_long_range_keeps_the_newest_limit_buckets():
+    start_s, end_s = resolve_range("BTCUSDT", "1m", 5, start=1_699_000_000, end=1_699_990_080)
+    assert (start_s, end_s) == (1_699_989_780, 1_699_990_080)
+
+def test_range_in_the_future_is_empty():
+    start_s, end_s = resolve_range("BTCUSDT", "1m", 5, start=NOW + 3600)
+    assert start_s == end_s
+
+def test_since_starts_at_its_bucket():
+    assert resolve_range("BTCUSDT", "1m", 60, since=LATEST_END - 90) == (LATEST_END - 120, LATEST_END)
+
+def test_cursor_page_ends_at_the_cursor():
+    cursor = encode_cursor("BTCUSDT", "1m", 1_699_990_080)
+    assert resolve_range("BTCUSDT", "1m", 5, cursor=cursor) == (1_699_989_780, 1_699_990_080)
+
+@pytest.mark.parametrize("params", [
+    {"cursor": encode_cursor("BTCUSDT", "1m", 1_699_990_080), "start": 1_699_989_000},
+    {"cursor": encode_cursor("BTCUSDT", "1m", 1_699_990_080), "since": 1_699_989_000},
+    {"since": 1_699_989_000, "end": 1_699_990_000},
+])
+def test_conflicting_parameters_are_rejected(params):
+    with pytest.raises(ValueError):
+        resolve_range("BTCUSDT", "1m", 5, **params)
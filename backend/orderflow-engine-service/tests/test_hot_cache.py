@@ -0,0 +1,70 @@
+from hot_cache import CandleRing
+
+BUCKET = 60
+
+def candle(t, close=100.0, footprint=None, **analytics):
+    fp = footprint if footprint is not None else {"100": {"buy": 1.0, "sell": 0.5}}
+    c = {"time": t, "open": 100.0, "high": 101.0, "low": 99.0, "close": close, "volume": 1.5, "delta": 0.5,
+         "footprint": fp}
+    c.update(analytics)
+    return c
+
+def times(ring):
+    return [c["time"] for c in ring.read_all()]
+
+def test_put_evicts_the_oldest_and_moves_the_covered_start():
+    ring = CandleRing(BUCKET, capacity=3)
+    for i in range(5):
+        ring.add_live(candle(i * BUCKET))
+    assert times(ring) == [2 * BUCKET, 3 * BUCKET, 4 * BUCKET]
+    assert (ring.lo, ring.hi) == (2 * BUCKET, 5 * BUCKET)
+    assert not ring.covers(BUCKET, 3 * BUCKET)
+    assert ring.covers(2 * BUCKET, 5 * BUCKET)
+
+def test_put_replaces_the_same_bucket():
+    ring = CandleRing(BUCKET, capacity=3)
+    ring.add_live(candle(0, close=1.0))
+    ring.add_live(candle(BUCKET))
+    ring.put(candle(0, close=2.0))
+    assert ring.count == 2
+    assert ring.read(0, BUCKET)[0]["close"] == 2.0
+
+def test_live_gap_starts_a_new_covered_range():
+    ring = CandleRing(BUCKET, capacity=10)
+    ring.add_live(candle(0))
+    ring.add_live(candle(BUCKET))
+    ring.live_gap = True   # stream reconnected (HotCache.reset_live)
+    ring.add_live(candle(5 * BUCKET))
+    assert (ring.lo, ring.hi) == (5 * BUCKET, 6 * BUCKET)
+    assert times(ring) == [0, BUCKET, 5 * BUCKET]
+
+def test_fill_merges_with_a_touching_live_range():
+    ring = CandleRing(BUCKET, capacity=10)
+    ring.add_live(candle(5 * BUCKET, close=7.0))
+    ring.fill([candle(t * BUCKET, close=1.0) for t in (1, 2, 5)], BUCKET, 5 * BUCKET + BUCKET)
+    assert (ring.lo, ring.hi) == (BUCKET, 6 * BUCKET)
+    assert times(ring) == [BUCKET, 2 * BUCKET, 5 * BUCKET]
+    # The live candle wins inside the live range
+    assert ring.read(5 * BUCKET, 6 * BUCKET)[0]["close"] == 7.0
+
+def test_fill_skips_older_disjoint_history():
+    ring = CandleRing(BUCKET, capacity=10)
+    ring.add_live(candle(10 * BUCKET))
+    ring.fill([candle(BUCKET)], BUCKET, 2 * BUCKET)
+    assert times(ring) == [10 * BUCKET]
+    assert (ring.lo, ring.hi) == (10 * BUCKET, 11 * BUCKET)
+
+def test_fill_beyond_capacity_keeps_the_newest():
+    ring = CandleRing(BUCKET, capacity=3)
+    ring.fill([candle(t * BUCKET) for t in range(6)], 0, 6 * BUCKET)
+    assert times(ring) == [3 * BUCKET, 4 * BUCKET, 5 * BUCKET]
+    assert (ring.lo, ring.hi) == (3 * BUCKET, 6 * BUCKET)
+
+def test_read_rebuilds_footprint_and_analytics():
+    fp = {"100.5": {"buy": 2.0, "sell": 1.0}, "100": {"buy": 0.5, "sell": 3.0}}
+    ring = CandleRing(BUCKET, capacity=3)
+    ring.add_live(candle(0, footprint=fp, max_delta=1.0, min_delta=-2.0, poc="100"))
+    out = ring.read(0, BUCKET)[0]
+    assert out["footprint"] == fp
+    assert list(out["footprint"]) == ["100", "100.5"]   # ascending price
+    assert (out["max_delta"], out["min_delta"], out["poc"]) == (1.0, -2.0, "100")
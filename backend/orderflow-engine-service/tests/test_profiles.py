@@ -0,0 +1,52 @@
+from binning import PRICE_SCALE
+from profiles import SessionData, volume_profile, tpo_profile
+
+START = 1_700_006_400   # a UTC day
+
+def candle(t, footprint, high, low):
+    return {"time": t, "high": high, "low": low, "footprint": footprint}
+
+def test_add_candles_sums_levels_across_candles():
+    session = SessionData(START)
+    session.add_candles([
+        candle(START, {"100": {"buy": 1.0, "sell": 2.0}, "100.5": {"buy": 0.5, "sell": 0.0}}, 100.5, 100),
+        candle(START + 60, {"100": {"buy": 3.0, "sell": 1.0}, "99.5": {"buy": 0.0, "sell": 4.0}}, 100, 99.5),
+    ])
+    units, buy, sell, periods, highs, lows = session.arrays()
+    assert units.tolist() == [round(p * PRICE_SCALE) for p in (99.5, 100, 100.5)]
+    assert buy.tolist() == [0.0, 4.0, 0.5]
+    assert sell.tolist() == [4.0, 3.0, 0.0]
+    assert (periods.tolist(), highs.tolist(), lows.tolist()) == ([0], [100.5], [99.5])
+    assert session.covered_until == START + 120
+
+def test_add_candles_skips_candles_already_merged():
+    session = SessionData(START)
+    first = candle(START, {"100": {"buy": 1.0, "sell": 0.0}}, 100, 100)
+    session.add_candles([first])
+    session.add_candles([first, candle(START + 60, {"100": {"buy": 2.0, "sell": 0.0}}, 100, 100)])
+    assert session.arrays()[1].tolist() == [3.0]
+
+def test_batch_and_one_by_one_give_the_same_session():
+    candles = [candle(START + i * 60, {str(100 + i % 3): {"buy": float(i), "sell": 1.0}}, 100 + i % 3, 100)
+               for i in range(90)]
+    batch = SessionData(START)
+    batch.add_candles(candles)
+    single = SessionData(START)
+    for c in candles:
+        single.add_candles([c])
+    for a, b in zip(batch.arrays(), single.arrays()):
+        assert a.tolist() == b.tolist()
+
+def test_rendered_profiles():
+    session = SessionData(START)
+    session.add_candles([
+        candle(START, {"100": {"buy": 5.0, "sell": 5.0}, "110": {"buy": 1.0, "sell": 0.0}}, 110, 100),
+        candle(START + 1800, {"100": {"buy": 2.0, "sell": 0.0}}, 100, 100),
+    ])
+    units, buy, sell, periods, highs, lows = session.arrays()
+    vp = volume_profile(units, buy, sell, 10, 0.7)
+    assert [(r["price"], r["vol"]) for r in vp["rows"]] == [(100.0, 12.0), (110.0, 1.0)]
+    assert vp["levels"]["poc"] == 100.0
+    tpo = tpo_profile(START, periods, highs, lows, 10, 0.7, 1)
+    assert tpo["rowCounts"] == {100.0: 2, 110.0: 1}
+    assert [b["letter"] for b in tpo["blocks"]] == ["A", "A", "B"]
@@ -0,0 +1,59 @@
+import threading
+import pytest
+import writer
+from writer import BatchWriter
+
+def drain(w):
+    items = []
+    while not w.queue.empty():
+        items.append(w.queue.get_nowait())
+    return items
+
+def test_unknown_drop_policy_is_rejected():
+    with pytest.raises(ValueError):
+        BatchWriter("test", lambda batch: True, drop_policy="drop_all")
+
+def test_drop_newest_rejects_the_new_item():
+    w = BatchWriter("test", lambda batch: True, max_queue=2, drop_policy="drop_newest")
+    assert [w.submit(i) for i in range(3)] == [True, True, False]
+    assert (w.enqueued, w.dropped) == (2, 1)
+    assert drain(w) == [0, 1]
+
+def test_drop_oldest_evicts_the_head():
+    w = BatchWriter("test", lambda batch: True, max_queue=2, drop_policy="drop_oldest")
+    assert [w.submit(i) for i in range(4)] == [True, True, True, True]
+    assert (w.enqueued, w.dropped) == (4, 2)
+    assert drain(w) == [2, 3]
+
+def test_block_drops_after_the_timeout():
+    w = BatchWriter("test", lambda batch: True, max_queue=1, drop_policy="block", block_timeout=0.01)
+    assert w.submit(0) is True
+    assert w.submit(1) is False
+    assert (w.enqueued, w.dropped) == (1, 1)
+
+def test_concurrent_submits_count_every_drop():
+    w = BatchWriter("test", lambda batch: True, max_queue=10, drop_policy="drop_oldest")
+    threads = [threading.Thread(target=lambda: [w.submit(i) for i in range(5000)]) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert w.enqueued == 40000
+    assert w.dropped == 40000 - w.depth()
+
+def test_flush_without_thread_writes_in_batches():
+    batches = []
+    w = BatchWriter("test", lambda batch: batches.append(list(batch)), batch_size=2, drop_policy="drop_newest")
+    for i in range(5):
+        w.submit(i)
+    assert w.flush() is True
+    assert batches == [[0, 1], [2, 3], [4]]
+    assert w.written == 5
+
+def test_failed_batches_are_counted(monkeypatch):
+    monkeypatch.setattr(writer, "WRITER_MAX_RETRIES", 1)
+    w = BatchWriter("test", lambda batch: False, drop_policy="drop_newest")
+    w.submit(0)
+    w.submit(1)
+    w.flush()
+    assert (w.written, w.failed) == (0, 2)
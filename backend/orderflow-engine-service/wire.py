@@ -0,0 +1,210 @@
+# Compact binary encoding for Rich Candles (opt-in, JSON stays the default).
+#
+# Layout v3, little-endian, columnar:
+#   header (68 bytes)  "<4sBBBBIIQqq24s4s"
+#       magic       4s   b"OFCB"
+#       version     u8   3
+#       flags       u8   bit0 = delta frame (levels are only the changed ones)
+#                        bit1 = analytics section present (candles carry poc/cvd/imbalances/stacked)
+#       decimals    u8   price scale, prices are integers of 10^-decimals (8)
+#       reserved    u8
+#       n_candles   u32
+#       n_levels    u32  total footprint levels over all candles
+#       seq         u64  live stream sequence number (0 for history)
+#       base_units  i64  lowest price in the payload, in 10^-decimals units
+#       tick_units  i64  price step, levels are base_units + offset * tick_units
+#       symbol      24s  ASCII, NUL padded (a client streaming every symbol tells frames apart by it)
+#       timeframe   4s   ASCII, NUL padded
+#   candles (column arrays of n_candles)
+#       time i64, open f64, high f64, low f64, close f64, volume f64, delta f64,
+#       max_delta f64, min_delta f64 (NaN = null), level_count u32
+#   levels (column arrays of n_levels, candle after candle, ascending price)
+#       offset i32, buy f64, sell f64
+#   analytics (flag bit1, see orderflow.py)
+#       per candle: cvd f64, poc i64 (price units, i64 min = null), ask_count u32, bid_count u32, stacked_count u32
+#       imbalance rows, candle after candle (asks then bids): price i64 (price units)
+#       stacked zones, candle after candle: side u8 (0 = ask, 1 = bid), low i64, high i64, rows u32
+#
+# Price keys are rebuilt on decode with binning.format_price_key, so a round trip
+# gives back the exact JSON candle shape.
+# Offsets must fit i32: a payload spanning more than 2^31 price steps raises WireRangeError,
+# callers send that payload as JSON instead.
+import struct
+import numpy as np
+from binning import format_price_key
+
+MAGIC = b"OFCB"
+VERSION = 3
+DECIMALS = 8
+HEADER = struct.Struct("<4sBBBBIIQqq24s4s")
+MAX_OFFSET = 2 ** 31 - 1
+FLAG_DELTA = 1
+FLAG_ANALYTICS = 2
+NULL_UNITS = np.iinfo(np.int64).min
+STACKED_SIDES = ("ask", "bid")
+
+MEDIA_TYPE = "application/x-orderflow-candles"
+
+CANDLE_FIELDS = ("open", "high", "low", "close", "volume", "delta")
+NULLABLE_FIELDS = ("max_delta", "min_delta")
+
+class WireRangeError(ValueError):
+    pass
+
+def _price_units(prices):
+    return np.rint(np.asarray(prices, dtype=np.float64) * 10 ** DECIMALS).astype(np.int64)
+
+# footprints: list of {price_key: {"buy", "sell"}} (one per candle)
+def encode_candles(candles, seq=0, delta=False, footprints=None, symbol="", timeframe=""):
+    n = len(candles)
+    if footprints is None:
+        footprints = [c.get("footprint") or {} for c in candles]
+
+    counts = np.fromiter((len(fp) for fp in footprints), dtype=np.uint32, count=n)
+    n_levels = int(counts.sum())
+
+    keys = [k for fp in footprints for k in fp]
+    units = _price_units([float(k) for k in keys]) if n_levels else np.empty(0, dtype=np.int64)
+    buys = np.fromiter((lvl["buy"] for fp in footprints for lvl in fp.values()), dtype=np.float64, count=n_levels)
+    sells = np.fromiter((lvl["sell"] for fp in footprints for lvl in fp.values()), dtype=np.float64, count=n_levels)
+
+    # Integer tick offsets from the lowest price (tick = gcd of all price distances)
+    base_units = int(units.min()) if n_levels else 0
+    rel = units - base_units
+    tick_units = int(np.gcd.reduce(rel)) if n_levels else 1
+    tick_units = tick_units or 1
+    offsets = rel // tick_units
+    if n_levels and int(offsets.max()) > MAX_OFFSET:
+        raise WireRangeError(f"Price levels span {int(offsets.max())} steps, more than the i32 offsets hold")
+    offsets = offsets.astype(np.int32)
+
+    # Each candle's levels sorted by price
+    if n_levels:
+        candle_idx = np.repeat(np.arange(n), counts)
+        order = np.lexsort((offsets, candle_idx))
+        offsets, buys, sells = offsets[order], buys[order], sells[order]
+
+    analytics = n > 0 and all("poc" in c for c in candles)
+    flags = (FLAG_DELTA if delta else 0) | (FLAG_ANALYTICS if analytics else 0)
+    header = HEADER.pack(MAGIC, VERSION, flags, DECIMALS, 0,
+                         n, n_levels, seq, base_units, tick_units,
+                         (symbol or "").encode("ascii"), (timeframe or "").encode("ascii"))
+    parts = [
+        header,
+        np.fromiter((c["time"] for c in candles), dtype="<i8", count=n).tobytes(),
+    ]
+    for field in CANDLE_FIELDS:
+        parts.append(np.fromiter((c[field] for c in candles), dtype="<f8", count=n).tobytes())
+    for field in NULLABLE_FIELDS:
+        parts.append(np.fromiter((_nullable(c.get(field)) for c in candles), dtype="<f8", count=n).tobytes())
+    parts += [
+        counts.astype("<u4").tobytes(),
+        offsets.astype("<i4").tobytes(),
+        buys.astype("<f8").tobytes(),
+        sells.astype("<f8").tobytes(),
+    ]
+    if analytics:
+        parts += _encode_analytics(candles)
+    return b"".join(parts)
+
+def _nullable(value):
+    return np.nan if value is None else value
+
+def _units_or_null(key):
+    return NULL_UNITS if key is None else int(_price_units([float(key)])[0])
+
+def _encode_analytics(candles):
+    n = len(candles)
+    imbalances = [c["imbalances"] for c in candles]
+    stacked = [z for c in candles for z in c["stacked"]]
+    rows = [k for imb in imbalances for k in imb["ask"] + imb["bid"]]
+    return [
+        np.fromiter((c["cvd"] for c in candles), dtype="<f8", count=n).tobytes(),
+        np.fromiter((_units_or_null(c["poc"]) for c in candles), dtype="<i8", count=n).tobytes(),
+        np.fromiter((len(imb["ask"]) for imb in imbalances), dtype="<u4", count=n).tobytes(),
+        np.fromiter((len(imb["bid"]) for imb in imbalances), dtype="<u4", count=n).tobytes(),
+        np.fromiter((len(c["stacked"]) for c in candles), dtype="<u4", count=n).tobytes(),
+        _price_units([float(k) for k in rows]).astype("<i8").tobytes() if rows else b"",
+        np.fromiter((STACKED_SIDES.index(z["side"]) for z in stacked), dtype="<u1", count=len(stacked)).tobytes(),
+        _price_units([float(z["low"]) for z in stacked]).astype("<i8").tobytes() if stacked else b"",
+        _price_units([float(z["high"]) for z in stacked]).astype("<i8").tobytes() if stacked else b"",
+        np.fromiter((z["rows"] for z in stacked), dtype="<u4", count=len(stacked)).tobytes(),
+    ]
+
+# Live stream frame (see processing.py) -> binary message
+def encode_frame(frame):
+    if frame["type"] == "snapshot":
+        return encode_candles([frame["candle"]], seq=frame["seq"], symbol=frame["symbol"], timeframe=frame["timeframe"])
+    return encode_candles([frame], seq=frame["seq"], delta=True, footprints=[frame["levels"]],
+                          symbol=frame["symbol"], timeframe=frame["timeframe"])
+
+# Inverse of encode_candles. Returns (candles, header dict).
+def decode_candles(data):
+    magic, version, flags, decimals, _, n, n_levels, seq, base_units, tick_units, symbol, timeframe = \
+        HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not an orderflow candle payload")
+
+    pos = HEADER.size
+    def take(dtype, count):
+        nonlocal pos
+        arr = np.frombuffer(data, dtype=dtype, count=count, offset=pos)
+        pos += arr.nbytes
+        return arr
+
+    times = take("<i8", n)
+    columns = {field: take("<f8", n) for field in CANDLE_FIELDS + NULLABLE_FIELDS}
+    counts = take("<u4", n)
+    offsets = take("<i4", n_levels)
+    buys = take("<f8", n_levels).tolist()
+    sells = take("<f8", n_levels).tolist()
+
+    prices = (base_units + offsets.astype(np.int64) * tick_units) / 10 ** decimals
+    labels = [format_price_key(p) for p in prices.tolist()]
+
+    def label(units):
+        return None if units == NULL_UNITS else format_price_key(units / 10 ** decimals)
+
+    if flags & FLAG_ANALYTICS:
+        cvd = take("<f8", n).tolist()
+        poc = take("<i8", n).tolist()
+        n_ask = take("<u4", n).tolist()
+        n_bid = take("<u4", n).tolist()
+        n_stacked = take("<u4", n).tolist()
+        rows = [label(u) for u in take("<i8", sum(n_ask) + sum(n_bid)).tolist()]
+        m = sum(n_stacked)
+        sides = take("<u1", m).tolist()
+        lows = take("<i8", m).tolist()
+        highs = take("<i8", m).tolist()
+        zone_rows = take("<u4", m).tolist()
+        zones = [{"side": STACKED_SIDES[s], "low": label(lo), "high": label(hi), "rows": r}
+                 for s, lo, hi, r in zip(sides, lows, highs, zone_rows)]
+
+    candles = []
+    j = r = z = 0
+    for i in range(n):
+        footprint = {}
+        for _ in range(int(counts[i])):
+            footprint[labels[j]] = {"buy": buys[j], "sell": sells[j]}
+            j += 1
+        candle = {"time": int(times[i])}
+        for field in CANDLE_FIELDS:
+            candle[field] = float(columns[field][i])
+        for field in NULLABLE_FIELDS:
+            value = float(columns[field][i])
+            candle[field] = None if np.isnan(value) else value
+        candle["footprint"] = footprint
+        if flags & FLAG_ANALYTICS:
+            candle["cvd"] = cvd[i]
+            candle["poc"] = label(poc[i])
+            asks = rows[r:r + n_ask[i]]
+            r += n_ask[i]
+            bids = rows[r:r + n_bid[i]]
+            r += n_bid[i]
+            candle["imbalances"] = {"ask": asks, "bid": bids}
+            candle["stacked"] = zones[z:z + n_stacked[i]]
+            z += n_stacked[i]
+        candles.append(candle)
+
+    return candles, {"delta": bool(flags & FLAG_DELTA), "seq": seq,
+                     "symbol": symbol.rstrip(b"\0").decode("ascii"), "timeframe": timeframe.rstrip(b"\0").decode("ascii")}
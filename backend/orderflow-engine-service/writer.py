@@ -0,0 +1,192 @@
+# Background persistence stage.
+# The websocket thread only enqueues items; a writer thread drains a bounded queue
+# and flushes to the DB by size or by time, whichever comes first.
+import os
+import queue
+import threading
+import time
+import metrics
+
+WRITER_BATCH_SIZE = int(os.getenv("WRITER_BATCH_SIZE", "500"))
+WRITER_FLUSH_INTERVAL = float(os.getenv("WRITER_FLUSH_INTERVAL", "1.0"))   # seconds
+WRITER_QUEUE_SIZE = int(os.getenv("WRITER_QUEUE_SIZE", "100000"))
+# What happens when the queue is full:
+#   block       -> wait up to WRITER_BLOCK_TIMEOUT for room, then drop the new item
+#   drop_newest -> drop the new item immediately
+#   drop_oldest -> evict the oldest queued item to make room
+WRITER_DROP_POLICY = os.getenv("WRITER_DROP_POLICY", "block")
+WRITER_BLOCK_TIMEOUT = float(os.getenv("WRITER_BLOCK_TIMEOUT", "2.0"))
+WRITER_MAX_RETRIES = int(os.getenv("WRITER_MAX_RETRIES", "3"))
+
+DROP_POLICIES = ("block", "drop_newest", "drop_oldest")
+
+class BatchWriter:
+    def __init__(self, name, save_fn, batch_size=WRITER_BATCH_SIZE, flush_interval=WRITER_FLUSH_INTERVAL,
+                 max_queue=WRITER_QUEUE_SIZE, drop_policy=WRITER_DROP_POLICY, block_timeout=WRITER_BLOCK_TIMEOUT):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy '{drop_policy}' (expected one of {DROP_POLICIES})")
+
+        self.name = name
+        self.save_fn = save_fn # Called with a list of items. Falsy return / exception = failed
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self.block_timeout = block_timeout
+        self.queue = queue.Queue(maxsize=max_queue)
+
+        self.thread = None
+        self.lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._flushed = threading.Event()
+        self._stopping = False
+
+        # Stats
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def start(self):
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return
+            self._stopping = False
+            self.thread = threading.Thread(target=self._run, name=f"{self.name}-writer")
+            self.thread.daemon = True
+            self.thread.start()
+
+    # Non-blocking for every policy except "block". Returns False if the item was dropped.
+    # Any number of threads may submit: the counters are updated under the lock.
+    def submit(self, item):
+        try:
+            if self.drop_policy == "block":
+                self.queue.put(item, timeout=self.block_timeout)
+            elif self.drop_policy == "drop_newest":
+                self.queue.put_nowait(item)
+            else:
+                while True:
+                    try:
+                        self.queue.put_nowait(item)
+                        break
+                    except queue.Full:
+                        try:
+                            self.queue.get_nowait()
+                            self._count_drop()
+                        except queue.Empty:
+                            pass
+        except queue.Full:
+            self._count_drop()
+            return False
+
+        with self.lock:
+            self.enqueued += 1
+        return True
+
+    def _count_drop(self):
+        with self.lock:
+            self.dropped += 1
+
+    # Blocks until everything queued so far is written (or timeout).
+    def flush(self, timeout=30):
+        if not self.thread or not self.thread.is_alive():
+            self._drain_and_write() # No writer thread: write inline
+            return True
+        self._flushed.clear()
+        self._flush_requested.set()
+        return self._flushed.wait(timeout)
+
+    def stop(self, timeout=30):
+        ok = self.flush(timeout)
+        self._stopping = True
+        if self.thread:
+            self.thread.join(timeout=1)
+        return ok
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_max": self.queue.maxsize,
+            "drop_policy": self.drop_policy,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+            "flushes": self.flushes,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self.total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+        }
+
+    def _write(self, batch):
+        if not batch: return
+
+        t0 = time.perf_counter()
+        ok = False
+        for attempt in range(WRITER_MAX_RETRIES):
+            try:
+                if self.save_fn(batch) is not False:
+                    ok = True
+                    break
+            except Exception as e:
+                print(f"⚠️ {self.name} writer error (attempt {attempt + 1}): {e}")
+            if attempt < WRITER_MAX_RETRIES - 1:
+                time.sleep(min(0.5 * 2 ** attempt, 5)) # Backoff, queue absorbs the burst meanwhile
+
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        metrics.writer_flush_seconds.observe(elapsed_ms / 1000, self.name)
+        self.flushes += 1
+        self.last_flush_ms = elapsed_ms
+        self.total_flush_ms += elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        if ok:
+            self.written += len(batch)
+        else:
+            self.failed += len(batch)
+            print(f"❌ {self.name} writer gave up on {len(batch)} items")
+
+    def _drain_and_write(self, batch=None):
+        batch = batch or []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+        self._write(batch)
+
+    def _run(self):
+        batch = []
+        last_flush = time.monotonic()
+
+        while True:
+            remaining = self.flush_interval - (time.monotonic() - last_flush)
+            try:
+                # Wake up at least every 100ms to notice flush/stop requests
+                batch.append(self.queue.get(timeout=max(0.001, min(remaining, 0.1))))
+            except queue.Empty:
+                pass
+
+            if self._flush_requested.is_set():
+                self._drain_and_write(batch)
+                batch = []
+                last_flush = time.monotonic()
+                self._flush_requested.clear()
+                self._flushed.set()
+            elif len(batch) >= self.batch_size or (batch and time.monotonic() - last_flush >= self.flush_interval):
+                self._write(batch)
+                batch = []
+                last_flush = time.monotonic()
+            elif not batch:
+                last_flush = time.monotonic()
+
+            if self._stopping and not batch and self.queue.empty():
+                break
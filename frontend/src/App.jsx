@@ -187,7 +187,7 @@ function App() {
 
     try {
       if (newMode) {
-        await axios.post("http://localhost:8000/ingest/start");
+        await axios.post(`http://localhost:8000/ingest/start?symbol=${selectedAsset}`);
         console.log("Pro Mode: Ingestor Started");
       }
       else {
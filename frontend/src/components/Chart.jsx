@@ -238,6 +238,23 @@ const Chart = ({
         );
     };
 
+    // candles filled in by the server's background sync (sent once the download finished) ///////
+    const handleHistory = (msg) => {
+        if (msg.timeframe !== timeframe || !msg.candles || msg.candles.length === 0) return;
+
+        // Keep the live (last) candle, the websocket stream is newer than the pushed one
+        const current = candlesRef.current;
+        const live = current.length > 0 ? current[current.length - 1] : null;
+        const byTime = new Map();
+        msg.candles.forEach(c => { if (!live || c.time < live.time) byTime.set(c.time, c); });
+        current.forEach(c => { if (!byTime.has(c.time) || c === live) byTime.set(c.time, c); });
+        const merged = Array.from(byTime.values()).sort((a, b) => a.time - b.time);
+
+        candlesRef.current = merged;
+        priceSeriesRef.current.setData(merged);
+        setIndicatorsData(seriesMapRef.current, indicatorsRef.current, merged);
+    };
+
     // load history + open websocket when symbol/timeframe change //////////////////////////////
     const getFootprintDiff = (prevFp, currFp) => {
         const diff = {};
@@ -348,7 +365,7 @@ const Chart = ({
         if (isProMode) {
             console.log("Connecting to Orderflow Engine (Server B)...");
             historyUrl = `http://localhost:8000/history/footprint?symbol=${selectedAsset}&timeframe=${timeframe}`;
-            wsUrl = "ws://localhost:8000/ws";
+            wsUrl = `ws://localhost:8000/ws?symbol=${selectedAsset}&timeframe=${timeframe}`;
         } else {
             console.log("Connecting to Standard Proxy (Server A)...");
             historyUrl = `http://localhost:3001/history/${selectedAsset}/${timeframe}`;
@@ -399,7 +416,11 @@ const Chart = ({
         }
         wsRef.current = new WebSocket(wsUrl);
         wsRef.current.onopen = () => console.log(`Connected to ${isProMode ? "PRO" : "LITE"} stream`);
-        wsRef.current.onmessage = (evt) => handleRealtime(JSON.parse(evt.data));
+        wsRef.current.onmessage = (evt) => {
+            const msg = JSON.parse(evt.data);
+            if (msg.type === "history") handleHistory(msg);
+            else handleRealtime(msg);
+        };
         wsRef.current.onerror = (e) => console.warn("WS error", e);
         
         return () => {